@@ -765,12 +765,21 @@ WITH RATE LIMIT HANDLING
 """
 
 import os
+import threading
 import time
 from datetime import datetime
-from google import genai
-from google.genai import types
-from google.genai.errors import ClientError
 from dotenv import load_dotenv
+from config import settings
+from metrics import llm_latency, llm_routes, llm_wait, llm_waits
+import tracing
+from llm_usage import answered_by, token_counts, usage_recorder
+from wound_cache import wound_cache
+from guidance import guidance_store, guidance_key
+from routing import model_router
+from hedging import hedger
+from triage_model import triage_classifier
+import deadlines
+from deadlines import DeadlineExceeded
 
 # Load environment variables
 load_dotenv()
@@ -781,35 +790,122 @@ class NurseAgent:
     def __init__(self):
         """Initialize the agent with Gemini API"""
         api_key = os.getenv('GEMINI_API_KEY')
-        if not api_key:
+        if not api_key and settings.LLM_BACKEND != 'fake':
             raise ValueError("GEMINI_API_KEY not found in .env file")
         
-        self.client = genai.Client(api_key=api_key)
-        # Using most stable free model
-        self.model = 'gemini-1.5-flash'
+        self.api_key = api_key
+        self.backend = settings.LLM_BACKEND
+        # Gemini SDK is imported and its client built on first use (slow import)
+        self._client = None
+        self._client_lock = threading.Lock()
+        # Default model; each call is routed per capability (see routing.py)
+        self.model = model_router.tiers['fast'][0]
         self.patient_data = {}
         self.request_count = 0
+        # Start (then end) of the last provider request; primary and hedge requests both
+        # wait LLM_MIN_INTERVAL_SECONDS after it
         self.last_request_time = 0
+        self._spacing_lock = threading.Lock()
     
-    def _safe_api_call(self, prompt, max_retries=3):
+    @property
+    def client(self):
+        """Gemini client, created on first use"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    if self.backend == 'fake':
+                        from fakes import FakeGeminiClient, FaultProfile
+                        self._client = FakeGeminiClient(
+                            FaultProfile.parse(settings.FAKE_LLM_PROFILE),
+                            FakeGeminiClient.parse_model_profiles(settings.FAKE_LLM_MODEL_PROFILES)
+                        )
+                        print("🧪 Using fake Gemini backend")
+                    else:
+                        from google import genai
+                        self._client = genai.Client(api_key=self.api_key)
+        return self._client
+    
+    def warm_up(self):
+        """Build the Gemini client ahead of the first request (e.g. in a background thread)"""
+        try:
+            self.client
+        except Exception as e:
+            print(f"⚠️ Gemini client warm-up failed: {e}")
+    
+    def _safe_api_call(self, prompt, max_retries=3, capability='other', cache_status='none'):
         """
         Make API call with retry logic for rate limits
+        Args:
+            capability: calling method; picks the model tier (see routing.py) and labels
+                        metrics, spans and usage rows
+            cache_status: recorded on the usage row ('miss' when a cache lookup preceded the call)
+        Raises:
+            DeadlineExceeded: the request's time budget can't cover the call (see deadlines.py)
         """
+        usage = {'status': 'error', 'latency_ms': 0.0, 'wait_ms': 0.0, 'retries': 0,
+                 'prompt_tokens': None, 'output_tokens': None, 'model': None, 'route': None}
+        try:
+            return self._call_with_retries(prompt, max_retries, capability, usage)
+        except DeadlineExceeded:
+            usage['status'] = 'deadline_exceeded'
+            raise
+        finally:
+            usage_recorder.record(capability, usage.pop('model'), cache_status=cache_status, **usage)
+    
+    def _call_with_retries(self, prompt, max_retries, capability, usage):
+        """Retry loop of _safe_api_call; fills `usage` as it goes"""
+        client = self.client
+        from google.genai.errors import ClientError, ServerError
+        
+        # Models in try order: a 429 or provider error moves on to the next one right away
+        models, route = model_router.route(capability)
+        candidate = 0
+        
         for attempt in range(max_retries):
+            model = models[candidate]
+            usage['model'], usage['route'] = model, route
             try:
-                # Add delay between requests (minimum 5 seconds)
-                current_time = time.time()
-                time_since_last = current_time - self.last_request_time
-                if time_since_last < 5:
-                    wait_time = 5 - time_since_last
+                # Add delay between requests (minimum LLM_MIN_INTERVAL_SECONDS, default 5)
+                wait_time = self._spacing_wait()
+                # Within a request budget (see deadlines.py): don't start what can't finish in time
+                deadlines.check(wait_time + self._expected_seconds(model), f"{capability} on {model}")
+                if wait_time > 0:
                     print(f"⏳ Waiting {wait_time:.1f}s to avoid rate limit...")
-                    time.sleep(wait_time)
+                    with tracing.span('llm.wait.spacing', capability=capability, wait_seconds=wait_time):
+                        time.sleep(wait_time)
+                    usage['wait_ms'] += wait_time * 1000
+                    llm_wait.inc('spacing', amount=wait_time)
+                    llm_waits.inc('spacing')
+                with self._spacing_lock:
+                    self.last_request_time = time.time()
                 
-                # Make API call
-                response = self.client.models.generate_content(
-                    model=self.model,
-                    contents=prompt
-                )
+                # Make API call (hedged for LLM_HEDGE_CAPABILITIES, see hedging.py)
+                started = time.perf_counter()
+                try:
+                    if hedger.enabled_for(capability):
+                        response, model = deadlines.run_within(lambda: hedger.call(
+                            capability,
+                            lambda m, is_hedge: self._generate(client, m, prompt, capability, attempt,
+                                                               'hedge' if is_hedge else route),
+                            models[candidate:],
+                            admit=lambda: self._admit_hedge(usage)
+                        ), f"{capability} on {model}")
+                        usage['model'] = model
+                    else:
+                        response = deadlines.run_within(
+                            lambda: self._generate(client, model, prompt, capability, attempt, route),
+                            f"{capability} on {model}"
+                        )
+                except ClientError as e:
+                    usage['status'] = 'rate_limited' if '429' in str(e) else 'error'
+                    usage['latency_ms'] += (time.perf_counter() - started) * 1000
+                    raise
+                except Exception:
+                    usage['latency_ms'] += (time.perf_counter() - started) * 1000
+                    raise
+                usage['latency_ms'] += (time.perf_counter() - started) * 1000
+                usage['prompt_tokens'], usage['output_tokens'] = token_counts(response)
+                usage['status'] = 'success'
                 
                 self.last_request_time = time.time()
                 self.request_count += 1
@@ -817,10 +913,21 @@ class NurseAgent:
                 
             except ClientError as e:
                 if '429' in str(e):  # Rate limit error
-                    if attempt < max_retries - 1:
-                        wait_time = 60 * (attempt + 1)  # 60s, 120s, 180s
+                    if attempt < max_retries - 1 and candidate + 1 < len(models):
+                        candidate += 1
+                        route = 'fallback_rate_limited'
+                        usage['retries'] += 1
+                        print(f"↪️ {model} rate limited, falling back to {models[candidate]}")
+                    elif attempt < max_retries - 1:
+                        wait_time = settings.LLM_RATE_LIMIT_BACKOFF_SECONDS * (attempt + 1)  # 60s, 120s, 180s
+                        deadlines.check(wait_time + self._expected_seconds(model), f"{capability} 429 backoff")
                         print(f"⚠️ Rate limit hit. Waiting {wait_time}s... (Attempt {attempt + 1}/{max_retries})")
-                        time.sleep(wait_time)
+                        with tracing.span('llm.wait.backoff', capability=capability, wait_seconds=wait_time):
+                            time.sleep(wait_time)
+                        usage['wait_ms'] += wait_time * 1000
+                        usage['retries'] += 1
+                        llm_wait.inc('backoff', amount=wait_time)
+                        llm_waits.inc('backoff')
                     else:
                         print("❌ Rate limit exceeded. Solutions:")
                         print("   1. Wait 1 hour and try again")
@@ -829,20 +936,93 @@ class NurseAgent:
                         raise
                 else:
                     raise
+            except ServerError as e:
+                # Overloaded / unavailable: another model may be fine
+                if attempt < max_retries - 1 and candidate + 1 < len(models):
+                    candidate += 1
+                    route = 'fallback_error'
+                    usage['retries'] += 1
+                    print(f"↪️ {model} failed ({e.code}), falling back to {models[candidate]}")
+                else:
+                    print(f"❌ Error: {str(e)}")
+                    raise
+            except DeadlineExceeded:
+                raise
             except Exception as e:
                 print(f"❌ Error: {str(e)}")
                 raise
         
         return None
     
+    def _spacing_wait(self):
+        """Seconds until LLM_MIN_INTERVAL_SECONDS have passed since the last provider request"""
+        return max(0.0, settings.LLM_MIN_INTERVAL_SECONDS - (time.time() - self.last_request_time))
+    
+    def _admit_hedge(self, usage):
+        """
+        Hedge gate (see hedging.py): the same spacing as a primary request, and a
+        sent hedge is charged to the daily quota as a retry on the usage row
+        Returns:
+            0 when the hedge may go now (reserved), else seconds to hold it
+        """
+        with self._spacing_lock:
+            wait_time = self._spacing_wait()
+            if wait_time > 0:
+                return wait_time
+            self.last_request_time = time.time()
+            usage['retries'] += 1
+            return 0.0
+    
+    def _expected_seconds(self, model):
+        """Time to budget for one call: the model's recent latency, or LLM_DEADLINE_MIN_CALL_SECONDS"""
+        return max(model_router.expected_seconds(model) or 0.0, settings.LLM_DEADLINE_MIN_CALL_SECONDS)
+    
+    def _generate(self, client, model, prompt, capability, attempt, route):
+        """One generate_content call: span, latency metric and model health"""
+        from google.genai.errors import ClientError
+        
+        llm_routes.inc(capability, model, route)
+        started = time.perf_counter()
+        try:
+            with tracing.span('llm.generate', tracing.KIND_CLIENT, capability=capability,
+                              model=model, route=route, attempt=attempt + 1):
+                response = client.models.generate_content(
+                    model=model,
+                    contents=prompt
+                )
+        except ClientError as e:
+            elapsed = time.perf_counter() - started
+            outcome = 'rate_limited' if '429' in str(e) else 'error'
+            llm_latency.observe(elapsed, capability, model, outcome)
+            model_router.observe(model, elapsed, outcome)
+            raise
+        except Exception:
+            elapsed = time.perf_counter() - started
+            llm_latency.observe(elapsed, capability, model, 'error')
+            model_router.observe(model, elapsed, 'error')
+            raise
+        elapsed = time.perf_counter() - started
+        llm_latency.observe(elapsed, capability, model, 'success')
+        model_router.observe(model, elapsed, 'success')
+        if hedger.enabled_for(capability):
+            hedger.observe(capability, elapsed)
+        return response
+    
     def analyze_vitals(self, vitals):
         """
         Analyze patient vitals and determine emergency level
         Args:
             vitals: dict with hr, bp, temp
         Returns:
-            dict with analysis results
+            dict with analysis results (source 'local_model' when the local
+            triage classifier was confident enough to answer; see triage_model.py)
         """
+        local = triage_classifier.answer(vitals)
+        if local:
+            usage_recorder.record('analyze_vitals', f"local-triage/{local['model_version']}", 'success',
+                                  cache_status='hit', route='local')
+            return local
+        
         prompt = f"""
 You are an expert nurse. Analyze these patient vitals:
 
@@ -861,7 +1041,7 @@ REASON: [your reasoning]
 ACTION: [recommended action]
 """
         
-        response_text = self._safe_api_call(prompt)
+        response_text = self._safe_api_call(prompt, capability='analyze_vitals')
         if response_text:
             return self._parse_vitals_response(response_text)
         return {'level': 'UNKNOWN', 'reason': 'API call failed', 'action': 'Manual assessment required'}
@@ -905,7 +1085,7 @@ SPECIALIST: [doctor type]
 REASON: [why this specialist]
 """
         
-        response_text = self._safe_api_call(prompt)
+        response_text = self._safe_api_call(prompt, capability='recommend_doctor')
         if response_text:
             return self._parse_doctor_response(response_text)
         return {'specialist': 'General Physician', 'reason': 'Default recommendation'}
@@ -932,8 +1112,17 @@ REASON: [why this specialist]
         Args:
             wound_description: description of wound
         Returns:
-            dict with wound assessment and care steps
+            dict with wound assessment and care steps, plus 'cache':
+            {'status': 'hit', 'score', 'entry_id'} when a near-identical
+            description was assessed before, else {'status': 'miss'}
         """
+        if wound_cache.enabled:
+            match = wound_cache.lookup(wound_description)
+            if match:
+                usage_recorder.record('assess_wound', None, 'success', cache_status='hit')
+                return {**match['result'], 'cache': {'status': 'hit', 'score': match['score'],
+                                                     'entry_id': match['entry_id']}}
+        
         prompt = f"""
 Wound description: {wound_description}
 
@@ -948,9 +1137,15 @@ CARE: [dressing or stitching]
 STEPS: [step 1; step 2; step 3]
 """
         
-        response_text = self._safe_api_call(prompt)
+        with answered_by() as models:
+            response_text = self._safe_api_call(prompt, capability='assess_wound',
+                                                cache_status='miss' if wound_cache.enabled else 'none')
         if response_text:
-            return self._parse_wound_response(response_text)
+            result = self._parse_wound_response(response_text)
+            if wound_cache.enabled:
+                # The model that actually answered (a fallback or hedge, not necessarily the primary)
+                wound_cache.store(wound_description, result, models[-1] if models else None)
+            return {**result, 'cache': {'status': 'miss'}}
         return {'severity': 'MODERATE', 'care_type': 'dressing', 'steps': ['Clean wound', 'Apply sterile dressing', 'Monitor for infection']}
     
     def _parse_wound_response(self, text):
@@ -973,15 +1168,8 @@ STEPS: [step 1; step 2; step 3]
         
         return result
     
-    def guide_iv_procedure(self, procedure_type):
-        """
-        Provide guidance for IV/Injection procedures
-        Args:
-            procedure_type: 'IV', 'Injection', or 'Drip'
-        Returns:
-            dict with procedure guidance
-        """
-        prompt = f"""
+    def _iv_prompt(self, procedure_type):
+        return f"""
 Provide simple {procedure_type} procedure guidance for a nurse.
 
 Give 4 key steps in this format:
@@ -990,8 +1178,24 @@ STEP2: [step]
 STEP3: [step]
 STEP4: [step]
 """
-        
-        response_text = self._safe_api_call(prompt)
+    
+    def guide_iv_procedure(self, procedure_type, use_precomputed=True):
+        """
+        Provide guidance for IV/Injection procedures
+        Args:
+            procedure_type: 'IV', 'Injection', or 'Drip'
+            use_precomputed: serve a precomputed answer when one exists (see guidance.py)
+        Returns:
+            dict with procedure guidance
+        """
+        if use_precomputed:
+            stored = guidance_store.get('guide_iv_procedure', guidance_key('guide_iv_procedure', procedure_type))
+            if stored:
+                usage_recorder.record('guide_iv_procedure', None, 'success', cache_status='hit')
+                return {**stored, 'procedure': procedure_type}
+        
+        prompt = self._iv_prompt(procedure_type)
+        response_text = self._safe_api_call(prompt, capability='guide_iv_procedure')
         if not response_text:
             return {'procedure': procedure_type, 'steps': ['Prepare equipment', 'Follow sterile technique', 'Administer as prescribed', 'Monitor patient']}
         
@@ -1027,7 +1231,7 @@ REMINDER1: [text]
 REMINDER2: [text]
 """
         
-        response_text = self._safe_api_call(prompt)
+        response_text = self._safe_api_call(prompt, capability='track_patient')
         reminders = []
         
         if response_text:
@@ -1044,18 +1248,10 @@ REMINDER2: [text]
             'reminders': reminders
         }
     
-    def generate_diet_plan(self, diagnosis, allergies):
-        """
-        Generate dietary recommendations
-        Args:
-            diagnosis: patient condition
-            allergies: list of allergies
-        Returns:
-            dict with diet recommendations
-        """
+    def _diet_prompt(self, diagnosis, allergies):
         allergies_text = ', '.join(allergies) if allergies else 'None'
         
-        prompt = f"""
+        return f"""
 Diagnosis: {diagnosis}
 Allergies: {allergies_text}
 
@@ -1066,8 +1262,25 @@ DIET1: [recommendation]
 DIET2: [recommendation]
 DIET3: [recommendation]
 """
-        
-        response_text = self._safe_api_call(prompt)
+    
+    def generate_diet_plan(self, diagnosis, allergies, use_precomputed=True):
+        """
+        Generate dietary recommendations
+        Args:
+            diagnosis: patient condition
+            allergies: list of allergies
+            use_precomputed: serve a precomputed answer when one exists (see guidance.py)
+        Returns:
+            dict with diet recommendations
+        """
+        if use_precomputed:
+            stored = guidance_store.get('generate_diet_plan', guidance_key('generate_diet_plan', diagnosis, allergies))
+            if stored:
+                usage_recorder.record('generate_diet_plan', None, 'success', cache_status='hit')
+                return stored
+        
+        prompt = self._diet_prompt(diagnosis, allergies)
+        response_text = self._safe_api_call(prompt, capability='generate_diet_plan')
         recommendations = []
         
         if response_text:
@@ -1080,16 +1293,8 @@ DIET3: [recommendation]
         
         return {'recommendations': recommendations}
     
-    def create_exercise_plan(self, diagnosis, age):
-        """
-        Create exercise/physiotherapy schedule
-        Args:
-            diagnosis: patient condition
-            age: patient age
-        Returns:
-            dict with exercise plan
-        """
-        prompt = f"""
+    def _exercise_prompt(self, diagnosis, age):
+        return f"""
 Patient: {age} years old with {diagnosis}
 
 Create a simple daily exercise/physiotherapy schedule (3 activities, max 2 lines each).
@@ -1099,8 +1304,25 @@ ACTIVITY1: [time] - [activity description]
 ACTIVITY2: [time] - [activity description]
 ACTIVITY3: [time] - [activity description]
 """
-        
-        response_text = self._safe_api_call(prompt)
+    
+    def create_exercise_plan(self, diagnosis, age, use_precomputed=True):
+        """
+        Create exercise/physiotherapy schedule
+        Args:
+            diagnosis: patient condition
+            age: patient age
+            use_precomputed: serve a precomputed answer for the age band when one exists (see guidance.py)
+        Returns:
+            dict with exercise plan
+        """
+        if use_precomputed:
+            stored = guidance_store.get('create_exercise_plan', guidance_key('create_exercise_plan', diagnosis, age))
+            if stored:
+                usage_recorder.record('create_exercise_plan', None, 'success', cache_status='hit')
+                return stored
+        
+        prompt = self._exercise_prompt(diagnosis, age)
+        response_text = self._safe_api_call(prompt, capability='create_exercise_plan')
         activities = []
         
         if response_text:
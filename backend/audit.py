@@ -0,0 +1,82 @@
+"""
+Audit Log Service - Write-behind appender
+Audit rows are queued and bulk inserted in batches instead of
+committing one extra transaction per request
+"""
+
+from datetime import datetime
+from typing import List, Optional
+
+from config import settings
+from database import SessionLocal
+from audit_partitions import audit_partitions
+from write_behind import WriteBehindLog
+
+
+def _insert_audit_rows(rows: List[dict]):
+    """Bulk insert a batch of audit rows (into their monthly partitions) in one transaction"""
+    db = SessionLocal()
+    try:
+        audit_partitions.insert_rows(db, rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+class AuditLogger:
+    """Append-only audit trail backed by a write-behind log"""
+
+    def __init__(self):
+        """Initialize audit logger"""
+        self.writer = WriteBehindLog(
+            name='audit',
+            flush_fn=_insert_audit_rows,
+            segment_dir=settings.AUDIT_SEGMENT_DIR,
+            batch_size=settings.AUDIT_BATCH_SIZE,
+            flush_interval=settings.AUDIT_FLUSH_INTERVAL_SECONDS,
+            max_queue=settings.AUDIT_MAX_QUEUE,
+            fsync=settings.AUDIT_SEGMENT_FSYNC,
+            datetime_fields=('timestamp',)
+        )
+
+    def log(self, action: str, description: str, user: Optional[str] = None,
+            patient_id: Optional[str] = None):
+        """
+        Record an audit event
+        Args:
+            action: event code, e.g. PATIENT_REGISTERED
+            description: human readable description
+            user: who performed the action
+            patient_id: affected patient (optional)
+        """
+        # Timestamp is taken now, not when the batch is written
+        self.writer.append(
+            patient_id=patient_id,
+            action=action,
+            description=description,
+            user=user,
+            timestamp=datetime.utcnow()
+        )
+
+    def flush(self) -> int:
+        """Write all queued audit rows now"""
+        return self.writer.flush()
+
+    def start(self):
+        """Recover leftover segments and start background flushing"""
+        self.writer.start()
+
+    def stop(self):
+        """Flush remaining rows and stop background flushing"""
+        self.writer.stop()
+
+    def stats(self) -> dict:
+        """Queue depth and flush latency metrics"""
+        return self.writer.stats()
+
+
+# Global instance
+audit_logger = AuditLogger()
@@ -0,0 +1,443 @@
+"""
+Audit Log Partitioning - Monthly partitions with retention
+Native range partitions on PostgreSQL, rotated monthly tables on
+SQLite, both queried through the audit_logs_all union view
+
+Rotated tables each number their rows from 1, so ids read back through
+recent() and the view are global: YYYYMM * ID_STRIDE + the table's own id.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import (MetaData, Table, Column, Integer, String, DateTime, Text,
+                        Index, inspect, insert, select, delete, text)
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from config import settings
+from database import engine, SessionLocal
+from models import AuditLog
+from export import iter_table_rows, encode_stream
+
+PARENT_TABLE = 'audit_logs'
+VIEW_NAME = 'audit_logs_all'
+PARTITION_PATTERN = re.compile(r'^audit_logs_(\d{4})_(\d{2})$')
+
+AUDIT_COLUMNS = ['id', 'patient_id', 'action', 'description', 'user', 'timestamp']
+
+# Rotated partitions: global id = YYYYMM * ID_STRIDE + per-table id
+ID_STRIDE = 10 ** 10
+
+# PostgreSQL parent table. The partition key must be part of the primary key.
+NATIVE_PARENT_DDL = """
+CREATE TABLE audit_logs (
+    id SERIAL,
+    patient_id VARCHAR(50),
+    action VARCHAR(100) NOT NULL,
+    description TEXT,
+    "user" VARCHAR(100),
+    "timestamp" TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+    PRIMARY KEY (id, "timestamp")
+) PARTITION BY RANGE ("timestamp")
+"""
+
+NATIVE_PARENT_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS ix_audit_logs_timestamp ON audit_logs ("timestamp")',
+    'CREATE INDEX IF NOT EXISTS ix_audit_logs_patient_id ON audit_logs (patient_id, "timestamp")',
+    'CREATE TABLE IF NOT EXISTS audit_logs_default PARTITION OF audit_logs DEFAULT',
+]
+
+
+def month_start(dt: datetime) -> datetime:
+    """First instant of dt's month"""
+    return datetime(dt.year, dt.month, 1)
+
+
+def add_months(dt: datetime, months: int) -> datetime:
+    """Shift a month start by a number of months"""
+    index = dt.year * 12 + (dt.month - 1) + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(year: int, month: int) -> str:
+    """Table name for a monthly partition"""
+    return f"{PARENT_TABLE}_{year:04d}_{month:02d}"
+
+
+def global_id(key: Tuple[int, int], local_id: int) -> int:
+    """Id of a rotated partition row, unique across partitions"""
+    return (key[0] * 100 + key[1]) * ID_STRIDE + local_id
+
+
+def _row_to_dict(row, key: Optional[Tuple[int, int]] = None) -> dict:
+    """Same shape as AuditLog.to_dict() (id made global for rows of partition `key`)"""
+    data = dict(row)
+    if key is not None:
+        data['id'] = global_id(key, data['id'])
+    if data.get('timestamp'):
+        data['timestamp'] = data['timestamp'].isoformat()
+    return data
+
+
+class AuditPartitionManager:
+    """Create, query, archive and drop monthly audit log partitions"""
+
+    def __init__(self, engine):
+        """Initialize partition manager"""
+        self.engine = engine
+        self.dialect = engine.dialect.name
+        self.mode = None  # 'native' (PostgreSQL partitions) or 'rotated' (monthly tables)
+        self._known = set()  # (year, month) partitions that exist
+        self._discovered = 0.0  # when _known was last read from the catalog
+        self._lock = threading.Lock()
+        self._metadata = MetaData()
+
+    # ----------------------------------------
+    # Setup
+    # ----------------------------------------
+
+    def create_parent(self):
+        """Create the partitioned parent on PostgreSQL (run before create_all)"""
+        if self.dialect != 'postgresql':
+            return
+        with self.engine.begin() as conn:
+            if conn.execute(text("SELECT to_regclass('audit_logs')")).scalar() is None:
+                conn.execute(text(NATIVE_PARENT_DDL))
+
+    def setup(self):
+        """Detect mode, make sure upcoming partitions exist and build the view"""
+        self.mode = self._detect_mode()
+        if self.mode == 'native':
+            with self.engine.begin() as conn:
+                for ddl in NATIVE_PARENT_INDEXES:
+                    conn.execute(text(ddl))
+
+        self.refresh_known(force=True)
+        self.ensure_upcoming()
+        self._refresh_view()
+        print(f"✅ Audit log partitions ready ({self.mode}, {len(self._known)} partitions)")
+
+    def _detect_mode(self) -> str:
+        """Native partitioning only when audit_logs was created partitioned"""
+        if self.dialect == 'postgresql':
+            with self.engine.connect() as conn:
+                relkind = conn.execute(
+                    text("SELECT relkind FROM pg_class WHERE relname = 'audit_logs'")
+                ).scalar()
+            if relkind == 'p':
+                return 'native'
+            print("⚠️ audit_logs is a plain table - using rotated monthly tables instead of native partitions")
+        return 'rotated'
+
+    def _discover(self) -> List[Tuple[int, int]]:
+        """List (year, month) partitions present in the database"""
+        found = []
+        for name in inspect(self.engine).get_table_names():
+            match = PARTITION_PATTERN.match(name)
+            if match:
+                found.append((int(match.group(1)), int(match.group(2))))
+        return sorted(found)
+
+    def refresh_known(self, force: bool = False):
+        """
+        Re-read the partition list from the catalog. Other processes create
+        partitions, and the leader's retention job drops them, so a
+        process's own list goes stale.
+        """
+        if not force and time.monotonic() - self._discovered < settings.AUDIT_PARTITION_REFRESH_SECONDS:
+            return
+        found = set(self._discover())
+        with self._lock:
+            self._known = found
+            self._discovered = time.monotonic()
+
+    def _partition_table(self, year: int, month: int) -> Table:
+        """Table object for a partition (same columns as audit_logs)"""
+        name = partition_name(year, month)
+        if name in self._metadata.tables:
+            return self._metadata.tables[name]
+
+        return Table(
+            name, self._metadata,
+            Column('id', Integer, primary_key=True, autoincrement=True),
+            Column('patient_id', String(50)),
+            Column('action', String(100), nullable=False),
+            Column('description', Text),
+            Column('user', String(100)),
+            Column('timestamp', DateTime, default=datetime.utcnow),
+            Index(f'ix_{name}_timestamp', 'timestamp'),
+            Index(f'ix_{name}_patient_id', 'patient_id', 'timestamp')
+        )
+
+    def ensure_partition(self, dt: datetime):
+        """Create the partition holding dt if it doesn't exist yet"""
+        key = (dt.year, dt.month)
+        if key in self._known:
+            return
+
+        with self._lock:
+            if key in self._known:
+                return
+
+            if self.mode == 'native':
+                lower = month_start(dt)
+                upper = add_months(lower, 1)
+                ddl = (
+                    f"CREATE TABLE IF NOT EXISTS {partition_name(*key)} PARTITION OF audit_logs "
+                    f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+                )
+                with self.engine.begin() as conn:
+                    conn.execute(text(ddl))
+            else:
+                self._partition_table(*key).create(self.engine, checkfirst=True)
+
+            self._known.add(key)
+            self._refresh_view()
+
+    def ensure_upcoming(self, now: Optional[datetime] = None):
+        """Pre-create the current month and AUDIT_PRECREATE_MONTHS ahead"""
+        current = month_start(now or datetime.utcnow())
+        for offset in range(settings.AUDIT_PRECREATE_MONTHS + 1):
+            self.ensure_partition(add_months(current, offset))
+
+    def _refresh_view(self, exclude: tuple = ()):
+        """(Re)build the audit_logs_all union view"""
+        quote = self.engine.dialect.identifier_preparer.quote
+        columns = ', '.join(quote(c) for c in AUDIT_COLUMNS)
+
+        selects = [f"SELECT {columns} FROM {PARENT_TABLE}"]
+        if self.mode != 'native':
+            partitions = sorted(set(self._discover()) | self._known)
+            partition_columns = ', '.join(quote(c) for c in AUDIT_COLUMNS[1:])
+            selects += [
+                f"SELECT {global_id(key, 0)} + id AS id, {partition_columns} FROM {partition_name(*key)}"
+                for key in partitions if key not in exclude
+            ]
+
+        body = ' UNION ALL '.join(selects)
+
+        with self.engine.begin() as conn:
+            if self.dialect == 'postgresql':
+                conn.execute(text(f"CREATE OR REPLACE VIEW {VIEW_NAME} AS {body}"))
+            else:
+                conn.execute(text(f"DROP VIEW IF EXISTS {VIEW_NAME}"))
+                conn.execute(text(f"CREATE VIEW {VIEW_NAME} AS {body}"))
+
+    def drop_all(self):
+        """Drop the view and every partition (used by reset_db)"""
+        partitions = self._discover()
+        with self.engine.begin() as conn:
+            conn.execute(text(f"DROP VIEW IF EXISTS {VIEW_NAME}"))
+            for key in partitions:
+                conn.execute(text(f"DROP TABLE IF EXISTS {partition_name(*key)}"))
+        self._known = set()
+
+    # ----------------------------------------
+    # Writes
+    # ----------------------------------------
+
+    def insert_rows(self, db, rows: List[dict]):
+        """
+        Insert a batch of audit rows into their partitions
+        Args:
+            db: open session (caller commits)
+            rows: audit row dicts with a 'timestamp'
+        """
+        if self.mode != 'rotated':
+            # Native partitions route rows from the parent table themselves
+            db.execute(insert(AuditLog), rows)
+            return
+
+        by_month = defaultdict(list)
+        for row in rows:
+            if not row.get('timestamp'):
+                row['timestamp'] = datetime.utcnow()
+            by_month[(row['timestamp'].year, row['timestamp'].month)].append(row)
+
+        # DDL first - SQLite can't create tables while this session holds the write lock
+        for year, month in by_month:
+            self.ensure_partition(datetime(year, month, 1))
+
+        for (year, month), group in by_month.items():
+            db.execute(insert(self._partition_table(year, month)), group)
+
+    # ----------------------------------------
+    # Reads
+    # ----------------------------------------
+
+    def recent(self, db, limit: Optional[int] = 50, patient_id: Optional[str] = None) -> List[dict]:
+        """
+        Newest audit rows first, touching only as many partitions as needed
+        Args:
+            db: open session
+            limit: max rows (None for all)
+            patient_id: filter by patient (optional)
+        Returns:
+            list of audit log dicts
+        """
+        if self.mode != 'rotated':
+            query = db.query(AuditLog)
+            if patient_id:
+                query = query.filter(AuditLog.patient_id == patient_id)
+            query = query.order_by(AuditLog.timestamp.desc())
+            if limit is not None:
+                query = query.limit(limit)
+            return [log.to_dict() for log in query.all()]
+
+        self.refresh_known()
+        try:
+            return self._recent_rotated(db, limit, patient_id)
+        except (OperationalError, ProgrammingError):
+            # A partition was dropped (retention on the leader) since we last looked
+            db.rollback()
+            self.refresh_known(force=True)
+            return self._recent_rotated(db, limit, patient_id)
+
+    def _recent_rotated(self, db, limit: Optional[int], patient_id: Optional[str]) -> List[dict]:
+        sources = [(key, self._partition_table(*key)) for key in sorted(self._known, reverse=True)]
+        sources.append((None, AuditLog.__table__))  # pre-partitioning rows
+
+        results = []
+        for key, table in sources:
+            query = select(table).order_by(table.c.timestamp.desc())
+            if patient_id:
+                query = query.where(table.c.patient_id == patient_id)
+            if limit is not None:
+                query = query.limit(limit - len(results))
+
+            results.extend(_row_to_dict(row, key) for row in db.execute(query).mappings())
+            if limit is not None and len(results) >= limit:
+                break
+
+        return results
+
+    # ----------------------------------------
+    # Retention & Compaction
+    # ----------------------------------------
+
+    def apply_retention(self, now: Optional[datetime] = None) -> List[str]:
+        """
+        Archive (optional) and drop whole partitions older than the retention window
+        Returns:
+            names of dropped partitions
+        """
+        months = settings.AUDIT_RETENTION_MONTHS
+        if months <= 0:
+            return []
+
+        cutoff = add_months(month_start(now or datetime.utcnow()), -months)
+        expired = [key for key in self._discover() if datetime(key[0], key[1], 1) < cutoff]
+        if not expired:
+            return []
+
+        if settings.AUDIT_ARCHIVE_DIR:
+            for key in expired:
+                self._archive(key)
+
+        if self.mode == 'rotated':
+            # The view must stop referencing a table before it is dropped
+            self._refresh_view(exclude=tuple(expired))
+
+        dropped = []
+        with self.engine.begin() as conn:
+            for key in expired:
+                name = partition_name(*key)
+                if self.mode == 'native':
+                    conn.execute(text(f"ALTER TABLE audit_logs DETACH PARTITION {name}"))
+                conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                self._known.discard(key)
+                dropped.append(name)
+
+        if self.dialect == 'sqlite':
+            # Dropped tables leave free pages behind; give them back to the OS
+            with self.engine.connect() as conn:
+                conn.execution_options(isolation_level='AUTOCOMMIT')
+                conn.execute(text("VACUUM"))
+
+        print(f"🗑️ Dropped audit partitions: {', '.join(dropped)}")
+        return dropped
+
+    def _archive(self, key: Tuple[int, int]) -> str:
+        """Write a partition to AUDIT_ARCHIVE_DIR as gzipped NDJSON"""
+        os.makedirs(settings.AUDIT_ARCHIVE_DIR, exist_ok=True)
+        name = partition_name(*key)
+        path = os.path.join(settings.AUDIT_ARCHIVE_DIR, f"{name}.ndjson.gz")
+
+        rows = iter_table_rows(self._partition_table(*key), 'timestamp')
+        with open(path + '.tmp', 'wb') as f:
+            for chunk in encode_stream(rows, 'ndjson', AUDIT_COLUMNS, compress=True):
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+        print(f"📦 Archived {name} to {path}")
+        return path
+
+    def compact_legacy(self, batch_size: Optional[int] = None) -> int:
+        """
+        Move rows written before partitioning out of the plain audit_logs
+        table into their monthly partitions (rotated mode only)
+        Returns:
+            number of rows moved
+        """
+        if self.mode != 'rotated':
+            return 0
+
+        batch_size = batch_size or settings.AUDIT_COMPACT_BATCH_SIZE
+        legacy = AuditLog.__table__
+        moved = 0
+
+        while True:
+            db = SessionLocal()
+            try:
+                rows = [dict(row) for row in db.execute(
+                    select(legacy).order_by(legacy.c.id).limit(batch_size)
+                ).mappings()]
+                if not rows:
+                    break
+
+                ids = [row.pop('id') for row in rows]
+                self.insert_rows(db, rows)
+                db.execute(delete(legacy).where(legacy.c.id.in_(ids)))
+                db.commit()
+                moved += len(rows)
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+        if moved:
+            print(f"🗜️ Compacted {moved} legacy audit rows into monthly partitions")
+        return moved
+
+    def maintain(self, fence: Optional[Callable[[], bool]] = None):
+        """
+        Daily job: pre-create partitions, compact legacy rows, apply retention
+        Args:
+            fence: checked before each step; the job stops once it fails (lost leadership)
+        """
+        for step in (self.ensure_upcoming, self.compact_legacy, self.apply_retention):
+            if fence is not None and not fence():
+                print("⏸️ Audit maintenance stopped: this process is no longer the scheduler leader")
+                return
+            step()
+
+    def stats(self) -> dict:
+        """Partition layout for the status endpoint"""
+        return {
+            'mode': self.mode,
+            'partitions': [partition_name(*key) for key in sorted(self._known)],
+            'retention_months': settings.AUDIT_RETENTION_MONTHS,
+            'archive_dir': settings.AUDIT_ARCHIVE_DIR or None
+        }
+
+
+# Global instance
+audit_partitions = AuditPartitionManager(engine)
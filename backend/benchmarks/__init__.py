@@ -0,0 +1,4 @@
+"""
+Benchmarks - run from the backend directory, e.g.
+    python -m benchmarks.bench_smtp_pool
+"""
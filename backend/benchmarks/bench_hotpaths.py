@@ -0,0 +1,249 @@
+"""
+Benchmark - CPU hot paths
+
+Microbenchmarks for the per-request work that is not I/O:
+  parse:    NurseAgent._parse_*_response on typical model answers
+  to_dict:  Patient/VitalSigns/Assessment.to_dict, single and list endpoints
+  validate: Pydantic validation of PatientCreate/VitalsCreate bodies
+  render:   notification bodies (templates.render / render_batch)
+
+Each case reports ops/sec (best of --repeat timed rounds) and, from a
+separate tracemalloc pass, bytes allocated per op (peak) and bytes still
+held when it returns, mostly the result (retained).
+
+Usage (from backend/):
+    python -m benchmarks.bench_hotpaths
+    python -m benchmarks.bench_hotpaths --filter to_dict --time 0.5
+    python -m benchmarks.bench_hotpaths --output results/hotpaths.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+# main reads settings at import time: keep it off the real database and providers
+_workdir = tempfile.mkdtemp(prefix='bench-hotpaths-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_workdir, 'bench.db')}")
+os.environ.setdefault('AUDIT_SEGMENT_DIR', os.path.join(_workdir, 'audit_segments'))
+os.environ.setdefault('LLM_BACKEND', 'fake')
+os.environ.setdefault('SMS_BACKEND', 'fake')
+os.environ.setdefault('EMAIL_BACKEND', 'fake')
+
+import templates
+from agent import NurseAgent
+from main import PatientCreate, VitalsCreate
+from models import Assessment, Patient, VitalSigns
+
+# ============================================
+# Inputs
+# ============================================
+
+# Model answers as they come back: preamble, the requested fields, trailing advice
+VITALS_RESPONSE = """Based on the provided vital signs, here is my assessment:
+
+LEVEL: CRITICAL
+REASON: Heart rate of 132 bpm with BP 182/110 indicates hypertensive urgency with tachycardia.
+ACTION: Notify the physician immediately and recheck vitals every 15 minutes.
+
+Please continue to monitor the patient closely and escalate if symptoms worsen.
+"""
+
+DOCTOR_RESPONSE = """SPECIALIST: Cardiologist
+REASON: Elevated blood pressure and tachycardia in a post-MI patient need cardiac review.
+"""
+
+WOUND_RESPONSE = """Assessment of the described wound:
+
+SEVERITY: MODERATE
+CARE: Dressing
+STEPS: Irrigate the wound with sterile saline; Apply a non-adherent sterile dressing; Check for signs of infection every 8 hours
+
+Seek further care if bleeding does not stop with pressure.
+"""
+
+PATIENT_BODY = {
+    'patient_id': 'P00042',
+    'first_name': 'Amina',
+    'last_name': 'Rahman',
+    'date_of_birth': '1957-03-14',
+    'gender': 'Female',
+    'blood_group': 'O+',
+    'room_number': '204',
+    'bed_number': '2',
+    'admission_date': '2026-01-05',
+    'diagnosis': 'Post-MI monitoring',
+    'allergies': 'Penicillin',
+    'emergency_contact': {'name': 'Omar Rahman', 'phone': '+15550100042', 'email': 'omar@example.com'}
+}
+
+VITALS_BODY = {
+    'patient_id': 'P00042',
+    'heart_rate': 88,
+    'blood_pressure': '128/82',
+    'temperature': 98.9,
+    'recorded_by': 'Nurse Kim'
+}
+
+NOW = datetime(2026, 1, 5, 8, 0)
+
+
+def make_patient(i: int = 42) -> Patient:
+    body = {**PATIENT_BODY, 'patient_id': f"P{i:05d}"}
+    return Patient(id=i, created_at=NOW, updated_at=NOW, **body)
+
+
+def make_vitals(count: int) -> list:
+    return [
+        VitalSigns(id=i, patient_id='P00042', heart_rate=70 + i % 40, blood_pressure=f"{110 + i % 50}/{70 + i % 20}",
+                   temperature=98.0 + (i % 30) / 10, recorded_by='Nurse Kim', recorded_at=NOW + timedelta(hours=i))
+        for i in range(count)
+    ]
+
+
+def make_assessments(count: int) -> list:
+    return [
+        Assessment(id=i, patient_id='P00042', emergency_level='MODERATE',
+                   reasoning='Mild tachycardia with low-grade fever.',
+                   recommended_action='Recheck vitals in 1 hour.',
+                   recommended_specialist='General Physician',
+                   specialist_reason='No specialist finding.',
+                   assessment_data={
+                       'vitals': {'hr': 104, 'bp': '132/84', 'temp': 100.2},
+                       'analysis': {'level': 'MODERATE', 'reason': 'Mild tachycardia with low-grade fever.',
+                                    'action': 'Recheck vitals in 1 hour.'},
+                       'doctor_recommendation': {'specialist': 'General Physician',
+                                                 'reason': 'No specialist finding.'}
+                   },
+                   created_at=NOW + timedelta(hours=i))
+        for i in range(count)
+    ]
+
+
+# ============================================
+# Cases: name -> zero-argument callable (one op)
+# ============================================
+
+def build_cases() -> dict:
+    agent = NurseAgent()
+    patient = make_patient()
+    patients = [make_patient(i) for i in range(100)]
+    vitals = make_vitals(100)
+    assessments = make_assessments(50)
+    patient_bodies = [{**PATIENT_BODY, 'patient_id': f"P{i:05d}"} for i in range(100)]
+    recipients = [{'patient_name': f"Patient {i}"} for i in range(100)]
+    medication = {'patient_name': 'Amina Rahman', 'medication': 'Metoprolol 25mg'}
+    vitals_values = {'patient_name': 'Amina Rahman'}
+    critical = {'patient_id': 'P00042', 'patient_name': 'Amina Rahman', 'emergency_level': 'CRITICAL',
+                'reasoning': VITALS_RESPONSE.split('REASON: ')[1].split('\n')[0]}
+
+    return {
+        'parse/vitals': lambda: agent._parse_vitals_response(VITALS_RESPONSE),
+        'parse/doctor': lambda: agent._parse_doctor_response(DOCTOR_RESPONSE),
+        'parse/wound': lambda: agent._parse_wound_response(WOUND_RESPONSE),
+
+        'to_dict/patient': patient.to_dict,
+        'to_dict/patients x100': lambda: [p.to_dict() for p in patients],
+        'to_dict/vitals x100': lambda: [v.to_dict() for v in vitals],
+        'to_dict/assessments x50': lambda: [a.to_dict() for a in assessments],
+
+        'validate/VitalsCreate': lambda: VitalsCreate.model_validate(VITALS_BODY),
+        'validate/PatientCreate': lambda: PatientCreate.model_validate(PATIENT_BODY),
+        'validate/PatientCreate x100': lambda: [PatientCreate.model_validate(b) for b in patient_bodies],
+
+        'render/medication': lambda: templates.render('medication', medication),
+        'render/vitals': lambda: templates.render('vitals', vitals_values),
+        'render/critical_alert': lambda: templates.render('critical_alert', critical),
+        'render/medication batch x100': lambda: templates.render_batch(
+            'medication', recipients, {'medication': 'Metoprolol 25mg'}),
+    }
+
+
+# ============================================
+# Runner
+# ============================================
+
+def calibrate(op, target: float) -> int:
+    """Iterations per round so that one round takes about `target` seconds"""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            op()
+        elapsed = time.perf_counter() - started
+        if elapsed >= target / 10:
+            return max(1, int(number * target / elapsed))
+        number *= 10
+
+
+def time_case(op, target: float, repeat: int) -> float:
+    """Best ops/sec over `repeat` rounds (GC disabled while timing, as timeit does)"""
+    number = calibrate(op, target)
+    best = float('inf')
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for _ in range(number):
+                op()
+            best = min(best, time.perf_counter() - started)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return number / best
+
+
+def measure_allocations(op, rounds: int = 20) -> tuple:
+    """(peak bytes, retained bytes) per op, median over `rounds` single ops"""
+    op()  # warm caches (compiled templates, pydantic validators)
+    peaks, retained = [], []
+    tracemalloc.start()
+    try:
+        for _ in range(rounds):
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            result = op()
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(current - before)
+            del result
+    finally:
+        tracemalloc.stop()
+    peaks.sort()
+    retained.sort()
+    return peaks[rounds // 2], retained[rounds // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filter', help="only cases whose name contains this")
+    parser.add_argument('--time', type=float, default=0.2, help="seconds per timed round")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help="also write results as JSON")
+    args = parser.parse_args()
+
+    cases = {name: op for name, op in build_cases().items() if not args.filter or args.filter in name}
+
+    print(f"{'case':<32}{'ops/sec':>14}{'µs/op':>10}{'alloc KB':>10}{'retained KB':>13}")
+    results = {}
+    for name, op in cases.items():
+        ops = time_case(op, args.time, args.repeat)
+        peak, retained = measure_allocations(op)
+        results[name] = {'ops_per_sec': round(ops, 1), 'us_per_op': round(1e6 / ops, 3),
+                         'alloc_bytes': peak, 'retained_bytes': retained}
+        print(f"{name:<32}{ops:>14,.0f}{1e6 / ops:>10.2f}{peak / 1024:>10.1f}{retained / 1024:>13.1f}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({'created_at': datetime.utcnow().isoformat(), 'cases': results}, f, indent=2)
+        print(f"\n💾 Results saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark - Pooled vs per-message SMTP connections
+
+Sends the same batch of emails through a local SMTP sink three ways:
+  1. legacy: new connection + login per message (old send_email)
+  2. pool:   SMTPConnectionPool.send_message from worker threads
+  3. batch:  SMTPConnectionPool.send_many over one session
+
+Usage (from backend/):
+    python -m benchmarks.bench_smtp_pool --messages 300 --connect-latency-ms 40
+"""
+
+import argparse
+import smtplib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.text import MIMEText
+
+from smtp_pool import SMTPConnectionPool
+from fakes import SMTPSink
+
+
+def _message(i: int) -> MIMEText:
+    msg = MIMEText(f"Dear Patient {i},\n\nThis is a reminder to take your medication.\n", 'plain')
+    msg['From'] = 'nurse@example.com'
+    msg['To'] = f'patient{i}@example.com'
+    msg['Subject'] = 'Medication Reminder'
+    return msg
+
+
+def run_legacy(sink: SMTPSink, count: int, workers: int) -> float:
+    """Connect, log in and quit for every message"""
+    def send(i):
+        with smtplib.SMTP(sink.host, sink.port) as server:
+            server.login('user', 'password')
+            server.send_message(_message(i))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(send, range(count)))
+    return time.perf_counter() - started
+
+
+def run_pool(sink: SMTPSink, count: int, workers: int, pool_size: int) -> float:
+    """Reuse pooled sessions from worker threads"""
+    pool = SMTPConnectionPool(sink.host, sink.port, 'user', 'password',
+                              use_tls=False, max_connections=pool_size,
+                              max_messages_per_connection=10_000)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda i: pool.send_message(_message(i)), range(count)))
+    elapsed = time.perf_counter() - started
+    pool.close()
+    return elapsed
+
+
+def run_batch(sink: SMTPSink, count: int) -> float:
+    """Send everything back-to-back over one session"""
+    pool = SMTPConnectionPool(sink.host, sink.port, 'user', 'password',
+                              use_tls=False, max_connections=1,
+                              max_messages_per_connection=10_000)
+    messages = [_message(i) for i in range(count)]
+    started = time.perf_counter()
+    errors = pool.send_many(messages)
+    elapsed = time.perf_counter() - started
+    pool.close()
+    assert not any(errors)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--pool-size', type=int, default=3)
+    parser.add_argument('--connect-latency-ms', type=float, default=30,
+                        help="simulated TCP+TLS handshake per connection")
+    parser.add_argument('--auth-latency-ms', type=float, default=10)
+    parser.add_argument('--message-latency-ms', type=float, default=1)
+    args = parser.parse_args()
+
+    sink = SMTPSink(connect_latency=args.connect_latency_ms / 1000,
+                    auth_latency=args.auth_latency_ms / 1000,
+                    message_latency=args.message_latency_ms / 1000).start()
+
+    print(f"📧 {args.messages} messages, {args.workers} workers, "
+          f"handshake {args.connect_latency_ms:.0f} ms, auth {args.auth_latency_ms:.0f} ms\n")
+    print(f"{'mode':<10}{'seconds':>10}{'msg/s':>10}{'connections':>14}")
+
+    runs = [
+        ('legacy', lambda: run_legacy(sink, args.messages, args.workers)),
+        ('pool', lambda: run_pool(sink, args.messages, args.workers, args.pool_size)),
+        ('batch', lambda: run_batch(sink, args.messages)),
+    ]
+    for name, run in runs:
+        connections_before = sink.connections
+        elapsed = run()
+        print(f"{name:<10}{elapsed:>10.3f}{args.messages / elapsed:>10.1f}"
+              f"{sink.connections - connections_before:>14}")
+
+    sink.stop()
+
+
+if __name__ == '__main__':
+    main()
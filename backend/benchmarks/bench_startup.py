@@ -0,0 +1,97 @@
+"""
+Benchmark - Application startup time
+
+Starts the app in fresh interpreters (cold imports, empty SQLite database)
+and reports, per run:
+  import: `import main` (module-level work: imports, app, routes)
+  ready:  import + lifespan startup (database, workers, scheduler)
+
+Usage (from backend/):
+    python -m benchmarks.bench_startup --runs 5 --top 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# The child writes its timings to a file (BENCH_RESULT), not stdout: background
+# threads started during startup print there too and can interleave with it
+CHILD = r"""
+import asyncio, json, os, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def startup():
+    async with main.app.router.lifespan_context(main.app):
+        ready = time.perf_counter()
+        with open(os.environ['BENCH_RESULT'], 'w') as f:
+            json.dump({'import': imported - started, 'ready': ready - started}, f)
+
+asyncio.run(startup())
+"""
+
+
+def _env(workdir: str) -> dict:
+    env = dict(os.environ)
+    env.setdefault('GEMINI_API_KEY', 'benchmark')
+    env['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'startup.db')}"
+    env['AUDIT_SEGMENT_DIR'] = os.path.join(workdir, 'audit_segments')
+    env['PYTHONPATH'] = os.getcwd()
+    env['BENCH_RESULT'] = os.path.join(workdir, 'result.json')
+    return env
+
+
+def run_once(extra_args: list = ()) -> tuple:
+    """Start one fresh interpreter; returns (timings, stderr)"""
+    with tempfile.TemporaryDirectory() as workdir:
+        env = _env(workdir)
+        proc = subprocess.run([sys.executable, *extra_args, '-c', CHILD], cwd=workdir,
+                              env=env, capture_output=True, text=True, timeout=120)
+        try:
+            with open(env['BENCH_RESULT']) as f:
+                return json.load(f), proc.stderr
+        except (OSError, ValueError):
+            raise RuntimeError(f"Startup failed:\n{proc.stderr[-2000:]}")
+
+
+def slowest_imports(stderr: str, top: int) -> list:
+    """Modules imported directly by main, by cumulative time (from -X importtime)"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name[1:]  # separator space; then two spaces per nesting level
+        if name.startswith('  ') and not name.startswith('   '):
+            rows.append((int(cumulative) / 1000, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=0, help="also list the N slowest imports of main")
+    args = parser.parse_args()
+
+    results = [run_once()[0] for _ in range(args.runs)]
+
+    print(f"🚀 {args.runs} cold starts\n")
+    print(f"{'phase':<10}{'median ms':>12}{'min ms':>10}{'max ms':>10}")
+    for phase in ('import', 'ready'):
+        values = [r[phase] * 1000 for r in results]
+        print(f"{phase:<10}{statistics.median(values):>12.1f}{min(values):>10.1f}{max(values):>10.1f}")
+
+    if args.top:
+        _, stderr = run_once(['-X', 'importtime'])
+        print(f"\n{'import':<40}{'cumulative ms':>14}")
+        for ms, name in slowest_imports(stderr, args.top):
+            print(f"{name:<40}{ms:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
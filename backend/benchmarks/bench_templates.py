@@ -0,0 +1,124 @@
+"""
+Benchmark - Notification template rendering
+
+Renders a medication reminder (SMS, subject, text and HTML email) for a
+batch of recipients three ways:
+  1. legacy: f-strings rebuilt per message (old send_medication_reminder)
+  2. render: templates.render per message
+  3. batch:  templates.render_batch with the medication bound once
+
+Usage (from backend/):
+    python -m benchmarks.bench_templates --recipients 10000
+"""
+
+import argparse
+import time
+from datetime import datetime
+
+import templates
+
+
+def legacy_render(patient_name: str, medication: str) -> dict:
+    """Message bodies exactly as the old send_medication_reminder built them"""
+    current_time = datetime.now().strftime("%I:%M %p")
+    
+    # SMS message
+    sms_text = f"🏥 Reminder: {patient_name}, it's time for your medication: {medication}. Time: {current_time}"
+    
+    # Email content
+    email_subject = f"Medication Reminder - {medication}"
+    email_body = f"""
+Dear {patient_name},
+
+This is a reminder to take your medication:
+
+Medication: {medication}
+Time: {current_time}
+
+Please take your medication as prescribed by your doctor.
+
+Best regards,
+Nurse Triage System
+"""
+    
+    email_html = f"""
+<!DOCTYPE html>
+<html>
+<head>
+    <style>
+        body {{ font-family: Arial, sans-serif; }}
+        .container {{ max-width: 600px; margin: 20px auto; padding: 20px; border: 1px solid #ddd; border-radius: 8px; }}
+        .header {{ background-color: #0d6efd; color: white; padding: 15px; border-radius: 5px; }}
+        .content {{ padding: 20px; }}
+        .medication {{ background-color: #f8f9fa; padding: 15px; margin: 15px 0; border-left: 4px solid #28a745; }}
+        .footer {{ color: #666; font-size: 12px; margin-top: 20px; }}
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h2>🏥 Medication Reminder</h2>
+        </div>
+        <div class="content">
+            <p>Dear {patient_name},</p>
+            <p>This is a reminder to take your medication:</p>
+            <div class="medication">
+                <strong>Medication:</strong> {medication}<br>
+                <strong>Time:</strong> {current_time}
+            </div>
+            <p>Please take your medication as prescribed by your doctor.</p>
+        </div>
+        <div class="footer">
+            <p>Best regards,<br>Nurse Triage System</p>
+        </div>
+    </div>
+</body>
+</html>
+"""
+    return {'sms': sms_text, 'subject': email_subject, 'text': email_body, 'html': email_html}
+
+
+def run_legacy(names: list, medication: str) -> list:
+    return [legacy_render(name, medication) for name in names]
+
+
+def run_render(names: list, medication: str) -> list:
+    return [templates.render('medication', {'patient_name': name, 'medication': medication})
+            for name in names]
+
+
+def run_batch(names: list, medication: str) -> list:
+    return templates.render_batch('medication', [{'patient_name': name} for name in names],
+                                  {'medication': medication})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--recipients', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=5, help="best of N runs")
+    args = parser.parse_args()
+
+    names = [f"Patient {i}" for i in range(args.recipients)]
+    medication = "Paracetamol 500mg"
+
+    # Same output from every mode
+    expected = run_legacy(names[:3], medication)
+    assert run_render(names[:3], medication) == expected
+    assert run_batch(names[:3], medication) == expected
+
+    print(f"📨 {args.recipients} recipients, best of {args.repeat}\n")
+    print(f"{'mode':<10}{'seconds':>10}{'us/msg':>10}{'speedup':>10}")
+
+    baseline = None
+    for name, run in (('legacy', run_legacy), ('render', run_render), ('batch', run_batch)):
+        best = float('inf')
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            run(names, medication)
+            best = min(best, time.perf_counter() - started)
+        baseline = baseline or best
+        print(f"{name:<10}{best:>10.3f}{best / args.recipients * 1e6:>10.2f}{baseline / best:>9.2f}x")
+
+
+if __name__ == '__main__':
+    main()
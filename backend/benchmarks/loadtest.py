@@ -0,0 +1,403 @@
+"""
+Load Test - End-to-end API scenarios
+
+Boots the API (uvicorn, fresh SQLite database, offline provider fakes),
+registers a ward of patients, then runs virtual users through scripted
+scenarios and reports throughput and p50/p95/p99 latency per endpoint.
+
+Scenarios:
+  ward_round  record_vitals for each patient in turn (LLM triage path)
+  dashboard   patient list + latest vitals/assessment polling
+  audit       audit log reads (all + per patient)
+  reminders   bursts of notification sends + delivery/status checks
+
+Results are written as JSON (with the git commit) for comparing runs.
+
+Usage (from backend/):
+    python -m benchmarks.loadtest --duration 30 --users 8
+    python -m benchmarks.loadtest --scenario dashboard --scenario audit --users 16
+    python -m benchmarks.loadtest --url http://127.0.0.1:8000   # existing server
+    python -m benchmarks.loadtest --compare results/old.json results/new.json
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+# Server environment for local runs: every provider faked, no client-side pacing
+FAKE_ENV = {
+    'LLM_BACKEND': 'fake',
+    'SMS_BACKEND': 'fake',
+    'EMAIL_BACKEND': 'fake',
+    'FAKE_LLM_PROFILE': 'latency=lognormal:400:0.4,rate_limit_rate=0.01,seed=1',
+    'FAKE_SMS_PROFILE': 'latency=lognormal:150:0.3,error_rate=0.01,seed=2',
+    'FAKE_SMTP_PROFILE': 'latency=fixed:20,seed=3',
+    'LLM_MIN_INTERVAL_SECONDS': '0',
+    'LLM_RATE_LIMIT_BACKOFF_SECONDS': '1',
+    'SMS_RATE_PER_SECOND': '0',
+    'EMAIL_RATE_PER_SECOND': '0',
+}
+
+
+# ============================================
+# HTTP client + recording
+# ============================================
+
+class Recorder:
+    """Latency samples per endpoint (route template, not concrete path)"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float, status: int, expected: tuple = ()):
+        with self._lock:
+            self.samples[endpoint].append(seconds)
+            self.statuses[endpoint][status] += 1
+            if status == 0 or (status >= 400 and status not in expected):
+                self.errors[endpoint] += 1
+
+
+class Client:
+    """One keep-alive connection per virtual user"""
+
+    def __init__(self, base_url: str, recorder: Recorder, timeout: float = 60):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.recorder = recorder
+        self.timeout = timeout
+        self._conn = None
+
+    def request(self, method: str, path: str, endpoint: str, body: dict = None, expected: tuple = ()):
+        """
+        Send one request, record its latency under `endpoint`
+        Statuses in `expected` (e.g. 404 before a patient's first vitals) are not errors.
+        Returns:
+            parsed JSON body, or None
+        """
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {'Content-Type': 'application/json'} if payload else {}
+
+        started = time.perf_counter()
+        status, data = 0, None
+        try:
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._conn.request(method, path, body=payload, headers=headers)
+            response = self._conn.getresponse()
+            raw = response.read()
+            status = response.status
+            if raw and response.getheader('Content-Type', '').startswith('application/json'):
+                data = json.loads(raw)
+        except (OSError, http.client.HTTPException, ValueError):
+            self.close()
+        self.recorder.record(endpoint, time.perf_counter() - started, status, expected)
+        return data
+
+    def close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+
+# ============================================
+# Scenarios (one iteration each)
+# ============================================
+
+def _vitals(rng: random.Random) -> dict:
+    # Mostly normal readings, some abnormal ones
+    if rng.random() < 0.15:
+        return {'heart_rate': rng.randint(125, 160), 'blood_pressure': f"{rng.randint(170, 200)}/{rng.randint(95, 120)}",
+                'temperature': round(rng.uniform(100.5, 104.5), 1)}
+    return {'heart_rate': rng.randint(60, 95), 'blood_pressure': f"{rng.randint(105, 135)}/{rng.randint(65, 85)}",
+            'temperature': round(rng.uniform(97.5, 99.3), 1)}
+
+
+def ward_round(client: Client, patients: list, rng: random.Random, state: dict):
+    index = state.setdefault('next', rng.randrange(len(patients)))
+    state['next'] = (index + 1) % len(patients)
+    client.request('POST', '/api/vitals/record', 'POST /api/vitals/record',
+                   {'patient_id': patients[index], 'recorded_by': 'Load Test', **_vitals(rng)})
+
+
+def dashboard(client: Client, patients: list, rng: random.Random, state: dict):
+    client.request('GET', '/api/patients', 'GET /api/patients')
+    for patient_id in rng.sample(patients, min(5, len(patients))):
+        client.request('GET', f'/api/vitals/{patient_id}/latest', 'GET /api/vitals/{id}/latest',
+                       expected=(404,))
+        client.request('GET', f'/api/assessments/{patient_id}/latest', 'GET /api/assessments/{id}/latest',
+                       expected=(404,))
+
+
+def audit(client: Client, patients: list, rng: random.Random, state: dict):
+    client.request('GET', '/api/audit-logs?limit=50', 'GET /api/audit-logs')
+    client.request('GET', f'/api/audit-logs/{rng.choice(patients)}', 'GET /api/audit-logs/{id}')
+
+
+def reminders(client: Client, patients: list, rng: random.Random, state: dict):
+    kinds = ('medication', 'vitals', 'diet', 'exercise')
+    deliveries = []
+    for patient_id in rng.sample(patients, min(10, len(patients))):
+        result = client.request('POST', '/api/notifications/send', 'POST /api/notifications/send',
+                                {'patient_id': patient_id, 'type': rng.choice(kinds)})
+        if result and result.get('delivery_id'):
+            deliveries.append(result['delivery_id'])
+    if deliveries:
+        client.request('GET', f'/api/notifications/deliveries/{rng.choice(deliveries)}',
+                       'GET /api/notifications/deliveries/{id}')
+    client.request('GET', '/api/notifications/status', 'GET /api/notifications/status')
+
+
+SCENARIOS = {
+    'ward_round': ward_round,
+    'dashboard': dashboard,
+    'audit': audit,
+    'reminders': reminders,
+}
+
+
+# ============================================
+# Server + setup
+# ============================================
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workdir: str, workers: int, extra_env: dict) -> tuple:
+    """Start uvicorn against a fresh database; returns (process, base_url)"""
+    port = _free_port()
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {
+        **os.environ,
+        **FAKE_ENV,
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+        'AUDIT_SEGMENT_DIR': os.path.join(workdir, 'audit_segments'),
+        **extra_env,
+    }
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port),
+         '--workers', str(workers), '--log-level', 'warning'],
+        cwd=backend_dir, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    base_url = f"http://127.0.0.1:{port}"
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited; see {log.name}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return process, base_url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Server did not become healthy within 60s")
+
+
+def register_patients(base_url: str, count: int, seed: int) -> list:
+    """Register a ward (not measured); ~10% share a family phone"""
+    rng = random.Random(seed)
+    client = Client(base_url, Recorder())
+    diagnoses = ['Post-MI monitoring', 'Type 2 diabetes', 'Community-acquired pneumonia',
+                 'Hip fracture (post-op)', 'COPD exacerbation', 'Chronic kidney disease']
+    patients = []
+    for i in range(count):
+        patient_id = f"LT{i:05d}"
+        phone = f"+1555{(i // 10 if i % 10 == 0 else i):07d}"
+        client.request('POST', '/api/patients/register', 'setup', {
+            'patient_id': patient_id, 'first_name': 'Load', 'last_name': f"Test {i}",
+            'date_of_birth': f"{rng.randint(1940, 2000)}-01-01", 'gender': rng.choice(['Male', 'Female']),
+            'room_number': str(100 + i // 4), 'bed_number': str(i % 4 + 1), 'admission_date': '2026-01-01',
+            'diagnosis': rng.choice(diagnoses),
+            'emergency_contact': {'name': 'Family', 'phone': phone, 'email': f"family{i}@example.com"}
+        })
+        patients.append(patient_id)
+    client.close()
+    return patients
+
+
+# ============================================
+# Run + report
+# ============================================
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(recorder: Recorder, elapsed: float) -> dict:
+    endpoints = {}
+    for endpoint, samples in sorted(recorder.samples.items()):
+        values = sorted(samples)
+        endpoints[endpoint] = {
+            'requests': len(values),
+            'errors': recorder.errors[endpoint],
+            'statuses': dict(recorder.statuses[endpoint]),
+            'throughput_rps': round(len(values) / elapsed, 2),
+            'mean_ms': round(sum(values) / len(values) * 1000, 2),
+            'p50_ms': round(percentile(values, 50) * 1000, 2),
+            'p95_ms': round(percentile(values, 95) * 1000, 2),
+            'p99_ms': round(percentile(values, 99) * 1000, 2),
+            'max_ms': round(values[-1] * 1000, 2),
+        }
+    total = sum(e['requests'] for e in endpoints.values())
+    return {
+        'elapsed_seconds': round(elapsed, 2),
+        'total_requests': total,
+        'total_errors': sum(e['errors'] for e in endpoints.values()),
+        'throughput_rps': round(total / elapsed, 2) if elapsed else 0.0,
+        'endpoints': endpoints,
+    }
+
+
+def run(base_url: str, patients: list, scenarios: list, users: int, duration: float, seed: int) -> dict:
+    """Run `users` virtual users round-robin over the scenarios for `duration` seconds"""
+    recorder = Recorder()
+    deadline = time.perf_counter() + duration
+
+    def user(n: int):
+        rng = random.Random(seed + n)
+        scenario = SCENARIOS[scenarios[n % len(scenarios)]]
+        client = Client(base_url, recorder)
+        state = {}
+        try:
+            while time.perf_counter() < deadline:
+                scenario(client, patients, rng, state)
+        finally:
+            client.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(user, range(users)))
+    return summarize(recorder, time.perf_counter() - started)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_report(results: dict):
+    summary = results['summary']
+    print(f"\n📊 {summary['total_requests']} requests in {summary['elapsed_seconds']}s "
+          f"({summary['throughput_rps']} req/s, {summary['total_errors']} errors)\n")
+    print(f"{'endpoint':<42}{'reqs':>7}{'err':>5}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for endpoint, stats in summary['endpoints'].items():
+        print(f"{endpoint:<42}{stats['requests']:>7}{stats['errors']:>5}{stats['throughput_rps']:>9.1f}"
+              f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}")
+
+
+def compare(old_path: str, new_path: str):
+    """Per-endpoint p50/p95 and throughput change between two result files"""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    def change(a, b):
+        return f"{(b - a) / a * 100:+.0f}%" if a else 'n/a'
+
+    print(f"{old['commit']} ({old['started_at']}) -> {new['commit']} ({new['started_at']})\n")
+    print(f"{'endpoint':<42}{'p50 ms':>18}{'p95 ms':>18}{'req/s':>18}")
+    old_endpoints = old['summary']['endpoints']
+    for endpoint, b in new['summary']['endpoints'].items():
+        a = old_endpoints.get(endpoint)
+        if not a:
+            print(f"{endpoint:<42}{'(new)':>18}")
+            continue
+        print(f"{endpoint:<42}"
+              f"{a['p50_ms']:>8.1f}→{b['p50_ms']:<6.1f}{change(a['p50_ms'], b['p50_ms']):>4}"
+              f"{a['p95_ms']:>8.1f}→{b['p95_ms']:<6.1f}{change(a['p95_ms'], b['p95_ms']):>4}"
+              f"{a['throughput_rps']:>8.1f}→{b['throughput_rps']:<6.1f}"
+              f"{change(a['throughput_rps'], b['throughput_rps']):>4}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help="repeatable; default: all scenarios mixed")
+    parser.add_argument('--users', type=int, default=8, help="concurrent virtual users")
+    parser.add_argument('--duration', type=float, default=30, help="seconds of load")
+    parser.add_argument('--patients', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=1, help="uvicorn workers (local server only)")
+    parser.add_argument('--url', help="target an already running server instead of starting one")
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help="extra server environment (local server only), e.g. FAKE_LLM_PROFILE=...")
+    parser.add_argument('--output', help="results file (default: benchmarks/results/loadtest-<commit>-<time>.json)")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    scenarios = args.scenario or sorted(SCENARIOS)
+    extra_env = dict(item.split('=', 1) for item in args.env)
+    started_at = datetime.utcnow()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        process = None
+        base_url = args.url
+        if not base_url:
+            process, base_url = start_server(workdir, args.workers, extra_env)
+        try:
+            print(f"🏥 Registering {args.patients} patients on {base_url}...")
+            patients = register_patients(base_url, args.patients, args.seed)
+            print(f"🚀 {args.users} users x {args.duration:.0f}s: {', '.join(scenarios)}")
+            summary = run(base_url, patients, scenarios, args.users, args.duration, args.seed)
+        finally:
+            if process:
+                process.terminate()
+                process.wait(timeout=30)
+
+    results = {
+        'commit': git_commit(),
+        'started_at': started_at.isoformat(),
+        'config': {
+            'scenarios': scenarios, 'users': args.users, 'duration': args.duration,
+            'patients': args.patients, 'seed': args.seed, 'workers': args.workers,
+            'url': args.url, 'server_env': {**FAKE_ENV, **extra_env} if not args.url else None,
+        },
+        'summary': summary,
+    }
+    print_report(results)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"loadtest-{results['commit']}-{started_at.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n💾 Results saved to {output}")
+
+
+if __name__ == '__main__':
+    main()
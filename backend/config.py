@@ -29,6 +29,98 @@ class Settings:
     
     # Gemini API
     GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+    LLM_MIN_INTERVAL_SECONDS = float(os.getenv('LLM_MIN_INTERVAL_SECONDS', '5'))  # client-side spacing
+    LLM_RATE_LIMIT_BACKOFF_SECONDS = float(os.getenv('LLM_RATE_LIMIT_BACKOFF_SECONDS', '60'))  # x attempt on 429
+    LLM_DAILY_REQUEST_QUOTA = int(os.getenv('LLM_DAILY_REQUEST_QUOTA', '1500'))  # provider requests/day, 0 = unlimited
+    
+    # Model routing: fast tier for guidance/plans, strong tier for triage; models are tried in order,
+    # falling back on 429 / provider errors and skipping a model that is over its tier's latency budget
+    LLM_FAST_MODELS = os.getenv('LLM_FAST_MODELS', 'gemini-1.5-flash-8b,gemini-1.5-flash')
+    LLM_STRONG_MODELS = os.getenv('LLM_STRONG_MODELS', 'gemini-1.5-pro,gemini-1.5-flash')
+    LLM_STRONG_CAPABILITIES = os.getenv('LLM_STRONG_CAPABILITIES', 'analyze_vitals,recommend_doctor,assess_wound')
+    LLM_FAST_LATENCY_BUDGET_SECONDS = float(os.getenv('LLM_FAST_LATENCY_BUDGET_SECONDS', '5'))
+    LLM_STRONG_LATENCY_BUDGET_SECONDS = float(os.getenv('LLM_STRONG_LATENCY_BUDGET_SECONDS', '15'))
+    LLM_MODEL_COOLDOWN_SECONDS = float(os.getenv('LLM_MODEL_COOLDOWN_SECONDS', '60'))  # after a 429 / slow spell
+    
+    # Hedged requests: a second call when the first is slower than recent latency (off when no capabilities)
+    LLM_HEDGE_CAPABILITIES = os.getenv('LLM_HEDGE_CAPABILITIES', '')  # e.g. analyze_vitals
+    LLM_HEDGE_PERCENTILE = float(os.getenv('LLM_HEDGE_PERCENTILE', '0.95'))  # of the recent latency window
+    LLM_HEDGE_WINDOW = int(os.getenv('LLM_HEDGE_WINDOW', '200'))  # recent successful calls per capability
+    LLM_HEDGE_MIN_SAMPLES = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', '20'))  # below this the default delay is used
+    LLM_HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv('LLM_HEDGE_DEFAULT_DELAY_SECONDS', '3'))
+    LLM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv('LLM_HEDGE_MIN_DELAY_SECONDS', '0.5'))
+    LLM_HEDGE_MAX_RATIO = float(os.getenv('LLM_HEDGE_MAX_RATIO', '0.1'))  # hedges per eligible call (quota guard)
+    LLM_HEDGE_RATIO_WINDOW_SECONDS = float(os.getenv('LLM_HEDGE_RATIO_WINDOW_SECONDS', '3600'))  # calls the ratio is taken over
+    LLM_HEDGE_MAX_WORKERS = int(os.getenv('LLM_HEDGE_MAX_WORKERS', '8'))
+    
+    # Deadlines: per-endpoint time budgets; when a model call no longer fits, a provisional
+    # (cached or rule-based) answer is returned and refined in the background
+    VITALS_RECORD_BUDGET_SECONDS = float(os.getenv('VITALS_RECORD_BUDGET_SECONDS', '20'))  # 0 = unbounded
+    LLM_DEADLINE_MIN_CALL_SECONDS = float(os.getenv('LLM_DEADLINE_MIN_CALL_SECONDS', '2'))  # assumed call time
+    DEADLINE_MAX_WORKERS = int(os.getenv('DEADLINE_MAX_WORKERS', '16'))
+    VITALS_REFINE_ENABLED = os.getenv('VITALS_REFINE_ENABLED', 'true').lower() == 'true'
+    VITALS_REFINE_MAX_WORKERS = int(os.getenv('VITALS_REFINE_MAX_WORKERS', '2'))
+    # On-call doctor alerted when a refinement upgrades a provisional assessment to CRITICAL
+    CRITICAL_ALERT_PHONE = os.getenv('CRITICAL_ALERT_PHONE', '')
+    CRITICAL_ALERT_EMAIL = os.getenv('CRITICAL_ALERT_EMAIL', '')
+    
+    # Provider backends: real services, or offline fakes ('fake') for load tests
+    LLM_BACKEND = os.getenv('LLM_BACKEND', 'gemini')  # gemini, fake
+    SMS_BACKEND = os.getenv('SMS_BACKEND', 'twilio')  # twilio, fake
+    EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'smtp')  # smtp, fake (local SMTP sink)
+    # Fake behaviour: latency=fixed:MS | uniform:MIN:MAX | lognormal:MEDIAN:SIGMA,
+    # error_rate=P, rate_limit_rate=P (429), seed=N
+    FAKE_LLM_PROFILE = os.getenv('FAKE_LLM_PROFILE', 'latency=lognormal:800:0.4')
+    FAKE_LLM_MODEL_PROFILES = os.getenv('FAKE_LLM_MODEL_PROFILES', '')  # per model: 'MODEL@PROFILE;MODEL@PROFILE'
+    FAKE_SMS_PROFILE = os.getenv('FAKE_SMS_PROFILE', 'latency=lognormal:150:0.3')
+    FAKE_SMTP_PROFILE = os.getenv('FAKE_SMTP_PROFILE', 'latency=fixed:20')
+    
+    # Startup: build SDK clients in the background once the app is serving
+    STARTUP_WARMUP = os.getenv('STARTUP_WARMUP', 'true').lower() == 'true'
+    
+    # Metrics: Prometheus text format on /metrics (HTTP middleware + SQL timing)
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    
+    # Tracing: per-request spans (X-Request-ID), written as OTLP/JSON lines
+    TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'true').lower() == 'true'
+    TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '1.0'))  # fraction of traces exported
+    TRACE_EXPORT_PATH = os.getenv('TRACE_EXPORT_PATH', './traces/spans.jsonl')
+    TRACE_MAX_FILE_MB = float(os.getenv('TRACE_MAX_FILE_MB', '100'))  # then rotated to .1
+    TRACE_MAX_SPANS = int(os.getenv('TRACE_MAX_SPANS', '500'))  # per trace (exports run many queries)
+    TRACE_ATTACH_TIMINGS = os.getenv('TRACE_ATTACH_TIMINGS', 'false').lower() == 'true'  # into assessment_data
+    
+    # LLM usage accounting (llm_usage table, written behind like the audit log)
+    LLM_USAGE_ENABLED = os.getenv('LLM_USAGE_ENABLED', 'true').lower() == 'true'
+    LLM_USAGE_BATCH_SIZE = int(os.getenv('LLM_USAGE_BATCH_SIZE', '100'))
+    
+    # Wound assessment cache: reuse a stored assessment for a near-identical description
+    WOUND_CACHE_ENABLED = os.getenv('WOUND_CACHE_ENABLED', 'true').lower() == 'true'
+    WOUND_CACHE_THRESHOLD = float(os.getenv('WOUND_CACHE_THRESHOLD', '0.7'))  # Jaccard similarity of token sets
+    WOUND_CACHE_REFRESH_SECONDS = float(os.getenv('WOUND_CACHE_REFRESH_SECONDS', '60'))  # pick up other workers' rows
+    
+    # Precomputed guidance: IV / diet / exercise answers generated off-peak and loaded at startup
+    GUIDANCE_PRECOMPUTE_ENABLED = os.getenv('GUIDANCE_PRECOMPUTE_ENABLED', 'true').lower() == 'true'
+    GUIDANCE_PRECOMPUTE_HOUR = int(os.getenv('GUIDANCE_PRECOMPUTE_HOUR', '3'))  # UTC, off-peak
+    GUIDANCE_PRECOMPUTE_MAX_CALLS = int(os.getenv('GUIDANCE_PRECOMPUTE_MAX_CALLS', '60'))  # per run
+    GUIDANCE_QUOTA_RESERVE = float(os.getenv('GUIDANCE_QUOTA_RESERVE', '0.5'))  # share of the daily quota kept for live traffic
+    GUIDANCE_TOP_DIAGNOSES = int(os.getenv('GUIDANCE_TOP_DIAGNOSES', '10'))  # most common on the census
+    GUIDANCE_EXTRA_DIAGNOSES = os.getenv('GUIDANCE_EXTRA_DIAGNOSES', 'Diabetes,Hypertension,Heart Failure,COPD,Pneumonia')
+    GUIDANCE_IV_PROCEDURES = os.getenv('GUIDANCE_IV_PROCEDURES', 'IV,Injection,Drip')
+    GUIDANCE_REFRESH_SECONDS = float(os.getenv('GUIDANCE_REFRESH_SECONDS', '300'))  # pick up the leader's runs
+    
+    # Diagnosis normalization: free text -> condition code (typo tolerance for the fuzzy fallback)
+    DIAGNOSIS_FUZZY_CUTOFF = float(os.getenv('DIAGNOSIS_FUZZY_CUTOFF', '0.85'))  # difflib similarity ratio
+    
+    # Local triage classifier: answers confident analyze_vitals cases without a model call (needs numpy)
+    TRIAGE_MODEL_ENABLED = os.getenv('TRIAGE_MODEL_ENABLED', 'true').lower() == 'true'
+    TRIAGE_MODEL_DIR = os.getenv('TRIAGE_MODEL_DIR', './triage_models')
+    TRIAGE_MODEL_MIN_CONFIDENCE = float(os.getenv('TRIAGE_MODEL_MIN_CONFIDENCE', '0.9'))  # below: ask Gemini
+    TRIAGE_MODEL_MIN_ACCURACY = float(os.getenv('TRIAGE_MODEL_MIN_ACCURACY', '0.95'))  # on confident holdout answers, to activate
+    TRIAGE_MODEL_MAX_UNDER_TRIAGE = int(os.getenv('TRIAGE_MODEL_MAX_UNDER_TRIAGE', '0'))  # confident holdout answers below the label
+    TRIAGE_MODEL_MIN_CONFIDENT = int(os.getenv('TRIAGE_MODEL_MIN_CONFIDENT', '20'))  # confident holdout answers, to activate
+    TRIAGE_MODEL_MIN_COVERAGE = float(os.getenv('TRIAGE_MODEL_MIN_COVERAGE', '0.2'))  # share of holdout answered locally
+    TRIAGE_MODEL_MIN_SAMPLES = int(os.getenv('TRIAGE_MODEL_MIN_SAMPLES', '200'))  # labelled assessments needed to train
+    TRIAGE_MODEL_REFRESH_SECONDS = float(os.getenv('TRIAGE_MODEL_REFRESH_SECONDS', '60'))  # pick up newly activated versions
     
     # Admin Password
     ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'admin123')
@@ -42,8 +134,71 @@ class Settings:
     SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
     SMTP_USERNAME = os.getenv('SMTP_USERNAME', '')
     SMTP_PASSWORD = os.getenv('SMTP_PASSWORD', '')
+    SMTP_USE_TLS = os.getenv('SMTP_USE_TLS', 'true').lower() == 'true'
+    SMTP_TIMEOUT_SECONDS = float(os.getenv('SMTP_TIMEOUT_SECONDS', '30'))
+    SMTP_POOL_SIZE = int(os.getenv('SMTP_POOL_SIZE', '3'))
+    SMTP_POOL_MAX_IDLE_SECONDS = float(os.getenv('SMTP_POOL_MAX_IDLE_SECONDS', '60'))
+    SMTP_POOL_MAX_MESSAGES = int(os.getenv('SMTP_POOL_MAX_MESSAGES', '100'))
+    
+    # Notification dispatch (scheduler fan-out, matched to provider limits)
+    DISPATCH_MAX_WORKERS = int(os.getenv('DISPATCH_MAX_WORKERS', '16'))
+    # Processes sending notifications (web workers, each runs the outbox); the rates below are
+    # account-wide and split evenly between them
+    DISPATCH_PROCESSES = int(os.getenv('DISPATCH_PROCESSES', os.getenv('WEB_CONCURRENCY', '1')))
+    SMS_MAX_CONCURRENCY = int(os.getenv('SMS_MAX_CONCURRENCY', '4'))
+    SMS_RATE_PER_SECOND = float(os.getenv('SMS_RATE_PER_SECOND', '1'))  # Twilio long code: 1 msg/s
+    SMS_RATE_BURST = int(os.getenv('SMS_RATE_BURST', '1'))
+    EMAIL_MAX_CONCURRENCY = int(os.getenv('EMAIL_MAX_CONCURRENCY', '3'))
+    EMAIL_RATE_PER_SECOND = float(os.getenv('EMAIL_RATE_PER_SECOND', '10'))
+    EMAIL_RATE_BURST = int(os.getenv('EMAIL_RATE_BURST', '5'))
+    
+    # Notification outbox (asynchronous delivery with retries)
+    OUTBOX_POLL_INTERVAL_SECONDS = float(os.getenv('OUTBOX_POLL_INTERVAL_SECONDS', '2'))
+    OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '100'))
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '6'))
+    OUTBOX_BACKOFF_BASE_SECONDS = float(os.getenv('OUTBOX_BACKOFF_BASE_SECONDS', '30'))
+    OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv('OUTBOX_BACKOFF_MAX_SECONDS', '3600'))
+    OUTBOX_LEASE_SECONDS = int(os.getenv('OUTBOX_LEASE_SECONDS', '300'))
+    OUTBOX_EMAIL_BATCH_SIZE = int(os.getenv('OUTBOX_EMAIL_BATCH_SIZE', '20'))  # emails pipelined over one SMTP session
+    
+    # SMS coalescing: reminders to one phone within the window go out as one SMS
+    SMS_COALESCE_WINDOW_SECONDS = float(os.getenv('SMS_COALESCE_WINDOW_SECONDS', '60'))  # 0 = off
+    SMS_MAX_SEGMENTS = int(os.getenv('SMS_MAX_SEGMENTS', '3'))
+    
+    # Scheduler jobs (patients streamed and enqueued in chunks)
+    SCHEDULER_BATCH_SIZE = int(os.getenv('SCHEDULER_BATCH_SIZE', '500'))
+    
+    # Reminder schedules (due rows are polled every tick)
+    REMINDER_TICK_SECONDS = int(os.getenv('REMINDER_TICK_SECONDS', '60'))
+    REMINDER_DEFAULT_TIMES = os.getenv('REMINDER_DEFAULT_TIMES', '08:00,14:00,20:00')  # medication, new patients
+    REMINDER_DEFAULT_TIMEZONE = os.getenv('REMINDER_DEFAULT_TIMEZONE', 'UTC')
+    
+    # Scheduler leadership: 'leader' = elect one process via a lease row,
+    # 'off' = never run jobs here (use `python scheduler.py` as a dedicated process)
+    SCHEDULER_MODE = os.getenv('SCHEDULER_MODE', 'leader')
+    SCHEDULER_LEASE_SECONDS = float(os.getenv('SCHEDULER_LEASE_SECONDS', '30'))
+    # Late runs still fire this long after their time; above lease expiry + a renewal, so jobs due
+    # while a failed leader's lease ran out still run on the process that takes over
+    SCHEDULER_MISFIRE_GRACE_SECONDS = int(os.getenv('SCHEDULER_MISFIRE_GRACE_SECONDS', '300'))
     
     # Rate Limiting
     MAX_REQUESTS_PER_MINUTE = int(os.getenv('MAX_REQUESTS_PER_MINUTE', '60'))
+    
+    # Data Export
+    EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '1000'))
+    
+    # Audit Log (write-behind batching)
+    AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', '200'))
+    AUDIT_FLUSH_INTERVAL_SECONDS = float(os.getenv('AUDIT_FLUSH_INTERVAL_SECONDS', '1.0'))
+    AUDIT_MAX_QUEUE = int(os.getenv('AUDIT_MAX_QUEUE', '5000'))
+    AUDIT_SEGMENT_DIR = os.getenv('AUDIT_SEGMENT_DIR', './audit_segments')
+    AUDIT_SEGMENT_FSYNC = os.getenv('AUDIT_SEGMENT_FSYNC', 'false').lower() == 'true'
+    
+    # Audit Log partitioning & retention (0 = keep forever)
+    AUDIT_RETENTION_MONTHS = int(os.getenv('AUDIT_RETENTION_MONTHS', '0'))
+    AUDIT_ARCHIVE_DIR = os.getenv('AUDIT_ARCHIVE_DIR', '')
+    AUDIT_PRECREATE_MONTHS = int(os.getenv('AUDIT_PRECREATE_MONTHS', '1'))
+    AUDIT_COMPACT_BATCH_SIZE = int(os.getenv('AUDIT_COMPACT_BATCH_SIZE', '5000'))
+    AUDIT_PARTITION_REFRESH_SECONDS = float(os.getenv('AUDIT_PARTITION_REFRESH_SECONDS', '60'))  # re-list partitions made/dropped elsewhere
 
 settings = Settings()
\ No newline at end of file
@@ -3,10 +3,15 @@
 Database connection and session management
 """
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, func, inspect, select, text
 from sqlalchemy.orm import sessionmaker, Session
 from models import Base
+from config import settings
+from metrics import db_latency, statement_kind
+import tracing
 import os
+import time
+from datetime import datetime
 
 # Database URL (SQLite for development, easy to switch to PostgreSQL)
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///./nurse_triage.db')
@@ -21,12 +26,87 @@ engine = create_engine(
     connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
 )
 
+# SQL timing for /metrics and tracing: (start, span) pushed per cursor execution, popped when it returns
+if settings.METRICS_ENABLED or settings.TRACING_ENABLED:
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        kind = statement_kind(statement)
+        query_span = tracing.start_span(f"db.{kind}", **{'db.statement': statement[:200]})
+        conn.info.setdefault('query_started', []).append((time.perf_counter(), kind, query_span))
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started, kind, query_span = conn.info['query_started'].pop()
+        if settings.METRICS_ENABLED:
+            db_latency.observe(time.perf_counter() - started, kind)
+        if query_span is not None:
+            query_span.finish()
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(context):
+        # Failed statements never reach after_cursor_execute
+        stack = context.connection.info.get('query_started') if context.connection is not None else None
+        if stack:
+            _, _, query_span = stack.pop()
+            if query_span is not None:
+                query_span.fail(context.original_exception)
+                query_span.finish()
+
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def db_utcnow(db: Session) -> datetime:
+    """
+    Current UTC time by the database's clock (naive, like the DateTime columns).
+    Use it for comparisons across processes: host clocks can disagree.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return db.execute(text("SELECT now() AT TIME ZONE 'utc'")).scalar()
+    if dialect == 'sqlite':
+        # 'now' is UTC; %f gives milliseconds
+        return datetime.fromisoformat(db.execute(text("SELECT strftime('%Y-%m-%d %H:%M:%f', 'now')")).scalar())
+    return db.execute(select(func.now())).scalar()
+
+def add_missing_columns():
+    """
+    Additive migration for databases created before a column was added to a
+    model: create_all() never alters existing tables, so missing columns are
+    added here (nullable, ALTER TABLE ... ADD COLUMN) together with the
+    table's indexes
+    """
+    inspector = inspect(engine)
+    existing = set(inspector.get_table_names())
+    quote = engine.dialect.identifier_preparer.quote
+    
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing:
+                continue
+            present = {c['name'] for c in inspector.get_columns(table.name)}
+            missing = [c for c in table.columns if c.name not in present]
+            for column in missing:
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column_type}"))
+                print(f"🔧 Added column {table.name}.{column.name}")
+            if missing:
+                for index in table.indexes:
+                    index.create(conn, checkfirst=True)
+
 def init_db():
     """Initialize database - create all tables"""
+    from audit_partitions import audit_partitions
+    from diagnoses import backfill_codes
+    
+    # PostgreSQL: audit_logs must be created as a partitioned table up front
+    audit_partitions.create_parent()
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+    audit_partitions.setup()
+    
+    coded = backfill_codes()
+    if coded:
+        print(f"🩺 Normalized {coded} patient diagnoses")
     print("✅ Database initialized successfully!")
 
 def get_db():
@@ -39,6 +119,11 @@ def get_db():
 
 def reset_db():
     """Reset database - drop and recreate all tables"""
+    from audit_partitions import audit_partitions
+    
+    audit_partitions.drop_all()
     Base.metadata.drop_all(bind=engine)
+    audit_partitions.create_parent()
     Base.metadata.create_all(bind=engine)
+    audit_partitions.setup()
     print("🔄 Database reset successfully!")
\ No newline at end of file
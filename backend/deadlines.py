@@ -0,0 +1,89 @@
+"""
+Deadlines - End-to-end time budgets for a request
+An endpoint opens a budget with deadline(seconds); code below it (agent
+calls, rate-limit waits) checks remaining() and raises DeadlineExceeded
+instead of starting work the budget can't cover. The budget is a context
+variable, so it follows the request into worker threads started with
+copy_context().
+"""
+
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from config import settings
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar('deadline', default=None)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+class DeadlineExceeded(Exception):
+    """The remaining budget can't cover the next step"""
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """Run the block with a time budget (nested budgets keep the earlier deadline; None/0 = no budget)"""
+    if not seconds or seconds <= 0:
+        yield
+        return
+    at = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(min(at, current) if current is not None else at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current budget (None when there is no budget)"""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def check(needed: float, what: str):
+    """Raise DeadlineExceeded if `needed` seconds don't fit in the budget"""
+    left = remaining()
+    if left is not None and left < needed:
+        raise DeadlineExceeded(f"{what} needs ~{needed:.1f}s, {max(left, 0.0):.1f}s left")
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.DEADLINE_MAX_WORKERS,
+                                               thread_name_prefix='deadline')
+    return _executor
+
+
+def run_within(fn: Callable, what: str):
+    """
+    Call fn() but stop waiting when the budget runs out
+    Without a budget fn runs inline. With one it runs on a worker thread; a
+    blocking call that overruns can't be interrupted, so it finishes there
+    and its result is discarded.
+    """
+    left = remaining()
+    if left is None:
+        return fn()
+    future = _pool().submit(contextvars.copy_context().run, fn)
+    try:
+        return future.result(timeout=max(left, 0.0))
+    except FutureTimeout:
+        future.cancel()
+        raise DeadlineExceeded(f"{what} still running when the budget ran out")
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
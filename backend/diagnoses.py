@@ -0,0 +1,286 @@
+"""
+Diagnosis Normalization - Free-text diagnoses to canonical condition codes
+A local synonym/abbreviation dictionary (ICD-10 category codes) matched on
+word n-grams, with typo-tolerant fuzzy matching as a fallback. The code is
+stored on the patient (patients.diagnosis_code, indexed) so ward queries
+can group by condition and agent caches can key on it. Negated mentions
+("no history of MI", "PE ruled out") are not coded.
+
+Recompute every patient's code after editing the dictionary:
+    python diagnoses.py --all
+"""
+
+import difflib
+import logging
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import or_, select, update
+
+from config import settings
+from database import SessionLocal
+from models import Patient
+
+logger = logging.getLogger(__name__)
+
+UNMAPPED = 'UNMAPPED'
+
+# code -> (label, synonyms); synonyms are matched as whole words after normalize_text()
+CONDITIONS: Dict[str, Tuple[str, List[str]]] = {
+    'I21': ('Myocardial infarction', [
+        'myocardial infarction', 'mi', 'ami', 'stemi', 'nstemi', 'heart attack', 'cardiac infarction']),
+    'I24': ('Acute coronary syndrome', ['acute coronary syndrome', 'acs']),
+    'I20': ('Angina', ['angina', 'unstable angina', 'stable angina', 'cardiac chest pain']),
+    'I50': ('Heart failure', [
+        'heart failure', 'chf', 'ccf', 'hf', 'congestive heart failure', 'congestive cardiac failure',
+        'cardiac failure', 'lvf', 'left ventricular failure']),
+    'I48': ('Atrial fibrillation', ['atrial fibrillation', 'af', 'afib', 'a fib', 'fast af']),
+    'I10': ('Hypertension', ['hypertension', 'htn', 'high blood pressure', 'hbp']),
+    'I63': ('Stroke', [
+        'stroke', 'cva', 'cerebrovascular accident', 'cerebral infarction', 'ischemic stroke',
+        'ischaemic stroke']),
+    'G45': ('Transient ischemic attack', [
+        'tia', 'transient ischemic attack', 'transient ischaemic attack', 'mini stroke']),
+    'I26': ('Pulmonary embolism', ['pulmonary embolism', 'pulmonary embolus', 'pe']),
+    'I80': ('Deep vein thrombosis', ['deep vein thrombosis', 'deep venous thrombosis', 'dvt']),
+    'E11': ('Type 2 diabetes', [
+        'type 2 diabetes', 'type ii diabetes', 'diabetes type 2', 'diabetes mellitus type 2',
+        'type 2 diabetes mellitus', 't2dm', 'dm2', 'dm type 2', 'type 2 dm', 'type ii dm', 'niddm']),
+    'E10': ('Type 1 diabetes', [
+        'type 1 diabetes', 'type i diabetes', 'diabetes type 1', 'diabetes mellitus type 1',
+        'type 1 diabetes mellitus', 't1dm', 'dm1', 'dm type 1', 'type 1 dm', 'type i dm', 'iddm', 'dka',
+        'diabetic ketoacidosis']),
+    'E14': ('Diabetes', ['diabetes', 'diabetes mellitus', 'dm', 'diabetic', 'hyperglycemia', 'hyperglycaemia']),
+    'E86': ('Dehydration', ['dehydration', 'dehydrated', 'volume depletion']),
+    'J44': ('COPD', [
+        'copd', 'aecopd', 'chronic obstructive pulmonary disease', 'chronic obstructive airways disease',
+        'coad', 'emphysema', 'chronic bronchitis']),
+    'J45': ('Asthma', ['asthma', 'asthmatic', 'acute asthma', 'status asthmaticus']),
+    'J18': ('Pneumonia', [
+        'pneumonia', 'community acquired pneumonia', 'hospital acquired pneumonia',
+        'aspiration pneumonia', 'lrti', 'lower respiratory tract infection', 'chest infection']),
+    'U07.1': ('COVID-19', ['covid', 'covid 19', 'sars cov 2', 'coronavirus']),
+    'A41': ('Sepsis', ['sepsis', 'septic shock', 'septicaemia', 'septicemia', 'urosepsis']),
+    'N39.0': ('Urinary tract infection', ['urinary tract infection', 'uti', 'cystitis']),
+    'N10': ('Pyelonephritis', ['pyelonephritis', 'kidney infection']),
+    'N17': ('Acute kidney injury', ['acute kidney injury', 'aki', 'acute renal failure', 'arf']),
+    'N18': ('Chronic kidney disease', [
+        'chronic kidney disease', 'ckd', 'chronic renal failure', 'crf', 'end stage renal disease', 'esrd']),
+    'L03': ('Cellulitis', ['cellulitis']),
+    'S72': ('Hip fracture', [
+        'hip fracture', 'fractured hip', 'fracture hip', 'fractured neck of femur', 'neck of femur fracture',
+        'nof fracture', 'fracture nof', 'fnof', 'femur fracture', 'fractured femur']),
+    'Z96.6': ('Joint replacement', [
+        'hip replacement', 'knee replacement', 'total hip replacement', 'total knee replacement',
+        'thr', 'tkr', 'arthroplasty']),
+    'M17': ('Knee osteoarthritis', ['knee osteoarthritis', 'osteoarthritis knee', 'knee oa', 'oa knee']),
+    'K35': ('Appendicitis', ['appendicitis', 'appendectomy', 'appendicectomy']),
+    'K80': ('Gallstone disease', [
+        'gallstones', 'gallstone', 'cholelithiasis', 'cholecystitis', 'cholecystectomy', 'biliary colic']),
+    'K85': ('Acute pancreatitis', ['pancreatitis', 'acute pancreatitis']),
+    'K92.2': ('Gastrointestinal bleed', [
+        'gi bleed', 'gastrointestinal bleed', 'gastrointestinal haemorrhage', 'gastrointestinal hemorrhage',
+        'upper gi bleed', 'lower gi bleed', 'ugib', 'lgib', 'melaena', 'melena', 'haematemesis', 'hematemesis']),
+    'G40': ('Epilepsy / seizures', ['epilepsy', 'seizure', 'seizures', 'fits']),
+    'F03': ('Dementia', ['dementia', 'alzheimer', 'alzheimers', 'alzheimer disease']),
+    'F05': ('Delirium', ['delirium', 'acute confusion', 'acute confusional state']),
+    'R55': ('Syncope', ['syncope', 'faint', 'fainting', 'collapsed']),
+    'W19': ('Fall', ['mechanical fall', 'fall at home', 'had a fall', 'fell', 's p fall', 'post fall']),
+    'C80': ('Malignancy', ['cancer', 'malignancy', 'carcinoma', 'tumour', 'tumor', 'metastatic']),
+}
+
+MAX_NGRAM = 6
+# Symptoms (R), external causes (W) and status codes (Z): a disease mentioned alongside wins
+SECONDARY_PREFIXES = ('R', 'W', 'Z')
+# Tokens shorter than this are abbreviations: exact match only, never fuzzy-corrected
+FUZZY_MIN_LENGTH = 5
+
+# Negation (NegEx-style): a cue up to NEGATION_WINDOW tokens before a mention, or a
+# closing cue right after it, in the same clause. Cues are in normalize_text() form.
+NEGATION_WINDOW = 5
+PRE_NEGATION = [('no',), ('not',), ('denies',), ('denied',), ('deny',), ('without',), ('negative', 'for'),
+                ('r', 'o'), ('rule', 'out'), ('ruled', 'out'), ('free', 'of'), ('absence', 'of')]
+POST_NEGATION = [('ruled', 'out'), ('excluded',), ('negative',), ('unlikely',)]
+CLAUSE_BREAK = re.compile(r'[,.;:\n]|\b(?:but|however|although|except)\b', re.IGNORECASE)
+
+
+def normalize_text(text: str) -> List[str]:
+    """Lowercase word tokens; '#' (fracture shorthand) expanded, punctuation dropped"""
+    text = str(text).lower().replace('#', ' fracture ').replace("'s", '')
+    return re.findall(r'[a-z]+|\d+', text)
+
+
+def _build_index():
+    phrases: Dict[Tuple[str, ...], str] = {}
+    for code, (_, synonyms) in CONDITIONS.items():
+        for synonym in synonyms:
+            phrases[tuple(normalize_text(synonym))] = code
+    vocabulary = sorted({token for phrase in phrases for token in phrase if len(token) >= FUZZY_MIN_LENGTH})
+    spelled = {' '.join(phrase): code for phrase, code in phrases.items() if len(' '.join(phrase)) >= FUZZY_MIN_LENGTH}
+    return phrases, vocabulary, spelled
+
+
+_PHRASES, _VOCABULARY, _SPELLED = _build_index()
+
+
+def _contains(tokens: List[str], cues: List[Tuple[str, ...]]) -> bool:
+    return any(tuple(tokens[i:i + len(cue)]) == cue for cue in cues for i in range(len(tokens) - len(cue) + 1))
+
+
+def _negated(tokens: List[str], start: int, end: int) -> bool:
+    """Whether the mention tokens[start:end] is negated within its clause"""
+    return (_contains(tokens[max(0, start - NEGATION_WINDOW):start], PRE_NEGATION)
+            or _contains(tokens[end:end + 2], POST_NEGATION))
+
+
+def _primary_phrase(clauses: List[List[str]]) -> Tuple[Optional[Tuple[str, Tuple[str, ...]]],
+                                                       Optional[Tuple[str, ...]]]:
+    """
+    Primary condition among the non-negated synonyms in the clauses: diseases
+    before SECONDARY_PREFIXES codes, then the longest, then the earliest
+    Returns:
+        ((code, phrase) or None, first negated phrase seen or None)
+    """
+    found, found_rank, negated = None, None, None
+    for tokens in clauses:
+        for start in range(len(tokens)):
+            for size in range(min(MAX_NGRAM, len(tokens) - start), 0, -1):
+                phrase = tuple(tokens[start:start + size])
+                code = _PHRASES.get(phrase)
+                if code is None:
+                    continue
+                if _negated(tokens, start, start + size):
+                    negated = negated or phrase
+                    continue
+                rank = (not code.startswith(SECONDARY_PREFIXES), size)
+                if found_rank is None or rank > found_rank:
+                    found, found_rank = (code, phrase), rank
+    return found, negated
+
+
+@lru_cache(maxsize=4096)
+def _match(text: str) -> Tuple[str, str, float, str]:
+    clauses = [tokens for tokens in (normalize_text(part) for part in CLAUSE_BREAK.split(text)) if tokens]
+    found, negated = _primary_phrase(clauses)
+    if found:
+        return found[0], 'exact', 1.0, ' '.join(found[1])
+
+    # Typos: correct long unknown tokens to the closest dictionary word, then retry
+    cutoff = settings.DIAGNOSIS_FUZZY_CUTOFF
+    corrected, scores = [], []
+    for tokens in clauses:
+        fixed = []
+        for token in tokens:
+            if len(token) >= FUZZY_MIN_LENGTH and token not in _VOCABULARY:
+                close = difflib.get_close_matches(token, _VOCABULARY, n=1, cutoff=cutoff)
+                if close:
+                    scores.append(difflib.SequenceMatcher(None, token, close[0]).ratio())
+                    token = close[0]
+            fixed.append(token)
+        corrected.append(fixed)
+    if scores:
+        found, fuzzy_negated = _primary_phrase(corrected)
+        if found:
+            return found[0], 'fuzzy', round(min(scores), 3), ' '.join(found[1])
+        negated = negated or fuzzy_negated
+
+    # Run-together or misspelled phrases ("heartattack", "pnuemonia"), whole clauses at a time
+    for tokens in clauses:
+        joined = ' '.join(tokens)
+        close = difflib.get_close_matches(joined, list(_SPELLED), n=1, cutoff=cutoff)
+        if close and not negated:
+            return (_SPELLED[close[0]], 'fuzzy',
+                    round(difflib.SequenceMatcher(None, joined, close[0]).ratio(), 3), close[0])
+
+    if negated:
+        return UNMAPPED, 'negated', 0.0, ' '.join(negated)
+    return UNMAPPED, 'none', 0.0, ''
+
+
+def normalize_diagnosis(text: Optional[str]) -> dict:
+    """
+    Map a free-text diagnosis to its canonical condition
+    Returns:
+        dict with code (UNMAPPED if nothing matched, or only negated
+        mentions), label, method (exact, fuzzy, negated, none), score and
+        the matched synonym
+    """
+    if not text or not str(text).strip():
+        return {'code': UNMAPPED, 'label': None, 'method': 'none', 'score': 0.0, 'matched': ''}
+    code, method, score, matched = _match(str(text).strip()[:500])
+    return {
+        'code': code,
+        'label': CONDITIONS[code][0] if code in CONDITIONS else None,
+        'method': method,
+        'score': score,
+        'matched': matched
+    }
+
+
+def diagnosis_code(text: Optional[str]) -> str:
+    """Canonical code for a diagnosis (UNMAPPED if nothing matched)"""
+    return normalize_diagnosis(text)['code']
+
+
+def condition_label(code: Optional[str]) -> Optional[str]:
+    return CONDITIONS[code][0] if code in CONDITIONS else None
+
+
+def backfill_codes(recode_all: bool = False, batch_size: Optional[int] = None) -> int:
+    """
+    Set diagnosis_code on patients that don't have one yet (and retry UNMAPPED
+    ones, in case the dictionary grew)
+    Args:
+        recode_all: recompute every patient (after editing the dictionary)
+    Returns:
+        number of patients updated
+    """
+    batch_size = batch_size or settings.SCHEDULER_BATCH_SIZE
+    db = SessionLocal()
+    updated = 0
+    last_id = 0
+    try:
+        while True:
+            query = select(Patient.id, Patient.diagnosis, Patient.diagnosis_code).where(
+                Patient.id > last_id
+            ).order_by(Patient.id).limit(batch_size)
+            if not recode_all:
+                query = query.where(or_(Patient.diagnosis_code.is_(None), Patient.diagnosis_code == UNMAPPED))
+            rows = db.execute(query).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            changes = []
+            for row in rows:
+                code = diagnosis_code(row.diagnosis)
+                if code != row.diagnosis_code:
+                    changes.append({'id': row.id, 'diagnosis_code': code})
+            if changes:
+                db.execute(update(Patient), changes)
+                db.commit()
+                updated += len(changes)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Diagnosis code backfill failed: {e}")
+    finally:
+        db.close()
+    return updated
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from database import init_db
+
+    parser = argparse.ArgumentParser(description="Normalize patient diagnoses to condition codes")
+    parser.add_argument('--all', action='store_true', help="recompute every patient, not just missing/unmapped")
+    parser.add_argument('text', nargs='*', help="show the match for this text instead")
+    args = parser.parse_args()
+
+    if args.text:
+        print(normalize_diagnosis(' '.join(args.text)))
+    else:
+        init_db()
+        print(f"🩺 Updated diagnosis codes for {backfill_codes(recode_all=args.all)} patients")
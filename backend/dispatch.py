@@ -0,0 +1,206 @@
+"""
+Dispatch Engine - Concurrent, paced notification fan-out
+Runs scheduler jobs across a worker pool while keeping each channel
+within its concurrency limit and provider throughput
+
+Limits are enforced per process. Every web worker runs an outbox drain, so
+the configured provider rates are account-wide totals split evenly over
+DISPATCH_PROCESSES (set it to the worker count, e.g. gunicorn -w); with
+fewer live processes than that the account is under-used, never over-sent.
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from typing import Callable, Iterable, Optional
+
+from config import settings
+from metrics import job_latency
+
+logger = logging.getLogger(__name__)
+
+# Set by Dispatcher.priority(): provider calls skip the concurrency and pacing queues
+_priority = contextvars.ContextVar('dispatch_priority', default=False)
+
+
+class RatePacer:
+    """Token bucket: spaces calls out to rate_per_second (0 = unlimited), in this process only"""
+
+    def __init__(self, rate_per_second: float, burst: int = 1):
+        self.rate = rate_per_second
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited_seconds = 0.0
+
+    def acquire(self, tokens: int = 1, wait: bool = True):
+        """
+        Block until `tokens` sends are allowed
+        Args:
+            wait: False takes the tokens without sleeping (priority sends); the
+                  debt delays the calls queued after it instead
+        """
+        if self.rate <= 0:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Reserve now, sleep outside the lock: callers queue up in order
+            self._tokens -= tokens
+            delay = -self._tokens / self.rate if self._tokens < 0 and wait else 0.0
+            self.waited_seconds += delay
+
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ChannelLimiter:
+    """Concurrency cap + rate pacing for one delivery channel (this process's share of the rate)"""
+
+    def __init__(self, name: str, max_concurrency: int, rate_per_second: float, burst: int = 1,
+                 processes: int = 1):
+        """
+        Args:
+            rate_per_second, burst: provider limits for the whole account
+            processes: processes sending on this account; each paces to its share
+        """
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.processes = max(processes, 1)
+        self.rate_per_second = rate_per_second
+        self.process_rate_per_second = rate_per_second / self.processes
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.pacer = RatePacer(self.process_rate_per_second, max(burst // self.processes, 1))
+
+    @contextmanager
+    def slot(self, tokens: int = 1):
+        """Hold a concurrency slot for the duration of a provider call"""
+        if _priority.get():
+            # Counted against the rate, but never queued behind paced batch work
+            self.pacer.acquire(tokens, wait=False)
+            yield
+            return
+        with self._slots:
+            self.pacer.acquire(tokens)
+            yield
+
+
+class Dispatcher:
+    """Fan scheduler jobs out over a thread pool and report on each run"""
+
+    def __init__(self):
+        """Initialize dispatcher"""
+        self.max_workers = settings.DISPATCH_MAX_WORKERS
+        self.processes = max(settings.DISPATCH_PROCESSES, 1)
+        self.channels = {
+            'sms': ChannelLimiter('sms', settings.SMS_MAX_CONCURRENCY, settings.SMS_RATE_PER_SECOND,
+                                  settings.SMS_RATE_BURST, self.processes),
+            'email': ChannelLimiter('email', settings.EMAIL_MAX_CONCURRENCY, settings.EMAIL_RATE_PER_SECOND,
+                                    settings.EMAIL_RATE_BURST, self.processes),
+        }
+        self.last_runs = deque(maxlen=20)
+
+    def limit(self, channel: str, tokens: int = 1):
+        """Context manager guarding one provider call on a channel"""
+        limiter = self.channels.get(channel)
+        return limiter.slot(tokens) if limiter else nullcontext()
+
+    def capacity(self, seconds: float) -> Optional[int]:
+        """Provider calls this process can pace out in `seconds` on its slowest channel (None = unpaced)"""
+        rates = [limiter.process_rate_per_second for limiter in self.channels.values()
+                 if limiter.process_rate_per_second > 0]
+        return int(min(rates) * seconds) if rates else None
+
+    @contextmanager
+    def priority(self):
+        """Provider calls in this block (this thread) jump the channel queues - critical alerts"""
+        token = _priority.set(True)
+        try:
+            yield
+        finally:
+            _priority.reset(token)
+
+    def run(self, job_name: str, tasks: Iterable[Callable[[], dict]]) -> dict:
+        """
+        Run delivery tasks concurrently
+        Args:
+            job_name: name for logs and reports
+            tasks: callables returning a notification result dict
+                   ({'sms': {'status': ...}, 'email': {...}})
+        Returns:
+            dict with duration and per-channel delivery counts
+        """
+        started_at = datetime.utcnow()
+        started = time.perf_counter()
+        deliveries = {}
+        task_count = 0
+        errors = 0
+        lock = threading.Lock()
+
+        # Bound in-flight work so a large (streamed) task list isn't all queued at once
+        in_flight = threading.BoundedSemaphore(self.max_workers * 2)
+
+        def record(future):
+            nonlocal errors
+            in_flight.release()
+            try:
+                result = future.result() or {}
+            except Exception as e:
+                logger.error(f"{job_name} task failed: {e}")
+                with lock:
+                    errors += 1
+                return
+
+            with lock:
+                for channel, outcome in result.items():
+                    status = outcome.get('status', 'unknown') if isinstance(outcome, dict) else 'unknown'
+                    counts = deliveries.setdefault(channel, {})
+                    counts[status] = counts.get(status, 0) + 1
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=job_name) as executor:
+            for task in tasks:
+                in_flight.acquire()
+                task_count += 1
+                executor.submit(task).add_done_callback(record)
+
+        duration = time.perf_counter() - started
+        job_latency.observe(duration, f"dispatch:{job_name}", 'error' if errors else 'ok')
+        report = {
+            'job': job_name,
+            'started_at': started_at.isoformat(),
+            'duration_seconds': round(duration, 3),
+            'tasks': task_count,
+            'errors': errors,
+            'deliveries': deliveries
+        }
+        self.last_runs.append(report)
+        return report
+
+    def stats(self) -> dict:
+        """Channel limits and recent run reports"""
+        return {
+            'max_workers': self.max_workers,
+            'processes': self.processes,
+            'channels': {
+                name: {
+                    'max_concurrency': limiter.max_concurrency,
+                    'rate_per_second': limiter.rate_per_second,
+                    'process_rate_per_second': round(limiter.process_rate_per_second, 4),
+                    'paced_wait_seconds': round(limiter.pacer.waited_seconds, 3)
+                }
+                for name, limiter in self.channels.items()
+            },
+            'last_runs': list(self.last_runs)
+        }
+
+
+# Global instance
+dispatcher = Dispatcher()
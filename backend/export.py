@@ -0,0 +1,241 @@
+"""
+Data Export - Streaming NDJSON/CSV
+Streams full tables for compliance and analytics pulls without
+loading them into memory
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Iterator, Optional
+
+from sqlalchemy import select
+
+from config import settings
+from database import SessionLocal
+from models import VitalSigns, Assessment, audit_log_view
+
+# Exportable datasets: name -> (table, time column used for range filters)
+# Audit logs are read through the union view over all monthly partitions.
+EXPORT_DATASETS = {
+    'vital_signs': (VitalSigns.__table__, 'recorded_at'),
+    'assessments': (Assessment.__table__, 'created_at'),
+    'audit_logs': (audit_log_view, 'timestamp'),
+}
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+
+# Flush encoded output to the client roughly every 64 KB
+CHUNK_SIZE = 64 * 1024
+
+
+def _serialize_value(value):
+    """Convert a column value to something JSON/CSV friendly"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def iter_table_rows(table, time_column: str,
+                    start: Optional[datetime] = None,
+                    end: Optional[datetime] = None,
+                    patient_id: Optional[str] = None,
+                    batch_size: Optional[int] = None) -> Iterator[dict]:
+    """
+    Stream rows of any table (or view) as plain dicts
+    Args:
+        table: SQLAlchemy table/view to read
+        time_column: column used for range filters and ordering
+        start: only rows at or after this time (optional)
+        end: only rows before this time (optional)
+        patient_id: only rows for this patient (optional)
+        batch_size: rows fetched per round trip
+    Yields:
+        dict per row
+    """
+    time_col = table.c[time_column]
+
+    query = select(table)
+    if start:
+        query = query.where(time_col >= start)
+    if end:
+        query = query.where(time_col < end)
+    if patient_id:
+        query = query.where(table.c.patient_id == patient_id)
+    query = query.order_by(time_col, table.c.id)
+
+    # Server-side cursor on PostgreSQL, chunked fetchmany() elsewhere.
+    # Core rows (not ORM objects) keep the identity map out of the picture.
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            query.execution_options(
+                stream_results=True,
+                yield_per=batch_size or settings.EXPORT_BATCH_SIZE
+            )
+        )
+        for row in result.mappings():
+            yield {key: _serialize_value(value) for key, value in row.items()}
+    finally:
+        db.close()
+
+
+def iter_rows(dataset: str, start: Optional[datetime] = None,
+              end: Optional[datetime] = None,
+              patient_id: Optional[str] = None,
+              batch_size: Optional[int] = None) -> Iterator[dict]:
+    """
+    Stream rows of a named dataset as plain dicts
+    Args:
+        dataset: one of EXPORT_DATASETS
+        start/end/patient_id/batch_size: see iter_table_rows()
+    Yields:
+        dict per row
+    """
+    if dataset not in EXPORT_DATASETS:
+        raise ValueError(f"Unknown dataset: {dataset}")
+
+    table, time_column = EXPORT_DATASETS[dataset]
+    return iter_table_rows(table, time_column, start=start, end=end,
+                           patient_id=patient_id, batch_size=batch_size)
+
+
+def _encode_ndjson(rows: Iterator[dict]) -> Iterator[str]:
+    """Encode rows as newline-delimited JSON"""
+    for row in rows:
+        yield json.dumps(row, default=str) + '\n'
+
+
+def _encode_csv(rows: Iterator[dict], columns: list) -> Iterator[str]:
+    """Encode rows as CSV (JSON columns are written as JSON strings)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([
+            json.dumps(row[col], default=str) if isinstance(row[col], (dict, list)) else row[col]
+            for col in columns
+        ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+    # Header only (empty export)
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def encode_stream(rows: Iterator[dict], fmt: str, columns: list,
+                  compress: bool = False) -> Iterator[bytes]:
+    """
+    Encode a row stream as NDJSON/CSV bytes, optionally gzipped
+    Args:
+        rows: row dicts, e.g. from iter_table_rows()
+        fmt: 'ndjson' or 'csv'
+        columns: column order (CSV header)
+        compress: gzip the output stream
+    Yields:
+        bytes chunks of roughly CHUNK_SIZE
+    """
+    if fmt == 'csv':
+        lines = _encode_csv(rows, columns)
+    else:
+        lines = _encode_ndjson(rows)
+
+    # wbits=31 -> gzip container, so the output is a valid .gz file
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    pending = []
+    pending_size = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        pending.append(data)
+        pending_size += len(data)
+
+        if pending_size >= CHUNK_SIZE:
+            chunk = b''.join(pending)
+            pending = []
+            pending_size = 0
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+
+    chunk = b''.join(pending)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def stream_export(dataset: str, fmt: str = 'ndjson', compress: bool = False,
+                  start: Optional[datetime] = None,
+                  end: Optional[datetime] = None,
+                  patient_id: Optional[str] = None) -> Iterator[bytes]:
+    """
+    Stream an encoded (and optionally gzipped) export
+    Args:
+        dataset: one of EXPORT_DATASETS
+        fmt: 'ndjson' or 'csv'
+        compress: gzip the output stream
+        start/end/patient_id: filters, see iter_table_rows()
+    Yields:
+        bytes chunks of roughly CHUNK_SIZE
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if dataset not in EXPORT_DATASETS:
+        raise ValueError(f"Unknown dataset: {dataset}")
+
+    table = EXPORT_DATASETS[dataset][0]
+    rows = iter_rows(dataset, start=start, end=end, patient_id=patient_id)
+    return encode_stream(rows, fmt, [col.name for col in table.columns], compress)
+
+
+def export_filename(dataset: str, fmt: str, compress: bool) -> str:
+    """Build a download filename for an export"""
+    stamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+    name = f"{dataset}_{stamp}.{fmt}"
+    return f"{name}.gz" if compress else name
+
+
+def export_media_type(fmt: str, compress: bool) -> str:
+    """Content type for an export response"""
+    if compress:
+        return 'application/gzip'
+    return 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+
+
+# Command line usage:
+#   python export.py vital_signs --format csv --gzip --start 2026-01-01 -o vitals.csv.gz
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Stream a table export to a file or stdout")
+    parser.add_argument('dataset', choices=sorted(EXPORT_DATASETS))
+    parser.add_argument('--format', dest='fmt', choices=EXPORT_FORMATS, default='ndjson')
+    parser.add_argument('--gzip', action='store_true', help="gzip the output")
+    parser.add_argument('--start', type=datetime.fromisoformat, help="ISO date/time (inclusive)")
+    parser.add_argument('--end', type=datetime.fromisoformat, help="ISO date/time (exclusive)")
+    parser.add_argument('--patient-id')
+    parser.add_argument('-o', '--output', help="output file (default: stdout)")
+    args = parser.parse_args()
+
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        total = 0
+        for chunk in stream_export(args.dataset, args.fmt, args.gzip,
+                                   start=args.start, end=args.end,
+                                   patient_id=args.patient_id):
+            out.write(chunk)
+            total += len(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+    if args.output:
+        print(f"✅ Exported {args.dataset} to {args.output} ({total} bytes)")
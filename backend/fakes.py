@@ -0,0 +1,412 @@
+"""
+Offline Provider Fakes - Gemini, Twilio and SMTP stand-ins
+Selected with LLM_BACKEND / SMS_BACKEND / EMAIL_BACKEND = 'fake' so load
+tests and benchmarks run reproducibly without network access. Each fake
+draws latency, errors and rate limits (429) from a FaultProfile.
+"""
+
+import math
+import random
+import re
+import socketserver
+import threading
+import time
+import uuid
+from collections import deque
+from types import SimpleNamespace
+from typing import Dict, Optional
+
+
+# ============================================
+# Fault injection
+# ============================================
+
+class FaultProfile:
+    """Latency distribution + error / rate-limit injection for one fake"""
+
+    def __init__(self, latency: str = 'fixed:0', error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, seed: Optional[int] = None):
+        """
+        Args:
+            latency: 'fixed:MS', 'uniform:MIN_MS:MAX_MS' or 'lognormal:MEDIAN_MS:SIGMA'
+            error_rate: probability of a provider error per call
+            rate_limit_rate: probability of a 429 per call
+            seed: random seed (same seed -> same sequence of latencies and faults)
+        """
+        kind, *params = latency.split(':')
+        if kind not in ('fixed', 'uniform', 'lognormal'):
+            raise ValueError(f"Unknown latency distribution: {kind}")
+        self.latency = latency
+        self._kind = kind
+        self._params = [float(p) for p in params] or [0.0]
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.latency_seconds = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> 'FaultProfile':
+        """
+        Build from 'latency=lognormal:800:0.4,error_rate=0.01,rate_limit_rate=0.02,seed=7'
+        """
+        options = {}
+        for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+            key, _, value = item.partition('=')
+            options[key.strip()] = value.strip()
+
+        unknown = set(options) - {'latency', 'error_rate', 'rate_limit_rate', 'seed'}
+        if unknown:
+            raise ValueError(f"Unknown fake profile option(s): {', '.join(sorted(unknown))}")
+
+        return cls(
+            latency=options.get('latency', 'fixed:0'),
+            error_rate=float(options.get('error_rate', 0)),
+            rate_limit_rate=float(options.get('rate_limit_rate', 0)),
+            seed=int(options['seed']) if 'seed' in options else None
+        )
+
+    def _draw_latency(self) -> float:
+        if self._kind == 'fixed':
+            ms = self._params[0]
+        elif self._kind == 'uniform':
+            low, high = (self._params + self._params)[:2]
+            ms = self._random.uniform(low, high)
+        else:
+            median, sigma = (self._params + [0.0])[:2]
+            ms = median * math.exp(self._random.gauss(0, sigma)) if median > 0 else 0.0
+        return max(ms, 0.0) / 1000
+
+    def inject(self) -> Optional[str]:
+        """
+        Simulate one provider call: sleep for the drawn latency
+        Returns:
+            None (success), 'error' or 'rate_limit'
+        """
+        with self._lock:
+            delay = self._draw_latency()
+            roll = self._random.random()
+            self.calls += 1
+            self.latency_seconds += delay
+            if roll < self.rate_limit_rate:
+                fault = 'rate_limit'
+                self.rate_limited += 1
+            elif roll < self.rate_limit_rate + self.error_rate:
+                fault = 'error'
+                self.errors += 1
+            else:
+                fault = None
+
+        if delay:
+            time.sleep(delay)
+        return fault
+
+    def stats(self) -> dict:
+        return {
+            'latency': self.latency,
+            'error_rate': self.error_rate,
+            'rate_limit_rate': self.rate_limit_rate,
+            'calls': self.calls,
+            'errors': self.errors,
+            'rate_limited': self.rate_limited,
+            'mean_latency_ms': round(self.latency_seconds / self.calls * 1000, 2) if self.calls else 0.0
+        }
+
+
+# ============================================
+# Gemini
+# ============================================
+
+def _number(pattern: str, text: str, default: float) -> float:
+    match = re.search(pattern, text)
+    return float(match.group(1)) if match else default
+
+
+def _fake_vitals(prompt: str) -> str:
+    """Rule-based triage, so the fake's levels follow the vitals"""
+    hr = _number(r'Heart Rate:\s*(\d+)', prompt, 80)
+    systolic = _number(r'Blood Pressure:\s*(\d+)', prompt, 120)
+    temp = _number(r'Temperature:\s*([\d.]+)', prompt, 98.6)
+
+    if hr > 130 or hr < 40 or systolic >= 180 or systolic < 85 or temp >= 104:
+        return ("LEVEL: CRITICAL\n"
+                f"REASON: Vitals are in a dangerous range (HR {hr:.0f}, systolic {systolic:.0f}, temp {temp}°F).\n"
+                "ACTION: Alert the doctor immediately and start continuous monitoring.")
+    if hr > 100 or hr < 55 or systolic >= 140 or systolic < 95 or temp >= 100.4:
+        return ("LEVEL: MODERATE\n"
+                f"REASON: Some vitals are outside the normal range (HR {hr:.0f}, systolic {systolic:.0f}, temp {temp}°F).\n"
+                "ACTION: Recheck vitals in 30 minutes and inform the doctor.")
+    return ("LEVEL: STABLE\n"
+            "REASON: All vitals are within normal limits.\n"
+            "ACTION: Continue routine monitoring.")
+
+
+SPECIALISTS = (
+    (('cardi', 'heart', 'mi', 'chest', 'angina'), 'Cardiologist'),
+    (('diabet', 'thyroid', 'endocrin'), 'Endocrinologist'),
+    (('asthma', 'copd', 'pneumon', 'lung'), 'Pulmonologist'),
+    (('kidney', 'renal', 'ckd'), 'Nephrologist'),
+    (('stroke', 'seizure', 'neuro', 'epilep'), 'Neurologist'),
+    (('fracture', 'bone', 'ortho', 'joint'), 'Orthopedic Surgeon'),
+)
+
+
+def _fake_doctor(prompt: str) -> str:
+    diagnosis = re.search(r'Patient diagnosis:\s*(.*)', prompt)
+    words = re.findall(r'[a-z]+', (diagnosis.group(1) if diagnosis else '').lower())
+    for keywords, specialist in SPECIALISTS:
+        # Short keywords (abbreviations like MI) must match whole words
+        if any(word == keyword or (len(keyword) > 3 and word.startswith(keyword))
+               for word in words for keyword in keywords):
+            return f"SPECIALIST: {specialist}\nREASON: The diagnosis falls under {specialist.lower()} care."
+    return "SPECIALIST: General Physician\nREASON: No specialist condition identified."
+
+
+def _fake_wound(prompt: str) -> str:
+    description = re.search(r'Wound description:\s*(.*)', prompt)
+    text = (description.group(1) if description else '').lower()
+    if any(word in text for word in ('deep', 'gaping', 'bleeding', 'bone')):
+        return ("SEVERITY: SEVERE\nCARE: stitching\n"
+                "STEPS: Apply pressure to stop bleeding; Clean and irrigate the wound; Prepare for suturing")
+    if any(word in text for word in ('cut', 'laceration', 'burn')):
+        return ("SEVERITY: MODERATE\nCARE: dressing\n"
+                "STEPS: Clean the wound with saline; Apply antiseptic; Cover with sterile dressing")
+    return ("SEVERITY: MINOR\nCARE: dressing\n"
+            "STEPS: Clean the area; Apply a small dressing; Check again tomorrow")
+
+
+def _fake_numbered(prefix: str, items: list) -> str:
+    return '\n'.join(f"{prefix}{i}: {item}" for i, item in enumerate(items, 1))
+
+
+def fake_response(prompt: str) -> str:
+    """Well-formed answer for each agent prompt format (deterministic)"""
+    if 'LEVEL:' in prompt:
+        return _fake_vitals(prompt)
+    if 'SPECIALIST:' in prompt:
+        return _fake_doctor(prompt)
+    if 'SEVERITY:' in prompt:
+        return _fake_wound(prompt)
+    if 'STEP1:' in prompt:
+        return _fake_numbered('STEP', ['Verify the order and patient identity', 'Prepare equipment with sterile technique',
+                                       'Administer as prescribed', 'Monitor the patient for reactions'])
+    if 'REMINDER1:' in prompt:
+        return _fake_numbered('REMINDER', ['Recheck vitals in 4 hours', 'Give medications on schedule'])
+    if 'DIET1:' in prompt:
+        return _fake_numbered('DIET', ['Low-salt balanced meals', 'Drink 2 liters of water daily',
+                                       'Avoid processed and fried food'])
+    if 'ACTIVITY1:' in prompt:
+        return _fake_numbered('ACTIVITY', ['08:00 - Breathing exercises for 10 minutes',
+                                           '13:00 - Assisted walk for 15 minutes',
+                                           '18:00 - Gentle range of motion exercises'])
+    return "OK"
+
+
+class FakeGeminiClient:
+    """Drop-in for genai.Client: client.models.generate_content(model=..., contents=...)"""
+
+    def __init__(self, profile: FaultProfile, model_profiles: Optional[Dict[str, FaultProfile]] = None):
+        """
+        Args:
+            profile: behaviour of every model
+            model_profiles: overrides for individual models (e.g. a slow or rate-limited one)
+        """
+        self.profile = profile
+        self.model_profiles = model_profiles or {}
+        self.models = self
+
+    @staticmethod
+    def parse_model_profiles(spec: str) -> Dict[str, FaultProfile]:
+        """'gemini-1.5-pro@latency=fixed:3000;gemini-1.5-flash-8b@rate_limit_rate=0.5'"""
+        profiles = {}
+        for item in filter(None, (part.strip() for part in (spec or '').split(';'))):
+            model, _, profile = item.partition('@')
+            profiles[model.strip()] = FaultProfile.parse(profile)
+        return profiles
+
+    def generate_content(self, model: str, contents, **kwargs):
+        fault = self.model_profiles.get(model, self.profile).inject()
+        if fault:
+            from google.genai.errors import ClientError, ServerError
+            if fault == 'rate_limit':
+                raise ClientError(429, {'error': {'code': 429, 'status': 'RESOURCE_EXHAUSTED',
+                                                  'message': 'Resource has been exhausted (fake)'}})
+            raise ServerError(503, {'error': {'code': 503, 'status': 'UNAVAILABLE',
+                                              'message': 'The model is overloaded (fake)'}})
+        prompt = str(contents)
+        text = fake_response(prompt)
+        # Usage as the real API reports it; ~4 characters per token
+        usage = SimpleNamespace(prompt_token_count=max(1, len(prompt) // 4),
+                                candidates_token_count=max(1, len(text) // 4))
+        usage.total_token_count = usage.prompt_token_count + usage.candidates_token_count
+        return SimpleNamespace(text=text, model=model, usage_metadata=usage)
+
+    def stats(self) -> dict:
+        stats = self.profile.stats()
+        if self.model_profiles:
+            stats['models'] = {model: profile.stats() for model, profile in self.model_profiles.items()}
+        return stats
+
+
+# ============================================
+# Twilio
+# ============================================
+
+class FakeProviderError(Exception):
+    """Raised by fakes when the real SDK's exception type isn't installed"""
+
+    def __init__(self, status: int, msg: str):
+        super().__init__(f"HTTP {status}: {msg}")
+        self.status = status
+
+
+class FakeTwilioClient:
+    """Drop-in for twilio.rest.Client: client.messages.create(body=..., from_=..., to=...)"""
+
+    def __init__(self, profile: FaultProfile, keep: int = 1000):
+        self.profile = profile
+        self.messages = self
+        self.sent = deque(maxlen=keep)  # most recent messages, for inspection
+        self.sent_count = 0
+        self._lock = threading.Lock()
+
+    def create(self, body: str, to: str, from_: Optional[str] = None, **kwargs):
+        fault = self.profile.inject()
+        if fault:
+            status, msg = (429, 'Too Many Requests') if fault == 'rate_limit' else (500, 'Internal Server Error')
+            try:
+                from twilio.base.exceptions import TwilioRestException
+            except ImportError:
+                raise FakeProviderError(status, msg)
+            raise TwilioRestException(status, '/Messages.json', msg=f"{msg} (fake)",
+                                      code=20429 if status == 429 else 20500)
+
+        message = SimpleNamespace(sid='SM' + uuid.uuid4().hex, body=body, to=to, from_=from_, status='queued')
+        with self._lock:
+            self.sent.append(message)
+            self.sent_count += 1
+        return message
+
+    def stats(self) -> dict:
+        return {**self.profile.stats(), 'sent': self.sent_count}
+
+
+# ============================================
+# SMTP
+# ============================================
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """One SMTP session"""
+
+    def reply(self, line: str):
+        self.wfile.write((line + '\r\n').encode('ascii'))
+
+    def handle(self):
+        sink = self.server.sink
+        with sink.lock:
+            sink.connections += 1
+
+        # Simulated connection setup cost (TCP + TLS handshake on a real server)
+        if sink.connect_latency:
+            time.sleep(sink.connect_latency)
+        self.reply('220 localhost SMTP sink ready')
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+
+            if verb in ('EHLO', 'HELO'):
+                self.wfile.write(b'250-localhost\r\n250-PIPELINING\r\n250-8BITMIME\r\n250 AUTH PLAIN LOGIN\r\n')
+            elif verb == 'AUTH':
+                if sink.auth_latency:
+                    time.sleep(sink.auth_latency)
+                self.reply('235 Authentication successful')
+            elif verb in ('MAIL', 'RCPT', 'RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b'.\r\n', b'.\n'):
+                        break
+                if sink.message_latency:
+                    time.sleep(sink.message_latency)
+                fault = sink.profile.inject() if sink.profile else None
+                if fault == 'rate_limit':
+                    # Like a throttling server: refuse and drop the session
+                    self.reply('421 4.7.0 Too many messages, slow down')
+                    return
+                if fault == 'error':
+                    self.reply('451 4.3.0 Temporary local problem')
+                    continue
+                with sink.lock:
+                    sink.messages += 1
+                self.reply('250 OK queued')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    """Threaded local SMTP server (plain text, accepts any login)"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0,
+                 connect_latency: float = 0.0, auth_latency: float = 0.0,
+                 message_latency: float = 0.0, profile: Optional[FaultProfile] = None):
+        """
+        Args:
+            host/port: bind address (port 0 picks a free port)
+            connect_latency: seconds before the greeting (handshake cost)
+            auth_latency: seconds per AUTH command
+            message_latency: fixed seconds per accepted message
+            profile: per-message latency and 451/421 injection
+        """
+        self.connect_latency = connect_latency
+        self.auth_latency = auth_latency
+        self.message_latency = message_latency
+        self.profile = profile
+        self.connections = 0
+        self.messages = 0
+        self.lock = threading.Lock()
+
+        self._server = _ThreadingServer((host, port), _SMTPHandler)
+        self._server.sink = self
+        self.host, self.port = self._server.server_address
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='smtp-sink', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> dict:
+        return {
+            **(self.profile.stats() if self.profile else {}),
+            'address': f"{self.host}:{self.port}",
+            'connections': self.connections,
+            'messages': self.messages
+        }
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,348 @@
+"""
+Precomputed Guidance - IV steps, diet and exercise plans ahead of time
+The inputs of these capabilities cluster (three procedure types, a few
+common diagnoses), so an off-peak job generates the common answers within
+the daily quota and stores them per prompt version; every worker loads
+them at startup and serves them without a model call.
+
+Run a precompute pass by hand (e.g. after a deploy that changed a prompt):
+    python guidance.py --max-calls 30
+"""
+
+import hashlib
+import logging
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select
+
+from config import settings
+from database import SessionLocal
+from diagnoses import UNMAPPED, backfill_codes, condition_label, diagnosis_code
+from llm_usage import answered_by
+from metrics import cache_lookup
+from models import LLMUsage, Patient, PrecomputedGuidance
+
+logger = logging.getLogger(__name__)
+
+CAPABILITIES = ('guide_iv_procedure', 'generate_diet_plan', 'create_exercise_plan')
+
+# Exercise plans are shared within an age band: (min age, max age, age used in the prompt)
+AGE_BANDS = ((0, 17, 12), (18, 39, 30), (40, 64, 52), (65, 79, 72), (80, 150, 85))
+# Precompute order: the bands most common on a ward first
+BAND_PRIORITY = (3, 2, 4, 1, 0)
+
+
+def _normalize_text(value: str) -> str:
+    return re.sub(r'\s+', ' ', re.sub(r'[^\w\s/+-]', ' ', str(value).lower())).strip()
+
+
+def _diagnosis_key(diagnosis: str) -> str:
+    """Canonical condition code, so "post MI" and "myocardial infarction" share answers"""
+    code = diagnosis_code(diagnosis)
+    return code if code != UNMAPPED else _normalize_text(diagnosis)
+
+
+def age_band(age) -> int:
+    """Index into AGE_BANDS"""
+    age = int(age)
+    for index, (low, high, _) in enumerate(AGE_BANDS):
+        if low <= age <= high:
+            return index
+    return len(AGE_BANDS) - 1
+
+
+def guidance_key(capability: str, *args) -> str:
+    """
+    Lookup key for a capability's inputs
+    guide_iv_procedure: procedure type
+    generate_diet_plan: diagnosis code + sorted allergies
+    create_exercise_plan: diagnosis code + age band
+    """
+    if capability == 'guide_iv_procedure':
+        return _normalize_text(args[0])
+    if capability == 'generate_diet_plan':
+        diagnosis, allergies = args
+        return f"{_diagnosis_key(diagnosis)}|{','.join(sorted(_normalize_text(a) for a in allergies or []))}"
+    if capability == 'create_exercise_plan':
+        diagnosis, age = args
+        return f"{_diagnosis_key(diagnosis)}|band{age_band(age)}"
+    raise ValueError(f"Unknown capability: {capability}")
+
+
+def prompt_version(capability: str) -> str:
+    """Hash of the capability's prompt template: editing a prompt retires its stored answers"""
+    from agent import NurseAgent
+    template = {
+        'guide_iv_procedure': lambda: NurseAgent._iv_prompt(None, '{procedure_type}'),
+        'generate_diet_plan': lambda: NurseAgent._diet_prompt(None, '{diagnosis}', ['{allergies}']),
+        'create_exercise_plan': lambda: NurseAgent._exercise_prompt(None, '{diagnosis}', '{age}'),
+    }[capability]()
+    return hashlib.sha1(template.encode()).hexdigest()[:12]
+
+
+class GuidanceStore:
+    """Current-version precomputed answers, held in memory"""
+
+    def __init__(self):
+        """Initialize store (filled by load())"""
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str], dict] = {}
+        self._versions: Dict[str, str] = {}
+        self._last_id = 0
+        self._refreshed = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.GUIDANCE_PRECOMPUTE_ENABLED
+
+    def versions(self) -> Dict[str, str]:
+        if not self._versions:
+            self._versions = {capability: prompt_version(capability) for capability in CAPABILITIES}
+        return self._versions
+
+    def load(self, full: bool = True) -> int:
+        """
+        Load stored answers for the current prompt versions
+        Args:
+            full: reload everything (startup); otherwise only rows added since the last load
+        Returns:
+            number of entries loaded
+        """
+        versions = self.versions()
+        db = SessionLocal()
+        try:
+            query = select(
+                PrecomputedGuidance.id, PrecomputedGuidance.capability,
+                PrecomputedGuidance.key, PrecomputedGuidance.result
+            ).where(
+                PrecomputedGuidance.prompt_version.in_(list(versions.values()))
+            ).order_by(PrecomputedGuidance.id)
+            if not full:
+                query = query.where(PrecomputedGuidance.id > self._last_id)
+            rows = db.execute(query).all()
+        except Exception as e:
+            logger.error(f"Guidance load failed: {e}")
+            return 0
+        finally:
+            db.close()
+
+        with self._lock:
+            if full:
+                self._entries = {}
+            for row in rows:
+                self._entries[(row.capability, row.key)] = row.result
+                self._last_id = max(self._last_id, row.id)
+        self._refreshed = time.monotonic()
+        return len(rows)
+
+    def get(self, capability: str, key: str) -> Optional[dict]:
+        """Stored answer, or None"""
+        if not self.enabled:
+            return None
+        if time.monotonic() - self._refreshed > settings.GUIDANCE_REFRESH_SECONDS:
+            self._refreshed = time.monotonic()
+            self.load(full=False)  # pick up a precompute run done by the leader
+
+        result = self._entries.get((capability, key))
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        cache_lookup('guidance', result is not None)
+        return result
+
+    def has(self, capability: str, key: str) -> bool:
+        return (capability, key) in self._entries
+
+    def save(self, capability: str, key: str, result: dict, model: Optional[str], run_id: str):
+        """Store (or replace) the answer for the current prompt version"""
+        version = self.versions()[capability]
+        db = SessionLocal()
+        try:
+            row = db.query(PrecomputedGuidance).filter(
+                PrecomputedGuidance.capability == capability,
+                PrecomputedGuidance.key == key,
+                PrecomputedGuidance.prompt_version == version
+            ).first()
+            if row is None:
+                row = PrecomputedGuidance(capability=capability, key=key, prompt_version=version)
+                db.add(row)
+            row.result = result
+            row.model = model
+            row.run_id = run_id
+            row.created_at = datetime.utcnow()
+            db.commit()
+        finally:
+            db.close()
+
+        with self._lock:
+            self._entries[(capability, key)] = result
+
+    def stats(self) -> dict:
+        counts: Dict[str, int] = {}
+        for capability, _ in list(self._entries):
+            counts[capability] = counts.get(capability, 0) + 1
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'entries': counts,
+            'prompt_versions': self.versions(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+
+# ============================================
+# Precompute job
+# ============================================
+
+def quota_budget() -> int:
+    """
+    Model calls the precompute may spend now: GUIDANCE_PRECOMPUTE_MAX_CALLS,
+    capped by what is left of today's quota after the reserve for live traffic
+    """
+    budget = settings.GUIDANCE_PRECOMPUTE_MAX_CALLS
+    if settings.LLM_DAILY_REQUEST_QUOTA <= 0:
+        return budget
+
+    midnight = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    db = SessionLocal()
+    try:
+        used = db.execute(
+            select(func.count() + func.coalesce(func.sum(LLMUsage.retries), 0)).where(
+                LLMUsage.created_at >= midnight,
+                LLMUsage.cache_status != 'hit'
+            )
+        ).scalar() or 0
+    finally:
+        db.close()
+
+    allowed = int(settings.LLM_DAILY_REQUEST_QUOTA * (1 - settings.GUIDANCE_QUOTA_RESERVE)) - used
+    return max(0, min(budget, allowed))
+
+
+def common_diagnoses(limit: int) -> List[str]:
+    """Most frequent conditions on the census (+ GUIDANCE_EXTRA_DIAGNOSES), most common first"""
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(Patient.diagnosis_code, func.count())
+            .where(Patient.diagnosis_code.isnot(None), Patient.diagnosis_code != UNMAPPED)
+            .group_by(Patient.diagnosis_code)
+            .order_by(func.count().desc())
+            .limit(limit)
+        ).all()
+    finally:
+        db.close()
+
+    diagnoses = [condition_label(row[0]) for row in rows]
+    seen = {_diagnosis_key(d) for d in diagnoses}
+    for extra in settings.GUIDANCE_EXTRA_DIAGNOSES.split(','):
+        if extra.strip() and _diagnosis_key(extra) not in seen:
+            diagnoses.append(extra.strip())
+            seen.add(_diagnosis_key(extra))
+    return diagnoses
+
+
+def plan_targets() -> List[Tuple[str, tuple]]:
+    """(capability, args) in priority order: procedures, then diet and exercise per diagnosis"""
+    targets = [('guide_iv_procedure', (procedure.strip(),))
+               for procedure in settings.GUIDANCE_IV_PROCEDURES.split(',') if procedure.strip()]
+    for diagnosis in common_diagnoses(settings.GUIDANCE_TOP_DIAGNOSES):
+        targets.append(('generate_diet_plan', (diagnosis, [])))
+        targets.extend(('create_exercise_plan', (diagnosis, AGE_BANDS[band][2])) for band in BAND_PRIORITY)
+    return targets
+
+
+def precompute(max_calls: Optional[int] = None, agent=None,
+               fence: Optional[Callable[[], bool]] = None) -> dict:
+    """
+    Generate missing answers for the current prompt versions
+    Args:
+        max_calls: model call budget (default: quota_budget())
+        agent: NurseAgent to use (default: a new one)
+        fence: checked before each answer; the run stops once it fails (lost leadership)
+    Returns:
+        report with planned, existing, generated, failed, budget and fenced
+    """
+    from agent import NurseAgent
+    from google.genai.errors import ClientError
+
+    agent = agent or NurseAgent()
+    budget = quota_budget() if max_calls is None else max_calls
+    run_id = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    methods = {
+        'guide_iv_procedure': agent.guide_iv_procedure,
+        'generate_diet_plan': agent.generate_diet_plan,
+        'create_exercise_plan': agent.create_exercise_plan,
+    }
+
+    guidance_store.load()
+    backfill_codes()
+    targets = plan_targets()
+    report = {'run_id': run_id, 'budget': budget, 'planned': len(targets),
+              'existing': 0, 'generated': 0, 'failed': 0, 'skipped_budget': 0, 'fenced': False}
+
+    for capability, args in targets:
+        if fence is not None and not fence():
+            logger.warning("Guidance precompute stopped: this process is no longer the scheduler leader")
+            report['fenced'] = True
+            break
+        key = guidance_key(capability, *args)
+        if guidance_store.has(capability, key):
+            report['existing'] += 1
+            continue
+        if report['generated'] + report['failed'] >= budget:
+            report['skipped_budget'] += 1
+            continue
+
+        try:
+            with answered_by() as models:
+                result = methods[capability](*args, use_precomputed=False)
+        except ClientError as e:
+            report['failed'] += 1
+            if '429' in str(e):
+                logger.warning("Guidance precompute stopped: rate limited")
+                report['skipped_budget'] += 1
+                budget = 0
+            continue
+        except Exception as e:
+            report['failed'] += 1
+            logger.error(f"Guidance precompute failed for {capability} {key}: {e}")
+            continue
+
+        if not models:
+            # No model answered: the method returned its canned fallback, don't store that
+            report['failed'] += 1
+            logger.warning(f"Guidance precompute got no model answer for {capability} {key}")
+            continue
+
+        guidance_store.save(capability, key, result, models[-1], run_id)
+        report['generated'] += 1
+
+    print(f"🧠 Guidance precompute: {report}")
+    return report
+
+
+# Global instance
+guidance_store = GuidanceStore()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from database import init_db
+
+    parser = argparse.ArgumentParser(description="Precompute IV, diet and exercise guidance")
+    parser.add_argument('--max-calls', type=int, help="model call budget (default: remaining daily quota)")
+    args = parser.parse_args()
+
+    init_db()
+    precompute(args.max_calls)
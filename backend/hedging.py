@@ -0,0 +1,201 @@
+"""
+Hedged LLM Requests - A second request when the first is unusually slow
+For capabilities in LLM_HEDGE_CAPABILITIES the call runs on a worker
+thread; if it hasn't answered within the LLM_HEDGE_PERCENTILE latency of
+recent calls, a hedge is sent (to the next routed model when there is
+one), the first answer wins and the other is cancelled. Hedges are capped
+at LLM_HEDGE_MAX_RATIO of the calls in the last LLM_HEDGE_RATIO_WINDOW_SECONDS
+so they can't eat the quota, and go through the caller's admit gate (the
+agent's request spacing; a sent hedge is charged to the daily quota as a
+retry on the usage row).
+
+A synchronous SDK call can't be interrupted: a loser that already started
+runs to completion on its worker thread and its answer is discarded.
+"""
+
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from config import settings
+from metrics import registry
+
+llm_hedges = registry.counter('llm_hedges_total', "Hedge requests sent (the first call was slower than the "
+                              "hedge delay)", ('capability',))
+llm_hedge_wins = registry.counter('llm_hedge_wins_total', "Hedged calls by which request answered first",
+                                  ('capability', 'winner'))
+llm_hedge_skipped = registry.counter('llm_hedge_skipped_total', "Hedges not sent because the hedge ratio cap "
+                                     "was reached", ('capability',))
+llm_hedge_wait = registry.counter('llm_hedge_spacing_wait_seconds_total', "Time hedges were held back by "
+                                  "request spacing", ('capability',))
+
+
+def _capabilities(value: str) -> Set[str]:
+    return {capability.strip() for capability in value.split(',') if capability.strip()}
+
+
+class Hedger:
+    """Hedge delay from a per-capability latency window, plus the hedge budget"""
+
+    def __init__(self):
+        """Initialize hedger from settings (worker threads start on first hedged call)"""
+        self.capabilities = _capabilities(settings.LLM_HEDGE_CAPABILITIES)
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[float]] = {}
+        # Start times of recent calls / hedges, pruned to LLM_HEDGE_RATIO_WINDOW_SECONDS
+        self._calls: Dict[str, Deque[float]] = {}
+        self._hedges: Dict[str, Deque[float]] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def enabled_for(self, capability: str) -> bool:
+        return capability in self.capabilities
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=settings.LLM_HEDGE_MAX_WORKERS,
+                                                        thread_name_prefix='llm-hedge')
+        return self._executor
+
+    def observe(self, capability: str, seconds: float):
+        """Latency of one successful model call"""
+        with self._lock:
+            window = self._latencies.get(capability)
+            if window is None:
+                window = self._latencies[capability] = deque(maxlen=settings.LLM_HEDGE_WINDOW)
+            window.append(seconds)
+
+    def delay(self, capability: str) -> float:
+        """Seconds to wait before hedging: the configured percentile of recent latency"""
+        with self._lock:
+            samples = sorted(self._latencies.get(capability, ()))
+        if len(samples) < settings.LLM_HEDGE_MIN_SAMPLES:
+            return settings.LLM_HEDGE_DEFAULT_DELAY_SECONDS
+        index = min(len(samples) - 1, int(settings.LLM_HEDGE_PERCENTILE * len(samples)))
+        return max(samples[index], settings.LLM_HEDGE_MIN_DELAY_SECONDS)
+
+    def _window(self, events: Dict[str, Deque[float]], capability: str, now: float) -> Deque[float]:
+        """Recent event times for a capability, older than the ratio window dropped (lock held)"""
+        window = events.get(capability)
+        if window is None:
+            window = events[capability] = deque()
+        cutoff = now - settings.LLM_HEDGE_RATIO_WINDOW_SECONDS
+        while window and window[0] < cutoff:
+            window.popleft()
+        return window
+
+    def _counts(self, capability: str) -> Tuple[int, int]:
+        """(calls, hedges) in the ratio window (lock held)"""
+        now = time.monotonic()
+        return len(self._window(self._calls, capability, now)), len(self._window(self._hedges, capability, now))
+
+    def _allow(self, capability: str) -> bool:
+        """Within the hedge budget"""
+        with self._lock:
+            calls, hedges = self._counts(capability)
+            return hedges + 1 <= settings.LLM_HEDGE_MAX_RATIO * max(calls, 1)
+
+    def call(self, capability: str, request: Callable[[str, bool], object],
+             models: List[str], admit: Optional[Callable[[], float]] = None) -> Tuple[object, str]:
+        """
+        Run request(model, is_hedge), hedging on models[1] (or models[0] again) when slow
+        Args:
+            request: does one model call and returns its response (raises on failure)
+            models: routed models, primary first
+            admit: gate for the hedge request; returns 0 when it may be sent now (and
+                   reserves it), else the seconds until it may
+        Returns:
+            (response, model that answered)
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._window(self._calls, capability, now).append(now)
+
+        # Each thread gets its own copy of the caller's context (trace spans, usage attribution)
+        first = self.executor.submit(contextvars.copy_context().run, request, models[0], False)
+        done, _ = wait([first], timeout=self.delay(capability))
+        if done:
+            return first.result(), models[0]
+        if not self._allow(capability):
+            llm_hedge_skipped.inc(capability)
+            return first.result(), models[0]
+
+        # Hold the hedge until the gate lets it through (the first call may answer meanwhile)
+        held = admit() if admit else 0.0
+        while held > 0:
+            started = time.monotonic()
+            done, _ = wait([first], timeout=held)
+            llm_hedge_wait.inc(capability, amount=time.monotonic() - started)
+            if done:
+                return first.result(), models[0]
+            held = admit()
+        with self._lock:
+            now = time.monotonic()
+            self._window(self._hedges, capability, now).append(now)
+
+        hedge_model = models[1] if len(models) > 1 else models[0]
+        second = self.executor.submit(contextvars.copy_context().run, request, hedge_model, True)
+        llm_hedges.inc(capability)
+        owners: Dict[Future, Tuple[str, str]] = {first: ('primary', models[0]), second: ('hedge', hedge_model)}
+
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    if error is None or future is first:
+                        error = e
+                    continue
+                winner, model = owners[future]
+                llm_hedge_wins.inc(capability, winner)
+                for loser in pending:
+                    loser.cancel()
+                return response, model
+        raise error
+
+    def hedge_rates(self) -> dict:
+        with self._lock:
+            counts = {capability: self._counts(capability) for capability in list(self._calls)}
+        return {(capability,): hedges / calls for capability, (calls, hedges) in counts.items() if calls}
+
+    def stats(self) -> dict:
+        with self._lock:
+            capabilities = sorted(self.capabilities | set(self._calls))
+            counts = {capability: self._counts(capability) for capability in capabilities}
+        return {
+            'capabilities': sorted(self.capabilities),
+            'percentile': settings.LLM_HEDGE_PERCENTILE,
+            'max_ratio': settings.LLM_HEDGE_MAX_RATIO,
+            'ratio_window_seconds': settings.LLM_HEDGE_RATIO_WINDOW_SECONDS,
+            'by_capability': {
+                capability: {
+                    'calls': counts[capability][0],
+                    'hedges': counts[capability][1],
+                    'spacing_wait_seconds': round(llm_hedge_wait.value(capability), 3),
+                    'hedge_delay_ms': round(self.delay(capability) * 1000, 1),
+                    'primary_wins': int(llm_hedge_wins.value(capability, 'primary')),
+                    'hedge_wins': int(llm_hedge_wins.value(capability, 'hedge'))
+                }
+                for capability in capabilities
+            }
+        }
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Global instance
+hedger = Hedger()
+
+llm_hedge_rate = registry.gauge('llm_hedge_ratio', "Hedges sent / hedge-eligible calls in the ratio window", ('capability',),
+                                function=hedger.hedge_rates)
@@ -0,0 +1,226 @@
+"""
+Leader Election - One scheduler across many processes
+Every process competes for a lease row; only the current holder runs
+scheduled jobs. Leases are renewed in the background and expire on their
+own if the leader dies, so another process takes over automatically.
+Lease times come from the database's clock, so hosts whose clocks
+disagree still agree on when a lease has expired.
+"""
+
+import logging
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from sqlalchemy import case, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, db_utcnow
+from models import SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderElector:
+    """Acquire and renew a named lease row in the background"""
+
+    def __init__(self, name: str, lease_seconds: float,
+                 on_elected: Optional[Callable[[], None]] = None,
+                 on_demoted: Optional[Callable[[], None]] = None):
+        """
+        Args:
+            name: lease name (one leader per name)
+            lease_seconds: lease lifetime; renewed every third of it
+            on_elected: called when this process becomes leader
+            on_demoted: called when this process loses leadership
+            (callbacks run in order on their own thread, never on the renewal thread,
+            so a slow one can't let the lease lapse)
+        """
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.renew_interval = lease_seconds / 3
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self.is_leader = False
+        self.elected_at: Optional[datetime] = None
+        self.lease_expires_at: Optional[datetime] = None
+        self.transitions = 0
+
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._callbacks: Optional[ThreadPoolExecutor] = None
+
+    def start(self):
+        """Start competing for the lease"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name=f'leader-{self.name}', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop renewing and hand the lease over immediately"""
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+            self._thread = None
+        if self._callbacks is not None:
+            # Callbacks not started yet are dropped; don't wait for a long running one
+            self._callbacks.shutdown(wait=False, cancel_futures=True)
+            self._callbacks = None
+        if self.is_leader:
+            # Demote synchronously, while whatever the callback stops is still running
+            self._set_leader(False, wait=True)
+        try:
+            self.release()
+        except Exception as e:
+            logger.error(f"Lease release failed: {e}")
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                leader = self.try_acquire()
+            except Exception as e:
+                # Can't prove we still hold the lease: step down rather than risk two leaders
+                logger.error(f"Lease renewal failed: {e}")
+                leader = False
+            self._set_leader(leader)
+            self._stopping.wait(self.renew_interval)
+
+    def _set_leader(self, leader: bool, wait: bool = False):
+        if leader == self.is_leader:
+            return
+        self.is_leader = leader
+        self.transitions += 1
+        callback = self.on_elected if leader else self.on_demoted
+        if leader:
+            self.elected_at = datetime.utcnow()
+            print(f"👑 {self.name}: this process is now leader ({self.holder})")
+        else:
+            self.elected_at = None
+            print(f"👋 {self.name}: leadership released ({self.holder})")
+        if callback and wait:
+            self._run_callback(callback)
+        elif callback:
+            if self._callbacks is None:
+                self._callbacks = ThreadPoolExecutor(max_workers=1,
+                                                     thread_name_prefix=f'leader-{self.name}-callback')
+            self._callbacks.submit(self._run_callback, callback)
+
+    @staticmethod
+    def _run_callback(callback: Callable[[], None]):
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"Leader callback failed: {e}")
+
+    def holds_lease(self, db: Optional[Session] = None) -> bool:
+        """
+        Fence for work done as leader. With a session the check is a conditional
+        UPDATE in the caller's transaction: it succeeds only while our lease is
+        unexpired, and the row stays locked until the caller commits, so no new
+        leader can take over in between. Without one, the in-memory flag.
+        """
+        if not self.is_leader:
+            return False
+        if db is None:
+            return True
+        now = db_utcnow(db)
+        result = db.execute(
+            update(SchedulerLease).where(
+                SchedulerLease.name == self.name,
+                SchedulerLease.holder == self.holder,
+                SchedulerLease.expires_at > now
+            ).values(renewed_at=now)
+        )
+        return result.rowcount == 1
+
+    def try_acquire(self) -> bool:
+        """
+        Take or renew the lease. A conditional UPDATE succeeds only if we
+        already hold it or it has expired, so two processes can never both win.
+        """
+        db = SessionLocal()
+        try:
+            now = db_utcnow(db)
+            expires_at = now + timedelta(seconds=self.lease_seconds)
+            result = db.execute(
+                update(SchedulerLease).where(
+                    SchedulerLease.name == self.name,
+                    or_(SchedulerLease.holder == self.holder, SchedulerLease.expires_at < now)
+                ).values(
+                    holder=self.holder,
+                    acquired_at=case((SchedulerLease.holder == self.holder, SchedulerLease.acquired_at),
+                                     else_=now),
+                    renewed_at=now,
+                    expires_at=expires_at
+                )
+            )
+            if result.rowcount == 1:
+                db.commit()
+                self.lease_expires_at = expires_at
+                return True
+
+            if db.get(SchedulerLease, self.name) is not None:
+                db.rollback()
+                return False
+
+            # First process ever: create the lease row
+            db.add(SchedulerLease(name=self.name, holder=self.holder, acquired_at=now,
+                                  renewed_at=now, expires_at=expires_at))
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                return False
+            self.lease_expires_at = expires_at
+            return True
+        finally:
+            db.close()
+
+    def release(self):
+        """Expire our lease so another process can take over without waiting"""
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(SchedulerLease).where(
+                    SchedulerLease.name == self.name,
+                    SchedulerLease.holder == self.holder
+                ).values(expires_at=db_utcnow(db))
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def current(self) -> Optional[dict]:
+        """The lease row as stored (whoever holds it)"""
+        db = SessionLocal()
+        try:
+            lease = db.get(SchedulerLease, self.name)
+            return lease.to_dict() if lease else None
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        """Leadership state of this process and the current lease"""
+        try:
+            lease = self.current()
+        except Exception as e:
+            lease = {'error': str(e)}
+        return {
+            'name': self.name,
+            'holder': self.holder,
+            'is_leader': self.is_leader,
+            'elected_at': self.elected_at.isoformat() if self.elected_at else None,
+            'lease_expires_at': self.lease_expires_at.isoformat() if self.is_leader and self.lease_expires_at else None,
+            'lease_seconds': self.lease_seconds,
+            'transitions': self.transitions,
+            'lease': lease
+        }
@@ -0,0 +1,216 @@
+"""
+LLM Usage Accounting - Tokens, latency and retries per model call
+Every call (and every cache hit that avoided one) is queued on a
+write-behind log and bulk inserted into llm_usage; aggregate queries
+group it by hour, capability, model or patient
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import case, func, insert, select
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal, engine
+from models import LLMUsage
+from write_behind import WriteBehindLog
+import tracing
+
+USAGE_GROUPS = ('hour', 'capability', 'model', 'patient')
+
+# Patient the current request's model calls are charged to
+_current_patient: ContextVar[Optional[str]] = ContextVar('llm_usage_patient', default=None)
+# Models that answered inside the current answered_by() block
+_answered_by: ContextVar[Optional[List[str]]] = ContextVar('llm_usage_answered_by', default=None)
+
+
+@contextmanager
+def attribute_to(patient_id: Optional[str]):
+    """Charge model calls made inside the block to a patient"""
+    token = _current_patient.set(patient_id)
+    try:
+        yield
+    finally:
+        _current_patient.reset(token)
+
+
+@contextmanager
+def answered_by():
+    """Collect the models that answered the model calls made inside the block (in order)"""
+    models: List[str] = []
+    token = _answered_by.set(models)
+    try:
+        yield models
+    finally:
+        _answered_by.reset(token)
+
+
+def token_counts(response) -> tuple:
+    """(prompt, output) tokens from a generate_content response (None if not reported)"""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return None, None
+    return getattr(usage, 'prompt_token_count', None), getattr(usage, 'candidates_token_count', None)
+
+
+def _insert_usage_rows(rows: List[dict]):
+    """Bulk insert a batch of usage rows in one transaction"""
+    db = SessionLocal()
+    try:
+        db.execute(insert(LLMUsage), rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+class UsageRecorder:
+    """Append-only usage log backed by a write-behind log"""
+
+    def __init__(self):
+        """Initialize usage recorder"""
+        self.writer = WriteBehindLog(
+            name='llm_usage',
+            flush_fn=_insert_usage_rows,
+            segment_dir=settings.AUDIT_SEGMENT_DIR,
+            batch_size=settings.LLM_USAGE_BATCH_SIZE,
+            flush_interval=settings.AUDIT_FLUSH_INTERVAL_SECONDS,
+            max_queue=settings.AUDIT_MAX_QUEUE,
+            datetime_fields=('created_at',)
+        )
+
+    def record(self, capability: str, model: Optional[str], status: str,
+               prompt_tokens: Optional[int] = None, output_tokens: Optional[int] = None,
+               latency_ms: float = 0.0, wait_ms: float = 0.0, retries: int = 0,
+               cache_status: str = 'none', patient_id: Optional[str] = None, route: Optional[str] = None):
+        """
+        Queue one usage row
+        Args:
+            capability: agent method (analyze_vitals, assess_wound, ...)
+            status: success, error, rate_limited or deadline_exceeded
+            latency_ms: model time summed over all attempts
+            wait_ms: time slept on rate-limit spacing and 429 backoff
+            retries: provider requests after the first (fallbacks, retries, hedges)
+            cache_status: none (not cacheable), miss (model called), hit (served from cache
+                          or the local triage classifier)
+            patient_id: defaults to the patient set by attribute_to()
+            route: model routing decision (see routing.py), 'local' for the triage classifier
+        """
+        answered = _answered_by.get()
+        if answered is not None and status == 'success' and model and cache_status != 'hit':
+            answered.append(model)
+        if not settings.LLM_USAGE_ENABLED:
+            return
+        self.writer.append(
+            created_at=datetime.utcnow(),
+            capability=capability,
+            model=model,
+            route=route,
+            patient_id=patient_id or _current_patient.get(),
+            request_id=tracing.request_id(),
+            prompt_tokens=prompt_tokens,
+            output_tokens=output_tokens,
+            latency_ms=round(latency_ms, 2),
+            wait_ms=round(wait_ms, 2),
+            retries=retries,
+            cache_status=cache_status,
+            status=status
+        )
+
+    def flush(self) -> int:
+        """Write all queued usage rows now"""
+        return self.writer.flush()
+
+    def start(self):
+        """Recover leftover segments and start background flushing"""
+        self.writer.start()
+
+    def stop(self):
+        """Flush remaining rows and stop background flushing"""
+        self.writer.stop()
+
+    def stats(self) -> dict:
+        """Queue depth and flush latency metrics"""
+        return self.writer.stats()
+
+
+def _hour_bucket():
+    """created_at truncated to the hour, per dialect"""
+    if engine.dialect.name == 'postgresql':
+        return func.to_char(func.date_trunc('hour', LLMUsage.created_at), 'YYYY-MM-DD"T"HH24:00')
+    return func.strftime('%Y-%m-%dT%H:00', LLMUsage.created_at)
+
+
+def aggregate(db: Session, group_by: str, hours: int = 24, capability: Optional[str] = None,
+              patient_id: Optional[str] = None, limit: int = 100) -> List[dict]:
+    """
+    Usage totals over the last `hours`
+    Args:
+        group_by: hour, capability, model or patient
+        capability / patient_id: optional filters
+        limit: max groups (patients are ordered by total tokens, descending)
+    Returns:
+        list of dicts: key, calls, prompt/output/total tokens, avg latency,
+        wait, retries, cache hits and errors
+    """
+    if group_by not in USAGE_GROUPS:
+        raise ValueError(f"Invalid group. Use: {', '.join(USAGE_GROUPS)}")
+
+    key = {
+        'hour': _hour_bucket(),
+        'capability': LLMUsage.capability,
+        'model': LLMUsage.model,
+        'patient': LLMUsage.patient_id,
+    }[group_by].label('key')
+    prompt_tokens = func.coalesce(func.sum(LLMUsage.prompt_tokens), 0)
+    output_tokens = func.coalesce(func.sum(LLMUsage.output_tokens), 0)
+
+    query = select(
+        key,
+        func.count().label('calls'),
+        prompt_tokens.label('prompt_tokens'),
+        output_tokens.label('output_tokens'),
+        func.avg(case((LLMUsage.cache_status != 'hit', LLMUsage.latency_ms))).label('avg_latency_ms'),
+        func.coalesce(func.sum(LLMUsage.wait_ms), 0).label('wait_ms'),
+        func.coalesce(func.sum(LLMUsage.retries), 0).label('retries'),
+        func.sum(case((LLMUsage.cache_status == 'hit', 1), else_=0)).label('cache_hits'),
+        func.sum(case((LLMUsage.status != 'success', 1), else_=0)).label('errors')
+    ).where(
+        LLMUsage.created_at >= datetime.utcnow() - timedelta(hours=hours)
+    ).group_by(key)
+
+    if capability:
+        query = query.where(LLMUsage.capability == capability)
+    if patient_id:
+        query = query.where(LLMUsage.patient_id == patient_id)
+    if group_by == 'model':
+        query = query.where(LLMUsage.model.isnot(None))
+    if group_by == 'patient':
+        query = query.where(LLMUsage.patient_id.isnot(None)).order_by((prompt_tokens + output_tokens).desc())
+    else:
+        query = query.order_by(key)
+
+    return [
+        {
+            group_by: row.key,
+            'calls': row.calls,
+            'prompt_tokens': int(row.prompt_tokens),
+            'output_tokens': int(row.output_tokens),
+            'total_tokens': int(row.prompt_tokens) + int(row.output_tokens),
+            'avg_latency_ms': round(float(row.avg_latency_ms), 2) if row.avg_latency_ms is not None else None,
+            'wait_ms': round(float(row.wait_ms), 2),
+            'retries': int(row.retries),
+            'cache_hits': int(row.cache_hits or 0),
+            'errors': int(row.errors or 0)
+        }
+        for row in db.execute(query.limit(limit))
+    ]
+
+
+# Global instance
+usage_recorder = UsageRecorder()
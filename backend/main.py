@@ -4,36 +4,80 @@ FastAPI Backend Server
 Complete REST API for Nurse Triage System
 """
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
 from contextlib import asynccontextmanager
+import threading
 
 from database import get_db, init_db
-from models import Patient, VitalSigns, Assessment, AuditLog
+from models import Patient, VitalSigns, Assessment, ReminderSchedule
+from audit import audit_logger
+from audit_partitions import audit_partitions
 from agent import NurseAgent
 from config import settings
+from export import (EXPORT_DATASETS, EXPORT_FORMATS, stream_export,
+                    export_filename, export_media_type)
 
 from notifications import notification_service
+from dispatch import dispatcher
+from outbox import outbox_worker, enqueue_notification, enqueue_critical_alert, get_delivery, outbox_depth
 from scheduler import reminder_scheduler
+from reminders import add_schedule, add_default_schedules
+from metrics import MetricsMiddleware, registry as metrics_registry
+import tracing
+from wound_cache import wound_cache
+from guidance import guidance_store
+from diagnoses import diagnosis_code, normalize_diagnosis, condition_label, UNMAPPED
+from routing import model_router
+from hedging import hedger
+from triage_model import triage_classifier
+import deadlines
+from deadlines import DeadlineExceeded
+from provisional import provisional_analysis, provisional_doctor, remember, refiner
+from llm_usage import usage_recorder, attribute_to, aggregate as aggregate_llm_usage, USAGE_GROUPS
 
 # Initialize database on startup (Modern lifespan method)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    if settings.TRACING_ENABLED:
+        tracing.exporter.start()
     init_db()
+    audit_logger.start()
+    usage_recorder.start()
+    outbox_worker.start()
+    if settings.GUIDANCE_PRECOMPUTE_ENABLED:
+        loaded = guidance_store.load()
+        print(f"🧠 Loaded {loaded} precomputed guidance entries")
+    if settings.TRIAGE_MODEL_ENABLED:
+        print(f"🧮 Local triage model: {triage_classifier.load() or 'none active'}")
     print("🚀 Server started successfully!")
 
     # Start reminder scheduler
     reminder_scheduler.start_all_schedules()
 
+    # Build the Gemini client off the startup path so the first request doesn't pay for it
+    if settings.STARTUP_WARMUP:
+        threading.Thread(target=agent.warm_up, name='agent-warmup', daemon=True).start()
+
     yield
 
     # Shutdown
     reminder_scheduler.stop()
+    outbox_worker.stop()
+    notification_service.close()
+    refiner.stop()
+    hedger.stop()
+    deadlines.shutdown()
+    usage_recorder.stop()
+    audit_logger.stop()
+    tracing.exporter.stop()
     print("👋 Server shutting down...")
 
 # Initialize FastAPI app
@@ -53,7 +97,7 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize AI Agent
+# Initialize AI Agent (the Gemini SDK is loaded on first use or by the startup warm-up)
 agent = NurseAgent()
 
 # Update FastAPI app initialization
@@ -63,6 +107,11 @@ app = FastAPI(
     description=settings.API_DESCRIPTION,
     lifespan=lifespan  # Add this line
 )
+
+# Per-route latency, status counts and in-flight requests (served on /metrics)
+app.add_middleware(MetricsMiddleware)
+# Request id + span trace per request (outermost, so it covers the metrics middleware too)
+app.add_middleware(tracing.TracingMiddleware)
 # ============================================
 # Pydantic Models (Request/Response schemas)
 # ============================================
@@ -108,6 +157,7 @@ async def root():
             "patients": "/api/patients",
             "vitals": "/api/vitals",
             "assessments": "/api/assessments",
+            "export": "/api/export/{dataset}",
             "docs": "/docs"
         }
     }
@@ -126,20 +176,23 @@ async def register_patient(patient_data: PatientCreate, db: Session = Depends(ge
             raise HTTPException(status_code=400, detail="Patient ID already exists")
         
         # Create new patient
-        new_patient = Patient(**patient_data.dict())
+        new_patient = Patient(**patient_data.dict(), diagnosis_code=diagnosis_code(patient_data.diagnosis))
         db.add(new_patient)
+        
+        # Default medication reminder times for patients reachable by phone
+        if (patient_data.emergency_contact or {}).get('phone'):
+            add_default_schedules(db, patient_data.patient_id)
+        
         db.commit()
         db.refresh(new_patient)
         
         # Log action
-        log = AuditLog(
+        audit_logger.log(
             patient_id=patient_data.patient_id,
             action="PATIENT_REGISTERED",
             description=f"New patient registered: {patient_data.first_name} {patient_data.last_name}",
             user="Admin"
         )
-        db.add(log)
-        db.commit()
         
         return {
             "status": "success",
@@ -162,79 +215,124 @@ async def get_patient(patient_id: str, db: Session = Depends(get_db)):
     return patient.to_dict()
 
 @app.get("/api/patients")
-async def get_all_patients(db: Session = Depends(get_db)):
-    """Get all patients"""
-    patients = db.query(Patient).all()
+async def get_all_patients(condition: Optional[str] = None, db: Session = Depends(get_db)):
+    """Get all patients (optionally only those with a condition code, e.g. I21)"""
+    query = db.query(Patient)
+    if condition:
+        query = query.filter(Patient.diagnosis_code == condition.upper())
+    patients = query.all()
     return [p.to_dict() for p in patients]
 
+@app.get("/api/ward/conditions")
+async def ward_conditions(db: Session = Depends(get_db)):
+    """Patient count per normalized condition, most common first"""
+    rows = db.query(Patient.diagnosis_code, func.count(Patient.id)).group_by(
+        Patient.diagnosis_code
+    ).order_by(func.count(Patient.id).desc()).all()
+    return [
+        {'code': code or UNMAPPED, 'label': condition_label(code), 'patients': count}
+        for code, count in rows
+    ]
+
+@app.get("/api/diagnoses/normalize")
+async def normalize_diagnosis_text(text: str):
+    """Show how a free-text diagnosis maps to a condition code"""
+    return normalize_diagnosis(text)
+
 # ============================================
 # Vitals Endpoints
 # ============================================
 
 @app.post("/api/vitals/record")
-async def record_vitals(vitals_data: VitalsCreate, db: Session = Depends(get_db)):
-    """Record patient vitals"""
+def record_vitals(vitals_data: VitalsCreate, db: Session = Depends(get_db)):
+    """Record patient vitals (plain def: the agent calls block, so FastAPI runs this in its threadpool)"""
     try:
         # Check if patient exists
-        patient = db.query(Patient).filter(Patient.patient_id == vitals_data.patient_id).first()
+        with tracing.span('patient_lookup'):
+            patient = db.query(Patient).filter(Patient.patient_id == vitals_data.patient_id).first()
         if not patient:
             raise HTTPException(status_code=404, detail="Patient not found")
         
         # Save vitals
-        new_vitals = VitalSigns(**vitals_data.dict())
-        db.add(new_vitals)
-        db.commit()
-        db.refresh(new_vitals)
+        with tracing.span('save_vitals'):
+            new_vitals = VitalSigns(**vitals_data.dict())
+            db.add(new_vitals)
+            db.commit()
+            db.refresh(new_vitals)
         
-        # Analyze with AI
-        analysis = agent.analyze_vitals({
+        vitals = {
             'hr': vitals_data.heart_rate,
             'bp': vitals_data.blood_pressure,
             'temp': vitals_data.temperature
-        })
+        }
+        # Model calls that don't fit the time budget get a provisional answer, refined in the background
+        provisional = {}
+        with deadlines.deadline(settings.VITALS_RECORD_BUDGET_SECONDS), attribute_to(vitals_data.patient_id):
+            # Analyze with AI
+            with tracing.span('analyze_vitals'):
+                try:
+                    analysis = agent.analyze_vitals(vitals)
+                except DeadlineExceeded:
+                    analysis, provisional['analysis'] = provisional_analysis(vitals)
+            
+            # Get doctor recommendation (the budget is already spent if the analysis was provisional)
+            with tracing.span('recommend_doctor'):
+                doctor_rec = None
+                if not provisional:
+                    try:
+                        doctor_rec = agent.recommend_doctor(patient.diagnosis, vitals)
+                    except DeadlineExceeded:
+                        pass
+                if doctor_rec is None:
+                    doctor_rec, provisional['doctor_recommendation'] = provisional_doctor(patient.diagnosis,
+                                                                                          analysis['level'])
+        if not provisional:
+            remember(vitals, patient.diagnosis, analysis, doctor_rec)
         
-        # Get doctor recommendation
-        doctor_rec = agent.recommend_doctor(
-            patient.diagnosis,
-            {
-                'hr': vitals_data.heart_rate,
-                'bp': vitals_data.blood_pressure,
-                'temp': vitals_data.temperature
-            }
-        )
+        assessment_data = {
+            'vitals': vitals_data.dict(),
+            'analysis': analysis,
+            'doctor_recommendation': doctor_rec
+        }
+        if provisional:
+            assessment_data['provisional'] = {'parts': provisional, 'refinement': 'pending'}
+        # Where the time went so far (lookup, commits, LLM calls, rate-limit waits)
+        trace = tracing.current_trace()
+        if settings.TRACE_ATTACH_TIMINGS and trace:
+            assessment_data['timings'] = trace.breakdown()
         
         # Save assessment
-        assessment = Assessment(
-            patient_id=vitals_data.patient_id,
-            emergency_level=analysis['level'],
-            reasoning=analysis['reason'],
-            recommended_action=analysis['action'],
-            recommended_specialist=doctor_rec['specialist'],
-            specialist_reason=doctor_rec['reason'],
-            assessment_data={
-                'vitals': vitals_data.dict(),
-                'analysis': analysis,
-                'doctor_recommendation': doctor_rec
-            }
-        )
-        db.add(assessment)
-        db.commit()
+        with tracing.span('save_assessment'):
+            assessment = Assessment(
+                patient_id=vitals_data.patient_id,
+                emergency_level=analysis['level'],
+                reasoning=analysis['reason'],
+                recommended_action=analysis['action'],
+                recommended_specialist=doctor_rec['specialist'],
+                specialist_reason=doctor_rec['reason'],
+                assessment_data=assessment_data
+            )
+            db.add(assessment)
+            db.commit()
+        
+        if provisional:
+            refiner.submit(agent, assessment.id, vitals_data.patient_id, patient.diagnosis, vitals, provisional)
         
         # Log action
-        log = AuditLog(
+        audit_logger.log(
             patient_id=vitals_data.patient_id,
             action="VITALS_RECORDED",
-            description=f"Vitals recorded - Level: {analysis['level']}",
+            description=f"Vitals recorded - Level: {analysis['level']}" + (" (provisional)" if provisional else ""),
             user=vitals_data.recorded_by
         )
-        db.add(log)
-        db.commit()
         
         return {
             "status": "success",
             "vitals": new_vitals.to_dict(),
             "analysis": analysis,
-            "doctor_recommendation": doctor_rec
+            "doctor_recommendation": doctor_rec,
+            "assessment_id": assessment.id,
+            "provisional": provisional or None
         }
     
     except HTTPException:
@@ -307,37 +405,56 @@ async def get_latest_assessment(patient_id: str, db: Session = Depends(get_db)):
 # ============================================
 
 @app.post("/api/agent/assess-wound")
-async def assess_wound(wound_description: str):
+async def assess_wound(wound_description: str, patient_id: Optional[str] = None):
     """Assess wound and provide care instructions"""
     try:
-        result = agent.assess_wound(wound_description)
+        with attribute_to(patient_id):
+            result = agent.assess_wound(wound_description)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
+@app.get("/api/agent/wound-cache")
+async def wound_cache_status():
+    """Wound assessment cache size, threshold and hit ratio"""
+    return wound_cache.stats()
+
+@app.get("/api/agent/triage-model")
+async def triage_model_status():
+    """Active local triage classifier version, holdout metrics and how often it answered"""
+    return triage_classifier.stats()
+
+@app.get("/api/agent/guidance-store")
+async def guidance_store_status():
+    """Precomputed guidance entries per capability, prompt versions and hit ratio"""
+    return guidance_store.stats()
+
 @app.post("/api/agent/iv-guidance")
-async def iv_guidance(procedure_type: str):
+async def iv_guidance(procedure_type: str, patient_id: Optional[str] = None):
     """Get IV/Injection procedure guidance"""
     try:
-        result = agent.guide_iv_procedure(procedure_type)
+        with attribute_to(patient_id):
+            result = agent.guide_iv_procedure(procedure_type)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 @app.post("/api/agent/diet-plan")
-async def generate_diet_plan(diagnosis: str, allergies: List[str] = []):
+async def generate_diet_plan(diagnosis: str, allergies: List[str] = [], patient_id: Optional[str] = None):
     """Generate diet plan"""
     try:
-        result = agent.generate_diet_plan(diagnosis, allergies)
+        with attribute_to(patient_id):
+            result = agent.generate_diet_plan(diagnosis, allergies)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 @app.post("/api/agent/exercise-plan")
-async def generate_exercise_plan(diagnosis: str, age: int):
+async def generate_exercise_plan(diagnosis: str, age: int, patient_id: Optional[str] = None):
     """Generate exercise plan"""
     try:
-        result = agent.create_exercise_plan(diagnosis, age)
+        with attribute_to(patient_id):
+            result = agent.create_exercise_plan(diagnosis, age)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
@@ -346,19 +463,94 @@ async def generate_exercise_plan(diagnosis: str, age: int):
 # Audit Log Endpoints
 # ============================================
 
+@app.get("/api/audit/status")
+async def audit_status():
+    """Audit write-behind queue depth, flush latency and partition layout"""
+    return {
+        **audit_logger.stats(),
+        "storage": audit_partitions.stats()
+    }
+
 @app.get("/api/audit-logs")
-async def get_audit_logs(limit: int = 50, db: Session = Depends(get_db)):
-    """Get recent audit logs"""
-    logs = db.query(AuditLog).order_by(AuditLog.timestamp.desc()).limit(limit).all()
-    return [log.to_dict() for log in logs]
+def get_audit_logs(limit: int = 50, db: Session = Depends(get_db)):
+    """Get recent audit logs (plain def: the flush blocks, so FastAPI runs this in its threadpool)"""
+    audit_logger.flush()  # include rows still queued in the write-behind buffer
+    return audit_partitions.recent(db, limit=limit)
 
 @app.get("/api/audit-logs/{patient_id}")
-async def get_patient_audit_logs(patient_id: str, db: Session = Depends(get_db)):
-    """Get audit logs for specific patient"""
-    logs = db.query(AuditLog).filter(
-        AuditLog.patient_id == patient_id
-    ).order_by(AuditLog.timestamp.desc()).all()
-    return [log.to_dict() for log in logs]
+def get_patient_audit_logs(patient_id: str, db: Session = Depends(get_db)):
+    """Get audit logs for specific patient (plain def: the flush blocks)"""
+    audit_logger.flush()
+    return audit_partitions.recent(db, limit=None, patient_id=patient_id)
+
+# ============================================
+# Data Export Endpoints
+# ============================================
+
+@app.get("/api/export/{dataset}")
+def export_dataset(dataset: str,
+                   fmt: str = Query("ndjson", alias="format"),
+                   gzip: bool = False,
+                   start: Optional[datetime] = None,
+                   end: Optional[datetime] = None,
+                   patient_id: Optional[str] = None):
+    """Stream a full table export as NDJSON or CSV, optionally gzipped (plain def: the audit flush blocks)"""
+    if dataset not in EXPORT_DATASETS:
+        raise HTTPException(status_code=404, detail=f"Unknown dataset. Choose from: {', '.join(EXPORT_DATASETS)}")
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format. Choose from: {', '.join(EXPORT_FORMATS)}")
+    
+    if dataset == "audit_logs":
+        audit_logger.flush()
+    
+    filename = export_filename(dataset, fmt, gzip)
+    return StreamingResponse(
+        stream_export(dataset, fmt, gzip, start=start, end=end, patient_id=patient_id),
+        media_type=export_media_type(fmt, gzip),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+# ============================================
+# LLM Usage Endpoints
+# ============================================
+
+@app.get("/api/llm-usage/status")
+async def llm_usage_status():
+    """Usage write-behind queue depth and flush latency"""
+    return usage_recorder.stats()
+
+@app.get("/api/vitals/provisional")
+async def provisional_status():
+    """Time budget for recording vitals and background refinement of provisional assessments"""
+    return {'budget_seconds': settings.VITALS_RECORD_BUDGET_SECONDS, 'refinement': refiner.stats()}
+
+@app.get("/api/llm-routing")
+async def llm_routing_status():
+    """Model tiers, latency budgets and per-model health used for routing, plus hedging"""
+    return {**model_router.stats(), 'hedging': hedger.stats()}
+
+@app.get("/api/llm-usage/by-{group}")
+def llm_usage_summary(group: str,
+                      hours: int = Query(24, ge=1, le=24 * 90),
+                      capability: Optional[str] = None,
+                      patient_id: Optional[str] = None,
+                      limit: int = Query(100, ge=1, le=1000),
+                      db: Session = Depends(get_db)):
+    """
+    Token usage, latency, retries and cache hits over the last `hours`,
+    grouped by hour, capability, model or patient (patients: highest usage first).
+    Plain def: the write-behind flush blocks, so FastAPI runs this in its threadpool
+    """
+    if group not in USAGE_GROUPS:
+        raise HTTPException(status_code=404, detail=f"Unknown grouping. Use: {', '.join('by-' + g for g in USAGE_GROUPS)}")
+    # Include rows still waiting in the write-behind queue
+    usage_recorder.flush()
+    return {
+        "group_by": group,
+        "hours": hours,
+        "rows": aggregate_llm_usage(db, group, hours, capability=capability,
+                                    patient_id=patient_id, limit=limit)
+    }
 
 # ============================================
 # Health Check
@@ -371,9 +563,17 @@ async def health_check():
         "status": "healthy",
         "timestamp": datetime.utcnow().isoformat(),
         "database": "connected",
-        "ai_agent": "active"
+        "ai_agent": "active",
+        "ai_backend": agent.backend
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics (text exposition format)"""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics disabled")
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # ============================================
 # Notification Endpoints
 # ============================================
@@ -385,88 +585,73 @@ class NotificationRequest(BaseModel):
     email: Optional[str] = None
     message: Optional[str] = None
 
-@app.post("/api/notifications/send")
-async def send_notification(notification: NotificationRequest, db: Session = Depends(get_db)):
-    """Send manual notification to patient"""
+# Default message per notification type (None = type takes no message)
+NOTIFICATION_DEFAULT_MESSAGES = {
+    "medication": "Take your prescribed medication",
+    "vitals": None,
+    "diet": "Follow your diet plan",
+    "exercise": "Complete your exercise routine"
+}
+
+@app.post("/api/notifications/send", status_code=202)
+async def send_notification(notification: NotificationRequest,
+                            idempotency_key: Optional[str] = Header(None),
+                            db: Session = Depends(get_db)):
+    """Queue a manual notification to patient (delivered asynchronously)"""
     try:
+        if notification.type not in NOTIFICATION_DEFAULT_MESSAGES:
+            raise HTTPException(status_code=400, detail="Invalid notification type")
+        
         # Get patient
         patient = db.query(Patient).filter(Patient.patient_id == notification.patient_id).first()
         if not patient:
             raise HTTPException(status_code=404, detail="Patient not found")
         
-        patient_name = f"{patient.first_name} {patient.last_name}"
-        
         # Get contact info
         contact = patient.emergency_contact or {}
-        phone = notification.phone or contact.get('phone')
-        email = notification.email or contact.get('email')
         
-        result = {}
-        
-        # Send based on type
-        if notification.type == "medication":
-            message = notification.message or "Take your prescribed medication"
-            result = notification_service.send_medication_reminder(
-                patient_name=patient_name,
-                medication=message,
-                phone=phone,
-                email=email
-            )
-        
-        elif notification.type == "vitals":
-            result = notification_service.send_vitals_check_reminder(
-                patient_name=patient_name,
-                phone=phone,
-                email=email
-            )
-        
-        elif notification.type == "diet":
-            message = notification.message or "Follow your diet plan"
-            result = notification_service.send_diet_reminder(
-                patient_name=patient_name,
-                diet_item=message,
-                phone=phone,
-                email=email
-            )
-        
-        elif notification.type == "exercise":
-            message = notification.message or "Complete your exercise routine"
-            result = notification_service.send_exercise_reminder(
-                patient_name=patient_name,
-                exercise=message,
-                phone=phone,
-                email=email
-            )
-        
-        else:
-            raise HTTPException(status_code=400, detail="Invalid notification type")
+        delivery = enqueue_notification(
+            db,
+            kind=notification.type,
+            patient_id=notification.patient_id,
+            idempotency_key=idempotency_key,
+            payload={
+                "patient_name": f"{patient.first_name} {patient.last_name}",
+                "phone": notification.phone or contact.get('phone'),
+                "email": notification.email or contact.get('email'),
+                "message": notification.message or NOTIFICATION_DEFAULT_MESSAGES[notification.type]
+            }
+        )
+        db.commit()
+        outbox_worker.wake()
         
         # Log notification
-        log = AuditLog(
+        audit_logger.log(
             patient_id=notification.patient_id,
             action=f"NOTIFICATION_SENT_{notification.type.upper()}",
-            description=f"Notification sent: {notification.type}",
+            description=f"Notification queued: {notification.type} (delivery {delivery.delivery_id})",
             user="System"
         )
-        db.add(log)
-        db.commit()
         
         return {
-            "status": "success",
+            "status": "queued",
             "notification_type": notification.type,
-            "results": result
+            "delivery_id": delivery.delivery_id,
+            "delivery_status": delivery.status
         }
     
     except HTTPException:
         raise
     except Exception as e:
+        db.rollback()
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
-@app.post("/api/notifications/critical-alert")
+@app.post("/api/notifications/critical-alert", status_code=202)
 async def send_critical_alert(patient_id: str, doctor_phone: Optional[str] = None, 
                               doctor_email: Optional[str] = None, 
+                              idempotency_key: Optional[str] = Header(None),
                               db: Session = Depends(get_db)):
-    """Send critical alert to doctor"""
+    """Queue critical alert to doctor (delivered asynchronously)"""
     try:
         # Get patient and latest assessment
         patient = db.query(Patient).filter(Patient.patient_id == patient_id).first()
@@ -480,46 +665,124 @@ async def send_critical_alert(patient_id: str, doctor_phone: Optional[str] = Non
         if not assessment or assessment.emergency_level != "CRITICAL":
             raise HTTPException(status_code=400, detail="No critical assessment found")
         
-        patient_name = f"{patient.first_name} {patient.last_name}"
-        
-        result = notification_service.send_critical_alert(
-            patient_id=patient_id,
-            patient_name=patient_name,
-            emergency_level=assessment.emergency_level,
-            reasoning=assessment.reasoning,
-            doctor_phone=doctor_phone,
-            doctor_email=doctor_email
-        )
+        # One alert per assessment unless the client supplies its own key
+        delivery = enqueue_critical_alert(db, patient, assessment, doctor_phone, doctor_email, idempotency_key)
+        db.commit()
+        outbox_worker.wake()
         
         # Log alert
-        log = AuditLog(
+        audit_logger.log(
             patient_id=patient_id,
             action="CRITICAL_ALERT_SENT",
-            description=f"Critical alert sent to doctor",
+            description=f"Critical alert queued for doctor (delivery {delivery.delivery_id})",
             user="System"
         )
-        db.add(log)
-        db.commit()
         
         return {
-            "status": "success",
+            "status": "queued",
             "alert_type": "critical",
-            "results": result
+            "delivery_id": delivery.delivery_id,
+            "delivery_status": delivery.status
         }
     
     except HTTPException:
         raise
     except Exception as e:
+        db.rollback()
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
+@app.get("/api/notifications/deliveries/{delivery_id}")
+async def get_notification_delivery(delivery_id: str, db: Session = Depends(get_db)):
+    """Delivery status of a queued notification"""
+    delivery = get_delivery(db, delivery_id)
+    if not delivery:
+        raise HTTPException(status_code=404, detail="Delivery not found")
+    return delivery.to_dict()
+
+class ReminderScheduleCreate(BaseModel):
+    type: str  # medication, vitals, diet, exercise
+    time_of_day: Optional[str] = None  # HH:MM (daily)
+    interval_minutes: Optional[int] = None  # or every N minutes
+    timezone: Optional[str] = None  # IANA name, default REMINDER_DEFAULT_TIMEZONE
+    message: Optional[str] = None
+    channels: Optional[str] = None  # e.g. "sms,email", default sms
+
+@app.get("/api/patients/{patient_id}/reminders")
+async def get_reminder_schedules(patient_id: str, db: Session = Depends(get_db)):
+    """Reminder schedules of a patient"""
+    schedules = db.query(ReminderSchedule).filter(
+        ReminderSchedule.patient_id == patient_id
+    ).order_by(ReminderSchedule.next_due_at).all()
+    return {"schedules": [s.to_dict() for s in schedules]}
+
+@app.post("/api/patients/{patient_id}/reminders")
+async def create_reminder_schedule(patient_id: str, schedule: ReminderScheduleCreate,
+                                   db: Session = Depends(get_db)):
+    """Add a reminder schedule for a patient"""
+    patient = db.query(Patient).filter(Patient.patient_id == patient_id).first()
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    
+    try:
+        message = schedule.message
+        if message is None:
+            message = NOTIFICATION_DEFAULT_MESSAGES.get(schedule.type)
+        new_schedule = add_schedule(
+            db, patient_id, schedule.type,
+            time_of_day=schedule.time_of_day,
+            interval_minutes=schedule.interval_minutes,
+            timezone=schedule.timezone,
+            message=message,
+            channels=schedule.channels
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    db.commit()
+    db.refresh(new_schedule)
+    
+    audit_logger.log(
+        patient_id=patient_id,
+        action="REMINDER_SCHEDULED",
+        description=f"{schedule.type} reminder scheduled (next due {new_schedule.next_due_at.isoformat()} UTC)",
+        user="System"
+    )
+    
+    return {"status": "success", "schedule": new_schedule.to_dict()}
+
+@app.delete("/api/reminders/{schedule_id}")
+async def deactivate_reminder_schedule(schedule_id: int, db: Session = Depends(get_db)):
+    """Stop a reminder schedule (kept, so the patient isn't re-seeded with defaults)"""
+    schedule = db.query(ReminderSchedule).filter(ReminderSchedule.id == schedule_id).first()
+    if not schedule:
+        raise HTTPException(status_code=404, detail="Reminder schedule not found")
+    
+    schedule.active = False
+    db.commit()
+    
+    audit_logger.log(
+        patient_id=schedule.patient_id,
+        action="REMINDER_CANCELLED",
+        description=f"{schedule.kind} reminder schedule {schedule_id} deactivated",
+        user="System"
+    )
+    
+    return {"status": "success", "schedule": schedule.to_dict()}
+
 @app.get("/api/notifications/status")
-async def notification_status():
+async def notification_status(db: Session = Depends(get_db)):
     """Check notification service status"""
     return {
         "sms_enabled": notification_service.twilio_enabled,
         "email_enabled": notification_service.email_enabled,
-        "scheduler_active": reminder_scheduler.scheduler.running,
-        "scheduled_jobs": len(reminder_scheduler.scheduler.get_jobs())
+        "smtp_pool": notification_service.smtp_pool.stats(),
+        "backends": notification_service.backend_stats(),
+        "dispatch": dispatcher.stats(),
+        "outbox_depth": outbox_depth(db),
+        "outbox_worker": outbox_worker.stats(),
+        "scheduler_active": reminder_scheduler.active,
+        "scheduled_jobs": len(reminder_scheduler.scheduler.get_jobs()),
+        "scheduler": reminder_scheduler.status()
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,299 @@
+"""
+Metrics - In-process Prometheus instrumentation
+Counters, gauges and histograms kept in memory and rendered in the
+Prometheus text format on /metrics. An observation is one lock plus a
+bisect over the bucket bounds, so instrumentation stays on in production.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from config import settings
+
+# Seconds: sub-millisecond DB queries up to multi-minute LLM backoff
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+PREFIX = 'nurse_'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """One metric family; label values are passed positionally, in `labels` order"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, description: str, labels: Iterable[str] = ()):
+        self.name = PREFIX + name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in items]
+
+    def render(self) -> list:
+        return self.header() + self.samples()
+
+
+class Counter(_Metric):
+    """Monotonic total"""
+
+    kind = 'counter'
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0.0)
+
+
+class Gauge(_Metric):
+    """Current value; set directly, tracked in/out, or computed at scrape time"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, description: str, labels: Iterable[str] = (),
+                 function: Optional[Callable[[], Dict[Tuple, float]]] = None):
+        super().__init__(name, description, labels)
+        self.function = function
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+    @contextmanager
+    def track(self, *labels):
+        """In-flight count for the duration of the block"""
+        self.inc(*labels)
+        try:
+            yield
+        finally:
+            self.dec(*labels)
+
+    def samples(self) -> list:
+        if self.function is not None:
+            try:
+                computed = self.function()
+            except Exception:
+                return []
+            with self._lock:
+                self._values = dict(computed)
+        return super().samples()
+
+
+class Histogram(_Metric):
+    """Cumulative buckets + sum + count (per label set)"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, description: str, labels: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        # Per-bucket (non-cumulative) counts; made cumulative at scrape time
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        """Observe the duration of the block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def summary(self, *labels) -> dict:
+        """count and sum for one label set (for status endpoints)"""
+        state = self._values.get(labels)
+        if state is None:
+            return {'count': 0, 'sum': 0.0}
+        return {'count': state[2], 'sum': round(state[1], 6)}
+
+    def samples(self) -> list:
+        with self._lock:
+            items = sorted((key, ([*state[0]], state[1], state[2])) for key, state in self._values.items())
+
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    """All metric families of the process"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, description: str, labels: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, description, labels))
+
+    def gauge(self, name: str, description: str, labels: Iterable[str] = (), function=None) -> Gauge:
+        return self.register(Gauge(name, description, labels, function))
+
+    def histogram(self, name: str, description: str, labels: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, description, labels, buckets))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (0.0.4)"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+# ============================================
+# Metric families
+# ============================================
+
+# HTTP (MetricsMiddleware)
+http_requests = registry.counter('http_requests_total', "HTTP requests by route and status",
+                                 ('method', 'route', 'status'))
+http_latency = registry.histogram('http_request_duration_seconds', "HTTP request latency (until the body is sent)",
+                                  ('method', 'route'))
+http_in_flight = registry.gauge('http_requests_in_flight', "HTTP requests being handled", ('method',))
+
+# LLM (NurseAgent._safe_api_call)
+llm_latency = registry.histogram('llm_call_duration_seconds', "Gemini call latency by capability, model and outcome",
+                                 ('capability', 'model', 'outcome'))
+# route: primary, rate_limited_skipped / slow_skipped (routing started below the primary),
+# fallback_rate_limited / fallback_error (an earlier attempt of the same call failed)
+llm_routes = registry.counter('llm_routes_total', "Gemini call attempts by routed model and routing decision",
+                              ('capability', 'model', 'route'))
+llm_wait = registry.counter('llm_wait_seconds_total',
+                            "Time spent sleeping before Gemini calls (spacing = client-side interval, "
+                            "backoff = after a 429)", ('reason',))
+llm_waits = registry.counter('llm_waits_total', "Sleeps before Gemini calls", ('reason',))
+
+# Database (SQLAlchemy cursor events, see database.py)
+db_latency = registry.histogram('db_query_duration_seconds', "SQL statement execution time", ('statement',))
+
+# Notifications
+notification_latency = registry.histogram('notification_send_duration_seconds',
+                                          "Provider send latency incl. pacing (email_batch = one send_emails call)",
+                                          ('channel', 'status'))
+
+# Scheduler jobs
+job_latency = registry.histogram('scheduler_job_duration_seconds', "Scheduler job run time", ('job', 'status'),
+                                 buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0))
+
+# Caches: hits/misses, plus the ratio computed at scrape time
+cache_lookups = registry.counter('cache_lookups_total', "Cache lookups by result", ('cache', 'result'))
+
+
+def _cache_hit_ratios() -> dict:
+    totals: Dict[Tuple, list] = {}
+    for (cache, result), count in list(cache_lookups._values.items()):
+        entry = totals.setdefault((cache,), [0.0, 0.0])
+        entry[0 if result == 'hit' else 1] += count
+    return {key: hits / (hits + misses) for key, (hits, misses) in totals.items() if hits + misses}
+
+
+cache_hit_ratio = registry.gauge('cache_hit_ratio', "Cache hits / lookups since start", ('cache',),
+                                 function=_cache_hit_ratios)
+
+
+def cache_lookup(cache: str, hit: bool):
+    """Count one cache lookup"""
+    cache_lookups.inc(cache, 'hit' if hit else 'miss')
+
+
+def statement_kind(statement: str) -> str:
+    """First SQL keyword, lowercased (select, insert, update, delete, other)"""
+    keyword = statement.lstrip()[:6].lower()
+    return keyword if keyword in ('select', 'insert', 'update', 'delete') else 'other'
+
+
+# ============================================
+# HTTP middleware
+# ============================================
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: latency per route template (not per concrete path, so
+    patient ids don't explode the label set), status counts, in-flight gauge
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not settings.METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope['method']
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        http_in_flight.inc(method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_in_flight.dec(method)
+            route = getattr(scope.get('route'), 'path', None) or 'unmatched'
+            http_latency.observe(elapsed, method, route)
+            http_requests.inc(method, route, str(status))
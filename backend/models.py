@@ -4,10 +4,11 @@ Database Models for Nurse Triage System
 SQLAlchemy ORM models
 """
 
-from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, ForeignKey, Text, Boolean, Index, table, column
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
+import uuid
 
 Base = declarative_base()
 
@@ -26,6 +27,7 @@ class Patient(Base):
     bed_number = Column(String(20))
     admission_date = Column(String(50), nullable=False)
     diagnosis = Column(Text, nullable=False)
+    diagnosis_code = Column(String(20), index=True)  # canonical condition (diagnoses.py), UNMAPPED if none
     allergies = Column(String(500))
     emergency_contact = Column(JSON)  # Store as JSON
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -34,6 +36,7 @@ class Patient(Base):
     # Relationships
     vitals = relationship("VitalSigns", back_populates="patient", cascade="all, delete-orphan")
     assessments = relationship("Assessment", back_populates="patient", cascade="all, delete-orphan")
+    reminder_schedules = relationship("ReminderSchedule", back_populates="patient", cascade="all, delete-orphan")
     
     def to_dict(self):
         """Convert to dictionary"""
@@ -49,6 +52,7 @@ class Patient(Base):
             'bed_number': self.bed_number,
             'admission_date': self.admission_date,
             'diagnosis': self.diagnosis,
+            'diagnosis_code': self.diagnosis_code,
             'allergies': self.allergies,
             'emergency_contact': self.emergency_contact,
             'created_at': self.created_at.isoformat() if self.created_at else None,
@@ -136,4 +140,218 @@ class AuditLog(Base):
             'description': self.description,
             'user': self.user,
             'timestamp': self.timestamp.isoformat() if self.timestamp else None
-        }
\ No newline at end of file
+        }
+
+
+
+class NotificationOutbox(Base):
+    """Notifications waiting for (or done with) asynchronous delivery"""
+    __tablename__ = 'notification_outbox'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    delivery_id = Column(String(36), unique=True, nullable=False, default=lambda: str(uuid.uuid4()))
+    idempotency_key = Column(String(200), unique=True, nullable=False)
+    patient_id = Column(String(50))
+    kind = Column(String(50), nullable=False)  # medication, vitals, diet, exercise, critical_alert
+    payload = Column(JSON, nullable=False)  # send arguments; delivered channels are removed
+    status = Column(String(20), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(Text)
+    result = Column(JSON)  # latest provider result per channel
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime)
+    
+    __table_args__ = (
+        Index('ix_notification_outbox_due', 'status', 'next_attempt_at'),
+    )
+    
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'delivery_id': self.delivery_id,
+            'patient_id': self.patient_id,
+            'kind': self.kind,
+            'status': self.status,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'last_error': self.last_error,
+            'result': self.result,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
+
+
+class ReminderSchedule(Base):
+    """Per-patient reminder: a daily time of day or a fixed interval"""
+    __tablename__ = 'reminder_schedules'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    patient_id = Column(String(50), ForeignKey('patients.patient_id'), nullable=False, index=True)
+    kind = Column(String(50), nullable=False)  # medication, vitals, diet, exercise
+    message = Column(String(500))
+    time_of_day = Column(String(5))  # HH:MM in the schedule's timezone
+    interval_minutes = Column(Integer)  # used when time_of_day is not set
+    timezone = Column(String(64), nullable=False, default='UTC')
+    channels = Column(String(20))  # comma-separated: sms, email (NULL = sms only)
+    next_due_at = Column(DateTime, nullable=False)  # UTC
+    last_sent_at = Column(DateTime)
+    active = Column(Boolean, nullable=False, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationship
+    patient = relationship("Patient", back_populates="reminder_schedules")
+    
+    __table_args__ = (
+        Index('ix_reminder_schedules_due', 'active', 'next_due_at'),
+    )
+    
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'id': self.id,
+            'patient_id': self.patient_id,
+            'kind': self.kind,
+            'message': self.message,
+            'time_of_day': self.time_of_day,
+            'interval_minutes': self.interval_minutes,
+            'timezone': self.timezone,
+            'channels': self.channels or 'sms',
+            'next_due_at': self.next_due_at.isoformat() if self.next_due_at else None,
+            'last_sent_at': self.last_sent_at.isoformat() if self.last_sent_at else None,
+            'active': self.active,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class SchedulerLease(Base):
+    """Leader lease: only the holder of an unexpired lease runs scheduled jobs"""
+    __tablename__ = 'scheduler_leases'
+    
+    name = Column(String(100), primary_key=True)
+    holder = Column(String(200), nullable=False)  # host:pid:token of the leader
+    acquired_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    renewed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+    
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'name': self.name,
+            'holder': self.holder,
+            'acquired_at': self.acquired_at.isoformat() if self.acquired_at else None,
+            'renewed_at': self.renewed_at.isoformat() if self.renewed_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
+        }
+
+
+class LLMUsage(Base):
+    """One row per model call (or cache hit): token counts, latency and retries"""
+    __tablename__ = 'llm_usage'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    capability = Column(String(40), nullable=False)  # analyze_vitals, assess_wound, ...
+    model = Column(String(60))  # model that answered (or the last one tried); empty for cache hits
+    route = Column(String(30))  # routing decision: primary, *_skipped, fallback_* (see routing.py)
+    patient_id = Column(String(50))  # when the caller attributed the call
+    request_id = Column(String(64))
+    prompt_tokens = Column(Integer)
+    output_tokens = Column(Integer)
+    latency_ms = Column(Float)  # model time, all attempts
+    wait_ms = Column(Float)  # rate-limit spacing + 429 backoff
+    retries = Column(Integer, nullable=False, default=0)
+    cache_status = Column(String(10), nullable=False, default='none')  # none, miss, hit
+    status = Column(String(20), nullable=False)  # success, error, rate_limited, deadline_exceeded
+    
+    __table_args__ = (
+        Index('ix_llm_usage_created', 'created_at'),
+        Index('ix_llm_usage_capability_created', 'capability', 'created_at'),
+        Index('ix_llm_usage_patient_created', 'patient_id', 'created_at'),
+    )
+    
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'id': self.id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'capability': self.capability,
+            'model': self.model,
+            'route': self.route,
+            'patient_id': self.patient_id,
+            'request_id': self.request_id,
+            'prompt_tokens': self.prompt_tokens,
+            'output_tokens': self.output_tokens,
+            'latency_ms': self.latency_ms,
+            'wait_ms': self.wait_ms,
+            'retries': self.retries,
+            'cache_status': self.cache_status,
+            'status': self.status
+        }
+
+
+class WoundAssessmentCache(Base):
+    """Past wound assessments, indexed in memory by MinHash/LSH (see wound_cache.py)"""
+    __tablename__ = 'wound_assessment_cache'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    description = Column(Text, nullable=False)
+    tokens = Column(JSON, nullable=False)  # normalized token set (sorted list)
+    signature = Column(JSON, nullable=False)  # MinHash signature
+    result = Column(JSON, nullable=False)  # assess_wound result
+    model = Column(String(60))
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'id': self.id,
+            'description': self.description,
+            'tokens': self.tokens,
+            'result': self.result,
+            'model': self.model,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class PrecomputedGuidance(Base):
+    """IV / diet / exercise answers generated off-peak (see guidance.py)"""
+    __tablename__ = 'precomputed_guidance'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    capability = Column(String(40), nullable=False)  # guide_iv_procedure, generate_diet_plan, create_exercise_plan
+    key = Column(String(200), nullable=False)  # normalized inputs (guidance.guidance_key)
+    prompt_version = Column(String(12), nullable=False)  # hash of the prompt template
+    result = Column(JSON, nullable=False)
+    model = Column(String(60))
+    run_id = Column(String(20))  # precompute run that generated it
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('ix_precomputed_guidance_lookup', 'capability', 'key', 'prompt_version', unique=True),
+    )
+    
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'id': self.id,
+            'capability': self.capability,
+            'key': self.key,
+            'prompt_version': self.prompt_version,
+            'result': self.result,
+            'model': self.model,
+            'run_id': self.run_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+# Read-only union view over every audit log partition (see audit_partitions.py)
+audit_log_view = table(
+    'audit_logs_all',
+    column('id', Integer),
+    column('patient_id', String),
+    column('action', String),
+    column('description', Text),
+    column('user', String),
+    column('timestamp', DateTime)
+)
@@ -4,39 +4,84 @@ Handles all patient reminders and alerts
 """
 
 import os
-import smtplib
+import threading
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import Optional
-from datetime import datetime
+from typing import List, Optional
 from config import settings
+import templates
+from smtp_pool import SMTPConnectionPool
+from dispatch import dispatcher
+from metrics import notification_latency
+import tracing
 
 class NotificationService:
     """Handle SMS and Email notifications"""
     
     def __init__(self):
         """Initialize notification service"""
-        self.twilio_enabled = bool(settings.TWILIO_ACCOUNT_SID and settings.TWILIO_AUTH_TOKEN)
-        self.email_enabled = bool(settings.SMTP_USERNAME and settings.SMTP_PASSWORD)
-        
-        # Initialize Twilio client if credentials available
-        if self.twilio_enabled:
-            try:
-                from twilio.rest import Client
-                self.twilio_client = Client(
-                    settings.TWILIO_ACCOUNT_SID,
-                    settings.TWILIO_AUTH_TOKEN
-                )
-                print("✅ Twilio SMS service initialized")
-            except ImportError:
-                print("⚠️ Twilio not installed. Run: pip install twilio")
-                self.twilio_enabled = False
-            except Exception as e:
-                print(f"⚠️ Twilio initialization failed: {e}")
-                self.twilio_enabled = False
-        else:
+        self.sms_backend = settings.SMS_BACKEND
+        self.email_backend = settings.EMAIL_BACKEND
+        self.twilio_enabled = self.sms_backend == 'fake' or bool(settings.TWILIO_ACCOUNT_SID and settings.TWILIO_AUTH_TOKEN)
+        self.email_enabled = self.email_backend == 'fake' or bool(settings.SMTP_USERNAME and settings.SMTP_PASSWORD)
+        
+        smtp_host, smtp_port = settings.SMTP_HOST, settings.SMTP_PORT
+        self.sender = settings.SMTP_USERNAME
+        self.smtp_sink = None
+        if self.email_backend == 'fake':
+            # Local SMTP sink in a background thread instead of a real server
+            from fakes import FaultProfile, SMTPSink
+            self.smtp_sink = SMTPSink(profile=FaultProfile.parse(settings.FAKE_SMTP_PROFILE)).start()
+            smtp_host, smtp_port = self.smtp_sink.host, self.smtp_sink.port
+            self.sender = self.sender or 'nurse-triage@localhost'
+            print(f"🧪 Using fake SMTP backend ({smtp_host}:{smtp_port})")
+        
+        # Pooled SMTP sessions (connections are opened lazily on first send)
+        self.smtp_pool = SMTPConnectionPool(
+            host=smtp_host,
+            port=smtp_port,
+            username=settings.SMTP_USERNAME or self.sender,
+            password=settings.SMTP_PASSWORD,
+            use_tls=settings.SMTP_USE_TLS and self.smtp_sink is None,
+            max_connections=settings.SMTP_POOL_SIZE,
+            max_idle_seconds=settings.SMTP_POOL_MAX_IDLE_SECONDS,
+            max_messages_per_connection=settings.SMTP_POOL_MAX_MESSAGES,
+            timeout=settings.SMTP_TIMEOUT_SECONDS
+        )
+        
+        # Twilio SDK is imported and its client built on first SMS (slow import)
+        self._twilio_client = None
+        self._twilio_lock = threading.Lock()
+        if not self.twilio_enabled:
             print("ℹ️ Twilio SMS not configured (optional)")
     
+    @property
+    def twilio_client(self):
+        """Twilio client, created on first use (None if unavailable)"""
+        if self._twilio_client is None and self.twilio_enabled:
+            with self._twilio_lock:
+                if self._twilio_client is None and self.twilio_enabled:
+                    try:
+                        if self.sms_backend == 'fake':
+                            from fakes import FakeTwilioClient, FaultProfile
+                            self._twilio_client = FakeTwilioClient(FaultProfile.parse(settings.FAKE_SMS_PROFILE))
+                            print("🧪 Using fake Twilio backend")
+                        else:
+                            from twilio.rest import Client
+                            self._twilio_client = Client(
+                                settings.TWILIO_ACCOUNT_SID,
+                                settings.TWILIO_AUTH_TOKEN
+                            )
+                            print("✅ Twilio SMS service initialized")
+                    except ImportError:
+                        print("⚠️ Twilio not installed. Run: pip install twilio")
+                        self.twilio_enabled = False
+                    except Exception as e:
+                        print(f"⚠️ Twilio initialization failed: {e}")
+                        self.twilio_enabled = False
+        return self._twilio_client
+    
     def send_sms(self, phone_number: str, message: str) -> dict:
         """
         Send SMS notification
@@ -46,16 +91,21 @@ class NotificationService:
         Returns:
             dict with status and message_id
         """
+        client = self.twilio_client
         if not self.twilio_enabled:
             print("⚠️ SMS not sent: Twilio not configured")
             return {"status": "skipped", "reason": "Twilio not configured"}
         
+        started = time.perf_counter()
         try:
-            message = self.twilio_client.messages.create(
-                body=message,
-                from_=settings.TWILIO_PHONE_NUMBER,
-                to=phone_number
-            )
+            with tracing.span('notification.sms', tracing.KIND_CLIENT, backend=self.sms_backend), \
+                    dispatcher.limit('sms'):
+                message = client.messages.create(
+                    body=message,
+                    from_=settings.TWILIO_PHONE_NUMBER,
+                    to=phone_number
+                )
+            notification_latency.observe(time.perf_counter() - started, 'sms', 'success')
             
             print(f"✅ SMS sent to {phone_number}: {message.sid}")
             return {
@@ -65,6 +115,7 @@ class NotificationService:
             }
         
         except Exception as e:
+            notification_latency.observe(time.perf_counter() - started, 'sms', 'failed')
             print(f"❌ SMS failed: {str(e)}")
             return {
                 "status": "failed",
@@ -86,25 +137,15 @@ class NotificationService:
             print("⚠️ Email not sent: SMTP not configured")
             return {"status": "skipped", "reason": "SMTP not configured"}
         
+        started = time.perf_counter()
         try:
-            # Create message
-            msg = MIMEMultipart('alternative')
-            msg['From'] = settings.SMTP_USERNAME
-            msg['To'] = to_email
-            msg['Subject'] = subject
-            
-            # Add plain text
-            msg.attach(MIMEText(body, 'plain'))
-            
-            # Add HTML if provided
-            if html_body:
-                msg.attach(MIMEText(html_body, 'html'))
+            msg = self._build_email(to_email, subject, body, html_body)
             
-            # Send email
-            with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as server:
-                server.starttls()
-                server.login(settings.SMTP_USERNAME, settings.SMTP_PASSWORD)
-                server.send_message(msg)
+            # Send over a pooled session (reconnects once if the server dropped it)
+            with tracing.span('notification.email', tracing.KIND_CLIENT, backend=self.email_backend), \
+                    dispatcher.limit('email'):
+                self.smtp_pool.send_message(msg)
+            notification_latency.observe(time.perf_counter() - started, 'email', 'success')
             
             print(f"✅ Email sent to {to_email}")
             return {
@@ -114,244 +155,140 @@ class NotificationService:
             }
         
         except Exception as e:
+            notification_latency.observe(time.perf_counter() - started, 'email', 'failed')
             print(f"❌ Email failed: {str(e)}")
             return {
                 "status": "failed",
                 "error": str(e)
             }
     
-    def send_medication_reminder(self, patient_name: str, medication: str, 
-                                  phone: Optional[str] = None, 
-                                  email: Optional[str] = None) -> dict:
-        """Send medication reminder via SMS and/or Email"""
-        
-        current_time = datetime.now().strftime("%I:%M %p")
-        
-        # SMS message
-        sms_text = f"🏥 Reminder: {patient_name}, it's time for your medication: {medication}. Time: {current_time}"
-        
-        # Email content
-        email_subject = f"Medication Reminder - {medication}"
-        email_body = f"""
-Dear {patient_name},
-
-This is a reminder to take your medication:
-
-Medication: {medication}
-Time: {current_time}
-
-Please take your medication as prescribed by your doctor.
-
-Best regards,
-Nurse Triage System
-"""
-        
-        email_html = f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <style>
-        body {{ font-family: Arial, sans-serif; }}
-        .container {{ max-width: 600px; margin: 20px auto; padding: 20px; border: 1px solid #ddd; border-radius: 8px; }}
-        .header {{ background-color: #0d6efd; color: white; padding: 15px; border-radius: 5px; }}
-        .content {{ padding: 20px; }}
-        .medication {{ background-color: #f8f9fa; padding: 15px; margin: 15px 0; border-left: 4px solid #28a745; }}
-        .footer {{ color: #666; font-size: 12px; margin-top: 20px; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h2>🏥 Medication Reminder</h2>
-        </div>
-        <div class="content">
-            <p>Dear {patient_name},</p>
-            <p>This is a reminder to take your medication:</p>
-            <div class="medication">
-                <strong>Medication:</strong> {medication}<br>
-                <strong>Time:</strong> {current_time}
-            </div>
-            <p>Please take your medication as prescribed by your doctor.</p>
-        </div>
-        <div class="footer">
-            <p>Best regards,<br>Nurse Triage System</p>
-        </div>
-    </div>
-</body>
-</html>
-"""
-        
+    def send_emails(self, emails: List[dict]) -> List[dict]:
+        """
+        Send a batch of emails back-to-back over one pooled session
+        Args:
+            emails: list of dicts with to_email, subject, body, html_body (optional)
+        Returns:
+            list of result dicts (same shape as send_email)
+        """
+        if not self.email_enabled:
+            print("⚠️ Emails not sent: SMTP not configured")
+            return [{"status": "skipped", "reason": "SMTP not configured"} for _ in emails]
+        
+        messages = [
+            self._build_email(e['to_email'], e['subject'], e['body'], e.get('html_body'))
+            for e in emails
+        ]
+        started = time.perf_counter()
+        with tracing.span('notification.email_batch', tracing.KIND_CLIENT, messages=len(messages)), \
+                dispatcher.limit('email', tokens=len(messages)):
+            errors = self.smtp_pool.send_many(messages)
+        notification_latency.observe(time.perf_counter() - started, 'email_batch',
+                                     'success' if not any(errors) else 'partial')
+        
+        results = []
+        for email, error in zip(emails, errors):
+            if error is None:
+                results.append({"status": "success", "to": email['to_email'], "subject": email['subject']})
+            else:
+                print(f"❌ Email failed: {str(error)}")
+                results.append({"status": "failed", "error": str(error)})
+        
+        print(f"✅ Email batch sent: {sum(1 for e in errors if e is None)}/{len(emails)}")
+        return results
+    
+    def _build_email(self, to_email: str, subject: str, body: str,
+                     html_body: Optional[str] = None) -> MIMEMultipart:
+        """Build a plain text (+ optional HTML) email message"""
+        msg = MIMEMultipart('alternative')
+        msg['From'] = self.sender
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        
+        # Add plain text
+        msg.attach(MIMEText(body, 'plain'))
+        
+        # Add HTML if provided
+        if html_body:
+            msg.attach(MIMEText(html_body, 'html'))
+        
+        return msg
+    
+    def close(self):
+        """Close pooled SMTP sessions"""
+        self.smtp_pool.close()
+        if self.smtp_sink:
+            self.smtp_sink.stop()
+    
+    def backend_stats(self) -> dict:
+        """Active provider backends (and fake counters when faked)"""
+        stats = {'sms': {'backend': self.sms_backend}, 'email': {'backend': self.email_backend}}
+        if self.sms_backend == 'fake' and self._twilio_client is not None:
+            stats['sms'].update(self._twilio_client.stats())
+        if self.smtp_sink:
+            stats['email'].update(self.smtp_sink.stats())
+        return stats
+    
+    def send_rendered(self, rendered: dict, phone: Optional[str] = None,
+                      email: Optional[str] = None) -> dict:
+        """
+        Send a pre-rendered message (see templates.render / render_batch)
+        Args:
+            rendered: dict with sms, subject, text and optional html
+            phone: SMS recipient (optional)
+            email: email recipient (optional)
+        Returns:
+            dict with per-channel results
+        """
         results = {}
         
-        # Send SMS
         if phone:
-            results['sms'] = self.send_sms(phone, sms_text)
+            results['sms'] = self.send_sms(phone, rendered['sms'])
         
-        # Send Email
         if email:
-            results['email'] = self.send_email(email, email_subject, email_body, email_html)
+            results['email'] = self.send_email(email, rendered['subject'], rendered['text'], rendered.get('html'))
         
         return results
     
+    def send_medication_reminder(self, patient_name: str, medication: str, 
+                                  phone: Optional[str] = None, 
+                                  email: Optional[str] = None) -> dict:
+        """Send medication reminder via SMS and/or Email"""
+        rendered = templates.render('medication', {'patient_name': patient_name, 'medication': medication})
+        return self.send_rendered(rendered, phone, email)
+    
     def send_vitals_check_reminder(self, patient_name: str, 
                                     phone: Optional[str] = None, 
                                     email: Optional[str] = None) -> dict:
         """Send vitals check reminder"""
-        
-        sms_text = f"🏥 Reminder: {patient_name}, please check your vitals (BP, HR, Temperature). Report to nurse station."
-        
-        email_subject = "Vitals Check Reminder"
-        email_body = f"""
-Dear {patient_name},
-
-This is a reminder to check your vital signs:
-
-• Blood Pressure
-• Heart Rate
-• Temperature
-
-Please report to the nurse station for vitals monitoring.
-
-Best regards,
-Nurse Triage System
-"""
-        
-        results = {}
-        
-        if phone:
-            results['sms'] = self.send_sms(phone, sms_text)
-        
-        if email:
-            results['email'] = self.send_email(email, email_subject, email_body)
-        
-        return results
+        rendered = templates.render('vitals', {'patient_name': patient_name})
+        return self.send_rendered(rendered, phone, email)
     
     def send_critical_alert(self, patient_id: str, patient_name: str, 
                            emergency_level: str, reasoning: str,
                            doctor_phone: Optional[str] = None,
                            doctor_email: Optional[str] = None) -> dict:
         """Send critical patient alert to doctor"""
-        
-        sms_text = f"🚨 CRITICAL ALERT: Patient {patient_id} ({patient_name}) - {emergency_level}. {reasoning[:100]}... Check dashboard immediately."
-        
-        email_subject = f"🚨 CRITICAL ALERT - Patient {patient_id}"
-        email_body = f"""
-CRITICAL PATIENT ALERT
-
-Patient ID: {patient_id}
-Patient Name: {patient_name}
-Emergency Level: {emergency_level}
-
-Reasoning: {reasoning}
-
-ACTION REQUIRED: Please check the patient immediately and review the triage dashboard.
-
-Time: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-
-Best regards,
-Nurse Triage System
-"""
-        
-        email_html = f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <style>
-        body {{ font-family: Arial, sans-serif; }}
-        .container {{ max-width: 600px; margin: 20px auto; padding: 20px; border: 3px solid #d9534f; border-radius: 8px; }}
-        .header {{ background-color: #d9534f; color: white; padding: 15px; border-radius: 5px; }}
-        .alert {{ background-color: #f2dede; padding: 15px; margin: 15px 0; border-left: 4px solid #d9534f; }}
-        .info {{ padding: 10px; background-color: #f8f9fa; margin: 10px 0; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h2>🚨 CRITICAL PATIENT ALERT</h2>
-        </div>
-        <div class="alert">
-            <p><strong>Patient ID:</strong> {patient_id}</p>
-            <p><strong>Patient Name:</strong> {patient_name}</p>
-            <p><strong>Emergency Level:</strong> {emergency_level}</p>
-        </div>
-        <div class="info">
-            <p><strong>Reasoning:</strong></p>
-            <p>{reasoning}</p>
-        </div>
-        <p style="color: #d9534f;"><strong>ACTION REQUIRED:</strong> Please check the patient immediately.</p>
-        <p style="color: #666; font-size: 12px;">Time: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}</p>
-    </div>
-</body>
-</html>
-"""
-        
-        results = {}
-        
-        if doctor_phone:
-            results['sms'] = self.send_sms(doctor_phone, sms_text)
-        
-        if doctor_email:
-            results['email'] = self.send_email(doctor_email, email_subject, email_body, email_html)
-        
-        return results
+        rendered = templates.render('critical_alert', {
+            'patient_id': patient_id,
+            'patient_name': patient_name,
+            'emergency_level': emergency_level,
+            'reasoning': reasoning
+        })
+        return self.send_rendered(rendered, doctor_phone, doctor_email)
     
     def send_diet_reminder(self, patient_name: str, diet_item: str,
                           phone: Optional[str] = None,
                           email: Optional[str] = None) -> dict:
         """Send diet/meal reminder"""
-        
-        sms_text = f"🍽️ Diet Reminder: {patient_name}, time for your meal: {diet_item}. Follow your prescribed diet plan."
-        
-        email_subject = "Diet Reminder"
-        email_body = f"""
-Dear {patient_name},
-
-Diet Reminder: {diet_item}
-
-Please follow your prescribed diet plan as recommended by your doctor.
-
-Best regards,
-Nurse Triage System
-"""
-        
-        results = {}
-        
-        if phone:
-            results['sms'] = self.send_sms(phone, sms_text)
-        
-        if email:
-            results['email'] = self.send_email(email, email_subject, email_body)
-        
-        return results
+        rendered = templates.render('diet', {'patient_name': patient_name, 'diet_item': diet_item})
+        return self.send_rendered(rendered, phone, email)
     
     def send_exercise_reminder(self, patient_name: str, exercise: str,
                               phone: Optional[str] = None,
                               email: Optional[str] = None) -> dict:
         """Send exercise/physiotherapy reminder"""
-        
-        sms_text = f"🏃 Exercise Reminder: {patient_name}, it's time for: {exercise}. Follow your physiotherapy schedule."
-        
-        email_subject = "Exercise/Physiotherapy Reminder"
-        email_body = f"""
-Dear {patient_name},
-
-Exercise Reminder: {exercise}
-
-Please follow your prescribed physiotherapy schedule.
-
-Best regards,
-Nurse Triage System
-"""
-        
-        results = {}
-        
-        if phone:
-            results['sms'] = self.send_sms(phone, sms_text)
-        
-        if email:
-            results['email'] = self.send_email(email, email_subject, email_body)
-        
-        return results
+        rendered = templates.render('exercise', {'patient_name': patient_name, 'exercise': exercise})
+        return self.send_rendered(rendered, phone, email)
 
 
 # Initialize global notification service
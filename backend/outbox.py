@@ -0,0 +1,642 @@
+"""
+Notification Outbox - Durable asynchronous delivery
+Endpoints and scheduler jobs insert outbox rows in their own
+transaction; a background worker delivers them with retries
+"""
+
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+from functools import partial
+from typing import List, Optional
+
+from sqlalchemy import func, insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from models import NotificationOutbox
+from notifications import notification_service
+from dispatch import dispatcher
+from sms_coalesce import merge_messages
+import templates
+
+logger = logging.getLogger(__name__)
+
+# Payload key that carries the recipient for each channel
+CHANNEL_KEYS = {'sms': 'phone', 'email': 'email'}
+
+# Provider results that need no further attempts
+DONE_STATUSES = ('success', 'skipped')
+
+# Kinds whose SMS may wait for the coalescing window (alerts always go out at once)
+COALESCE_KINDS = ('medication', 'vitals', 'diet', 'exercise')
+
+# Kinds drained by their own lane, ahead of (and never paced behind) reminder batches
+PRIORITY_KINDS = ('critical_alert',)
+
+
+def claim_limit() -> int:
+    """
+    Rows per reminder batch: OUTBOX_BATCH_SIZE, capped at what this process
+    can pace out in half a lease, so a batch isn't still queued when its
+    lease runs out (each send also renews the lease, see _renew_lease)
+    """
+    capacity = dispatcher.capacity(settings.OUTBOX_LEASE_SECONDS / 2)
+    if capacity is None:
+        return settings.OUTBOX_BATCH_SIZE
+    return max(1, min(settings.OUTBOX_BATCH_SIZE, capacity))
+
+
+def first_attempt_at(kind: str, payload: dict, now: datetime) -> datetime:
+    """
+    Hold scheduled SMS for the coalescing window so other reminders to the
+    phone can join. Notifications sent on demand are not held; they pick up
+    whatever is pending for the phone when they are claimed.
+    """
+    if kind in COALESCE_KINDS and payload.get('phone') and settings.SMS_COALESCE_WINDOW_SECONDS > 0:
+        return now + timedelta(seconds=settings.SMS_COALESCE_WINDOW_SECONDS)
+    return now
+
+
+def _send_medication(p: dict) -> dict:
+    return notification_service.send_medication_reminder(
+        patient_name=p['patient_name'], medication=p['message'],
+        phone=p.get('phone'), email=p.get('email'))
+
+
+def _send_vitals(p: dict) -> dict:
+    return notification_service.send_vitals_check_reminder(
+        patient_name=p['patient_name'],
+        phone=p.get('phone'), email=p.get('email'))
+
+
+def _send_diet(p: dict) -> dict:
+    return notification_service.send_diet_reminder(
+        patient_name=p['patient_name'], diet_item=p['message'],
+        phone=p.get('phone'), email=p.get('email'))
+
+
+def _send_exercise(p: dict) -> dict:
+    return notification_service.send_exercise_reminder(
+        patient_name=p['patient_name'], exercise=p['message'],
+        phone=p.get('phone'), email=p.get('email'))
+
+
+def _send_critical_alert(p: dict) -> dict:
+    return notification_service.send_critical_alert(
+        patient_id=p['patient_id'], patient_name=p['patient_name'],
+        emergency_level=p['emergency_level'], reasoning=p['reasoning'],
+        doctor_phone=p.get('phone'), doctor_email=p.get('email'))
+
+
+# Outbox kind -> delivery function
+HANDLERS = {
+    'medication': _send_medication,
+    'vitals': _send_vitals,
+    'diet': _send_diet,
+    'exercise': _send_exercise,
+    'critical_alert': _send_critical_alert,
+}
+
+
+# Outbox kind -> template field carrying payload['message'] (shared by a scheduler batch)
+MESSAGE_FIELDS = {
+    'medication': 'medication',
+    'diet': 'diet_item',
+    'exercise': 'exercise',
+}
+
+
+def prerender(rows: list):
+    """
+    Render claimed rows in batches: rows of the same kind and message share
+    one bound template and only the per-recipient fields are filled in
+    Sets row['rendered'] in place
+    """
+    groups = {}
+    for row in rows:
+        payload = row['payload']
+        groups.setdefault((row['kind'], payload.get('message')), []).append(row)
+
+    for (kind, message), group in groups.items():
+        field = MESSAGE_FIELDS.get(kind)
+        shared = {field: message} if field else None
+        values = []
+        for row in group:
+            payload = row['payload']
+            if kind == 'critical_alert':
+                values.append({key: payload[key] for key in
+                               ('patient_id', 'patient_name', 'emergency_level', 'reasoning')})
+            else:
+                values.append({'patient_name': payload['patient_name']})
+        try:
+            rendered = templates.render_batch(kind, values, shared)
+        except (KeyError, TypeError) as e:
+            # Malformed payloads fall back to the per-row handler (which records the error)
+            logger.error(f"Outbox batch render failed for {kind}: {e}")
+            continue
+        for row, message_parts in zip(group, rendered):
+            row['rendered'] = message_parts
+
+
+def enqueue_notification(db: Session, kind: str, payload: dict, patient_id: Optional[str] = None,
+            idempotency_key: Optional[str] = None) -> NotificationOutbox:
+    """
+    Add a notification to the outbox as part of the caller's transaction
+    Args:
+        db: caller's session (caller commits)
+        kind: one of HANDLERS
+        payload: send arguments (patient_name, phone, email, message, ...)
+        patient_id: related patient
+        idempotency_key: repeated keys return the existing delivery
+    Returns:
+        outbox row (new or existing)
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown notification kind: {kind}")
+
+    key = idempotency_key or str(uuid.uuid4())
+    existing = db.query(NotificationOutbox).filter(NotificationOutbox.idempotency_key == key).first()
+    if existing:
+        return existing
+
+    row = NotificationOutbox(
+        delivery_id=str(uuid.uuid4()),
+        idempotency_key=key,
+        patient_id=patient_id,
+        kind=kind,
+        payload=payload,
+        status='pending',
+        attempts=0,
+        next_attempt_at=datetime.utcnow()
+    )
+
+    # Savepoint: a concurrent insert of the same key must not break the caller's transaction
+    try:
+        with db.begin_nested():
+            db.add(row)
+    except IntegrityError:
+        return db.query(NotificationOutbox).filter(NotificationOutbox.idempotency_key == key).one()
+
+    return row
+
+
+def enqueue_notifications(db: Session, kind: str, entries: List[dict]) -> int:
+    """
+    Add many notifications of one kind in a single round trip
+    Args:
+        db: caller's session (caller commits)
+        kind: one of HANDLERS
+        entries: dicts with payload, patient_id and idempotency_key
+    Returns:
+        number of new rows (already-queued keys are skipped)
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown notification kind: {kind}")
+    if not entries:
+        return 0
+
+    keys = [entry['idempotency_key'] for entry in entries]
+    existing = {key for (key,) in db.query(NotificationOutbox.idempotency_key).filter(
+        NotificationOutbox.idempotency_key.in_(keys)
+    )}
+
+    now = datetime.utcnow()
+    rows = [
+        {
+            'delivery_id': str(uuid.uuid4()),
+            'idempotency_key': entry['idempotency_key'],
+            'patient_id': entry.get('patient_id'),
+            'kind': kind,
+            'payload': entry['payload'],
+            'status': 'pending',
+            'attempts': 0,
+            'next_attempt_at': first_attempt_at(kind, entry['payload'], now),
+            'created_at': now
+        }
+        for entry in entries if entry['idempotency_key'] not in existing
+    ]
+    if not rows:
+        return 0
+
+    try:
+        with db.begin_nested():
+            db.execute(insert(NotificationOutbox), rows)
+    except IntegrityError:
+        # A concurrent run queued some of these keys: fall back to one-by-one
+        for entry in entries:
+            if entry['idempotency_key'] not in existing:
+                enqueue_notification(db, kind, entry['payload'], entry.get('patient_id'),
+                                     entry['idempotency_key'])
+    return len(rows)
+
+
+def enqueue_critical_alert(db: Session, patient, assessment, phone: Optional[str] = None,
+                           email: Optional[str] = None,
+                           idempotency_key: Optional[str] = None) -> NotificationOutbox:
+    """
+    Queue the doctor alert for a critical assessment (caller commits)
+    Args:
+        patient: Patient row
+        assessment: Assessment row (its level and reasoning go in the alert)
+        idempotency_key: defaults to one alert per assessment and recipient
+    """
+    return enqueue_notification(
+        db,
+        kind="critical_alert",
+        patient_id=patient.patient_id,
+        idempotency_key=idempotency_key or f"critical_alert:{assessment.id}:{phone}:{email}",
+        payload={
+            "patient_id": patient.patient_id,
+            "patient_name": f"{patient.first_name} {patient.last_name}",
+            "emergency_level": assessment.emergency_level,
+            "reasoning": assessment.reasoning,
+            "phone": phone,
+            "email": email
+        }
+    )
+
+
+def get_delivery(db: Session, delivery_id: str) -> Optional[NotificationOutbox]:
+    """Look up an outbox row by delivery id"""
+    return db.query(NotificationOutbox).filter(NotificationOutbox.delivery_id == delivery_id).first()
+
+
+def outbox_depth(db: Session) -> dict:
+    """Row counts per status (sent rows excluded)"""
+    rows = db.query(NotificationOutbox.status, func.count(NotificationOutbox.id)).filter(
+        NotificationOutbox.status != 'sent'
+    ).group_by(NotificationOutbox.status).all()
+    depth = {'pending': 0, 'sending': 0, 'failed': 0}
+    depth.update({status: count for status, count in rows})
+    return depth
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Exponential backoff after the given number of attempts"""
+    delay = settings.OUTBOX_BACKOFF_BASE_SECONDS * (2 ** max(attempts - 1, 0))
+    return min(delay, settings.OUTBOX_BACKOFF_MAX_SECONDS)
+
+
+class OutboxWorker:
+    """Background worker that drains the notification outbox"""
+
+    def __init__(self):
+        """Initialize outbox worker"""
+        self._wakeup = threading.Event()
+        self._priority_wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._priority_thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.delivered = 0
+        self.retried = 0
+        self.dead = 0
+        self.sms_coalesced = 0  # SMS saved by merging
+        self.lease_lost = 0  # rows not sent (or outcomes dropped) because another worker re-claimed them
+
+    def start(self):
+        """Start draining in the background (a reminder lane and a critical alert lane)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, args=(False,), name='outbox-worker', daemon=True)
+        self._priority_thread = threading.Thread(target=self._run, args=(True,), name='outbox-alerts',
+                                                 daemon=True)
+        self._thread.start()
+        self._priority_thread.start()
+        print("✅ Notification outbox worker started")
+
+    def stop(self):
+        """Stop after the current batch"""
+        self._stopping = True
+        self._wakeup.set()
+        self._priority_wakeup.set()
+        for thread in (self._thread, self._priority_thread):
+            if thread:
+                thread.join(timeout=30)
+        self._thread = self._priority_thread = None
+        print("👋 Notification outbox worker stopped")
+
+    def wake(self):
+        """Deliver newly committed rows without waiting for the next poll"""
+        self._wakeup.set()
+        self._priority_wakeup.set()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def _run(self, priority: bool):
+        wakeup = self._priority_wakeup if priority else self._wakeup
+        while not self._stopping:
+            try:
+                claimed = self.drain_once(priority)
+            except Exception as e:
+                logger.error(f"Outbox drain failed: {e}")
+                claimed = 0
+
+            if not claimed:
+                wakeup.wait(settings.OUTBOX_POLL_INTERVAL_SECONDS)
+                wakeup.clear()
+
+    def drain_once(self, priority: bool = False) -> int:
+        """
+        Claim one batch of due rows and deliver it
+        Args:
+            priority: the critical alert lane - PRIORITY_KINDS only, sent one by
+                      one on this thread ahead of any paced reminder batch
+        Returns:
+            number of rows claimed
+        """
+        rows = self._claim_batch(priority)
+        if rows and priority:
+            with dispatcher.priority():
+                for row in rows:
+                    try:
+                        self._deliver(row)
+                    except Exception as e:
+                        logger.error(f"Outbox alert {row['id']} failed: {e}")
+        elif rows:
+            prerender(rows)
+            dispatcher.run('outbox', self._tasks(rows))
+        return len(rows)
+
+    def _claim_batch(self, priority: bool = False) -> list:
+        """
+        Lease due rows to this worker. Each claim is a conditional UPDATE, so
+        concurrent workers (other processes) never deliver the same row twice.
+        Rows stuck in 'sending' past their lease (crashed worker) are reclaimed.
+        Fresh rows for the phones in the batch are claimed along with it, so
+        their SMS can be coalesced. Reminder batches are capped by claim_limit().
+        Args:
+            priority: claim PRIORITY_KINDS rows only (otherwise everything else)
+        """
+        now = datetime.utcnow()
+        lease_until = now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+        lane = (NotificationOutbox.kind.in_(PRIORITY_KINDS) if priority
+                else NotificationOutbox.kind.notin_(PRIORITY_KINDS))
+
+        db = SessionLocal()
+        try:
+            candidates = db.query(
+                NotificationOutbox.id, NotificationOutbox.status, NotificationOutbox.next_attempt_at
+            ).filter(
+                NotificationOutbox.status.in_(('pending', 'sending')),
+                NotificationOutbox.next_attempt_at <= now,
+                lane
+            ).order_by(NotificationOutbox.next_attempt_at).limit(
+                settings.OUTBOX_BATCH_SIZE if priority else claim_limit()
+            ).all()
+
+            claimed = self._claim(db, candidates, lease_until)
+            if not claimed:
+                return []
+            rows = self._load(db, claimed, lease_until)
+
+            phones = {
+                row['payload']['phone'] for row in rows
+                if row['kind'] in COALESCE_KINDS and row['payload'].get('phone')
+            }
+            if phones and settings.SMS_COALESCE_WINDOW_SECONDS > 0:
+                phone = NotificationOutbox.payload['phone'].as_string()
+                joiners = db.query(
+                    NotificationOutbox.id, NotificationOutbox.status, NotificationOutbox.next_attempt_at
+                ).filter(
+                    NotificationOutbox.status == 'pending',
+                    NotificationOutbox.attempts == 0,
+                    NotificationOutbox.kind.in_(COALESCE_KINDS),
+                    phone.in_(phones),
+                    NotificationOutbox.id.notin_(claimed)
+                ).limit(settings.OUTBOX_BATCH_SIZE).all()
+                extra = self._claim(db, joiners, lease_until)
+                if extra:
+                    rows += self._load(db, extra, lease_until)
+
+            return rows
+        finally:
+            db.close()
+
+    @staticmethod
+    def _claim(db: Session, candidates: list, lease_until: datetime) -> list:
+        """Conditionally lease (id, status, next_attempt_at) candidates; returns won ids"""
+        claimed = []
+        for row_id, status, next_attempt_at in candidates:
+            result = db.execute(
+                update(NotificationOutbox).where(
+                    NotificationOutbox.id == row_id,
+                    NotificationOutbox.status == status,
+                    NotificationOutbox.next_attempt_at == next_attempt_at
+                ).values(
+                    status='sending',
+                    next_attempt_at=lease_until,
+                    attempts=NotificationOutbox.attempts + 1
+                )
+            )
+            if result.rowcount == 1:
+                claimed.append(row_id)
+        db.commit()
+        return claimed
+
+    @staticmethod
+    def _load(db: Session, ids: list, lease_until: datetime) -> list:
+        rows = db.query(NotificationOutbox).filter(NotificationOutbox.id.in_(ids)).all()
+        return [
+            {'id': r.id, 'kind': r.kind, 'payload': dict(r.payload or {}),
+             'attempts': r.attempts, 'result': dict(r.result or {}), 'lease_until': lease_until}
+            for r in rows
+        ]
+
+    def _renew_lease(self, rows: list) -> list:
+        """
+        Extend the lease of claimed rows right before sending; returns the rows
+        still held. A row whose lease already lapsed may have been re-claimed by
+        another worker, so it is skipped here rather than sent twice.
+        """
+        lease_until = datetime.utcnow() + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+        held = []
+        db = SessionLocal()
+        try:
+            for row in rows:
+                result = db.execute(update(NotificationOutbox).where(
+                    NotificationOutbox.id == row['id'],
+                    NotificationOutbox.status == 'sending',
+                    NotificationOutbox.next_attempt_at == row['lease_until']
+                ).values(next_attempt_at=lease_until))
+                if result.rowcount == 1:
+                    row['lease_until'] = lease_until
+                    held.append(row)
+            db.commit()
+        finally:
+            db.close()
+
+        lost = len(rows) - len(held)
+        if lost:
+            logger.warning(f"Outbox skipped {lost} row(s) whose lease expired before sending")
+            with self._lock:
+                self.lease_lost += lost
+        return held
+
+    def _tasks(self, rows: list):
+        """
+        One delivery task per row, per phone when several rows share it, and per
+        OUTBOX_EMAIL_BATCH_SIZE rendered emails (sent over one SMTP session)
+        """
+        groups, singles = {}, []
+        for row in rows:
+            phone = row['payload'].get('phone')
+            if row['kind'] in COALESCE_KINDS and phone and 'rendered' in row:
+                groups.setdefault(phone, []).append(row)
+            else:
+                singles.append(row)
+
+        for group in groups.values():
+            if len(group) == 1:
+                singles.append(group[0])
+            else:
+                yield partial(self._deliver_group, group)
+
+        emails = []
+        for row in singles:
+            if 'rendered' in row and row['payload'].get('email'):
+                emails.append(row)
+            else:
+                yield partial(self._deliver, row)
+        size = max(settings.OUTBOX_EMAIL_BATCH_SIZE, 1)
+        for start in range(0, len(emails), size):
+            yield partial(self._deliver_email_batch, emails[start:start + size])
+
+    def _deliver_email_batch(self, rows: list) -> dict:
+        """Send the emails of several rows back-to-back over one SMTP session, then finish each row"""
+        rows = self._renew_lease(rows)
+        if not rows:
+            return {}
+        email_results = notification_service.send_emails([
+            {'to_email': row['payload']['email'], 'subject': row['rendered']['subject'],
+             'body': row['rendered']['text'], 'html_body': row['rendered'].get('html')}
+            for row in rows
+        ])
+
+        outcome = {}
+        for row, email_result in zip(rows, email_results):
+            outcome = self._deliver(row, email_result=email_result, renew=False)
+        return outcome
+
+    def _deliver_group(self, rows: list) -> dict:
+        """Send the SMS of several rows to one phone as merged messages, then finish each row"""
+        rows = self._renew_lease(rows)
+        if not rows:
+            return {}
+        phone = rows[0]['payload']['phone']
+        merged = merge_messages([row['rendered']['sms'] for row in rows], settings.SMS_MAX_SEGMENTS)
+
+        sms_results = [None] * len(rows)
+        for body, members in merged:
+            result = notification_service.send_sms(phone, body)
+            if len(members) > 1:
+                result = {**result, 'coalesced': len(members)}
+            for i in members:
+                sms_results[i] = result
+
+        with self._lock:
+            self.sms_coalesced += len(rows) - len(merged)
+
+        outcome = {}
+        for row, sms_result in zip(rows, sms_results):
+            outcome = self._deliver(row, sms_result, renew=False)
+        return outcome
+
+    def _deliver(self, row: dict, sms_result: Optional[dict] = None,
+                 email_result: Optional[dict] = None, renew: bool = True) -> dict:
+        """
+        Send one claimed row and record the outcome
+        Args:
+            row: claimed row
+            sms_result: SMS already sent as part of a coalesced message
+            email_result: email already sent as part of an email batch
+            renew: renew the lease first (the group and batch paths already did)
+        """
+        if renew and not self._renew_lease([row]):
+            return {}
+        payload = row['payload']
+        error = None
+        try:
+            if 'rendered' in row:
+                # Channels already sent by the group or batch path aren't sent again
+                outcome = notification_service.send_rendered(
+                    row['rendered'],
+                    payload.get('phone') if sms_result is None else None,
+                    payload.get('email') if email_result is None else None)
+                if sms_result is not None:
+                    outcome['sms'] = sms_result
+                if email_result is not None:
+                    outcome['email'] = email_result
+            else:
+                outcome = HANDLERS[row['kind']](payload) or {}
+        except Exception as e:
+            outcome = {}
+            error = str(e)
+
+        # Channels that went through are dropped from the payload, so a retry
+        # only re-sends the channels that failed
+        results = {**row['result'], **outcome}
+        failed = []
+        for channel, channel_result in outcome.items():
+            if channel_result.get('status') in DONE_STATUSES:
+                payload.pop(CHANNEL_KEYS.get(channel, channel), None)
+            else:
+                failed.append(channel)
+                error = channel_result.get('error') or error
+
+        now = datetime.utcnow()
+        values = {'payload': payload, 'result': results, 'last_error': error}
+        if not failed and error is None:
+            values.update(status='sent', sent_at=now, next_attempt_at=now, last_error=None)
+            counter = 'delivered'
+        elif row['attempts'] >= settings.OUTBOX_MAX_ATTEMPTS:
+            values.update(status='failed', next_attempt_at=now)
+            counter = 'dead'
+        else:
+            values.update(status='pending',
+                          next_attempt_at=now + timedelta(seconds=backoff_seconds(row['attempts'])))
+            counter = 'retried'
+
+        # Only while our lease holds: past it, another worker may have re-claimed the row
+        db = SessionLocal()
+        try:
+            result = db.execute(update(NotificationOutbox).where(
+                NotificationOutbox.id == row['id'],
+                NotificationOutbox.status == 'sending',
+                NotificationOutbox.next_attempt_at == row['lease_until']
+            ).values(**values))
+            db.commit()
+        finally:
+            db.close()
+
+        if result.rowcount != 1:
+            counter = 'lease_lost'
+            logger.warning(f"Outbox delivery {row['id']} finished after its lease expired; outcome not recorded")
+        elif counter == 'dead':
+            logger.error(f"Outbox delivery {row['id']} gave up after {row['attempts']} attempts: {error}")
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+        return outcome
+
+    def stats(self) -> dict:
+        """Worker counters"""
+        return {
+            'running': self.running,
+            'delivered': self.delivered,
+            'retried': self.retried,
+            'dead': self.dead,
+            'sms_coalesced': self.sms_coalesced,
+            'lease_lost': self.lease_lost
+        }
+
+
+# Global instance
+outbox_worker = OutboxWorker()
@@ -0,0 +1,286 @@
+"""
+Provisional Assessments - record_vitals answers when the time budget runs out
+A recent model answer for the same vitals (or, failing that, rule-based
+triage and a diagnosis -> specialist map) is returned marked provisional,
+and a background worker asks the model and updates the stored assessment.
+"""
+
+import logging
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional, Tuple
+
+from config import settings
+from database import SessionLocal
+from diagnoses import diagnosis_code
+from metrics import registry
+from models import Assessment, Patient
+from audit import audit_logger
+from llm_usage import attribute_to
+from outbox import enqueue_critical_alert, outbox_worker
+
+logger = logging.getLogger(__name__)
+
+provisional_answers = registry.counter('provisional_answers_total', "Provisional answers returned because the "
+                                       "time budget ran out", ('part', 'source'))
+refinements = registry.counter('provisional_refinements_total', "Background refinements of provisional "
+                               "assessments", ('status',))
+
+# Condition code prefix -> specialist (first match wins, longest prefixes first)
+SPECIALISTS = (
+    ('I6', 'Neurologist'), ('G4', 'Neurologist'),
+    ('I26', 'Pulmonologist'), ('I80', 'Vascular Surgeon'),
+    ('I', 'Cardiologist'),
+    ('J', 'Pulmonologist'), ('U07', 'Pulmonologist'),
+    ('E1', 'Endocrinologist'),
+    ('N39', 'Urologist'), ('N', 'Nephrologist'),
+    ('S72', 'Orthopedic Surgeon'), ('Z96', 'Orthopedic Surgeon'), ('M', 'Orthopedic Surgeon'),
+    ('K', 'Gastroenterologist'),
+    ('A41', 'Infectious Disease Specialist'), ('L03', 'Infectious Disease Specialist'),
+    ('C', 'Oncologist'),
+    ('F0', 'Geriatrician'),
+)
+
+ACTIONS = {
+    'CRITICAL': 'Notify the doctor immediately and monitor continuously',
+    'MODERATE': 'Recheck vitals within 30 minutes and inform the doctor',
+    'STABLE': 'Continue routine monitoring',
+}
+
+
+def parse_blood_pressure(bp: str) -> Tuple[Optional[int], Optional[int]]:
+    """(systolic, diastolic) from '120/80' ((None, None) if unreadable)"""
+    match = re.match(r'\s*(\d+)\s*/\s*(\d+)', str(bp))
+    return (int(match.group(1)), int(match.group(2))) if match else (None, None)
+
+
+def rule_based_analysis(vitals: dict) -> dict:
+    """Emergency level from adult vital sign thresholds (temperature in °F)"""
+    hr, temp = vitals['hr'], vitals['temp']
+    systolic, diastolic = parse_blood_pressure(vitals['bp'])
+
+    critical, moderate = [], []
+    if hr >= 130 or hr < 40:
+        critical.append(f"heart rate {hr} bpm")
+    elif hr > 100 or hr < 50:
+        moderate.append(f"heart rate {hr} bpm")
+    if systolic is not None:
+        if systolic < 90 or systolic >= 180 or diastolic >= 120:
+            critical.append(f"blood pressure {vitals['bp']}")
+        elif systolic < 100 or systolic >= 140 or diastolic >= 90:
+            moderate.append(f"blood pressure {vitals['bp']}")
+    if temp >= 104 or temp < 95:
+        critical.append(f"temperature {temp}°F")
+    elif temp >= 100.4:
+        moderate.append(f"temperature {temp}°F")
+
+    level = 'CRITICAL' if critical else 'MODERATE' if moderate else 'STABLE'
+    findings = critical or moderate
+    reason = (f"Rule-based: {', '.join(findings)} outside the normal range." if findings
+              else "Rule-based: all vitals within normal ranges.")
+    return {'level': level, 'reason': reason, 'action': ACTIONS[level]}
+
+
+def rule_based_specialist(diagnosis: Optional[str]) -> dict:
+    """Specialist for the patient's condition code"""
+    code = diagnosis_code(diagnosis)
+    for prefix, specialist in SPECIALISTS:
+        if code.startswith(prefix):
+            return {'specialist': specialist, 'reason': f"Rule-based: standard referral for {code}."}
+    return {'specialist': 'General Physician', 'reason': 'Rule-based: no specific referral for this diagnosis.'}
+
+
+class AnswerCache:
+    """Recent model answers keyed by bucketed vitals / condition code (LRU)"""
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[tuple, dict]' = OrderedDict()
+
+    @staticmethod
+    def vitals_key(vitals: dict) -> tuple:
+        systolic, diastolic = parse_blood_pressure(vitals['bp'])
+        return ('vitals', int(vitals['hr']) // 5, (systolic or 0) // 10, (diastolic or 0) // 10,
+                round(float(vitals['temp']) * 2))
+
+    @staticmethod
+    def doctor_key(diagnosis: Optional[str], level: str) -> tuple:
+        return ('doctor', diagnosis_code(diagnosis), level)
+
+    def get(self, key: tuple) -> Optional[dict]:
+        with self._lock:
+            answer = self._entries.get(key)
+            if answer is not None:
+                self._entries.move_to_end(key)
+            return answer
+
+    def put(self, key: tuple, answer: dict):
+        with self._lock:
+            self._entries[key] = answer
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+answer_cache = AnswerCache()
+
+
+def remember(vitals: dict, diagnosis: Optional[str], analysis: dict, doctor_rec: Optional[dict] = None):
+    """Keep model answers for later provisional use"""
+    answer_cache.put(AnswerCache.vitals_key(vitals), analysis)
+    if doctor_rec is not None:
+        answer_cache.put(AnswerCache.doctor_key(diagnosis, analysis.get('level', '')), doctor_rec)
+
+
+def provisional_analysis(vitals: dict) -> Tuple[dict, str]:
+    """(analysis, source) - a cached model answer for similar vitals, else rules"""
+    cached = answer_cache.get(AnswerCache.vitals_key(vitals))
+    source = 'cached' if cached else 'rules'
+    provisional_answers.inc('analysis', source)
+    return (dict(cached) if cached else rule_based_analysis(vitals)), source
+
+
+def provisional_doctor(diagnosis: Optional[str], level: str) -> Tuple[dict, str]:
+    """(recommendation, source) - a cached model answer for the condition and level, else rules"""
+    cached = answer_cache.get(AnswerCache.doctor_key(diagnosis, level))
+    source = 'cached' if cached else 'rules'
+    provisional_answers.inc('doctor_recommendation', source)
+    return (dict(cached) if cached else rule_based_specialist(diagnosis)), source
+
+
+# ============================================
+# Background refinement
+# ============================================
+
+class Refiner:
+    """Re-runs the model for provisional assessments and updates the stored rows"""
+
+    def __init__(self):
+        """Initialize refiner (worker threads start on first submit)"""
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.pending = 0
+
+    def submit(self, agent, assessment_id: int, patient_id: str, diagnosis: Optional[str],
+               vitals: dict, parts: dict):
+        """
+        Refine an assessment in the background
+        Args:
+            agent: NurseAgent used for the model calls (no deadline applies)
+            parts: provisional parts -> source, e.g. {'analysis': 'rules'}
+        """
+        if not settings.VITALS_REFINE_ENABLED:
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=settings.VITALS_REFINE_MAX_WORKERS,
+                                                    thread_name_prefix='refine')
+            self.pending += 1
+        self._executor.submit(self._refine, agent, assessment_id, patient_id, diagnosis, vitals, parts)
+
+    def _refine(self, agent, assessment_id, patient_id, diagnosis, vitals, parts):
+        try:
+            with attribute_to(patient_id):
+                analysis = agent.analyze_vitals(vitals) if 'analysis' in parts else None
+                doctor_rec = agent.recommend_doctor(diagnosis, vitals) if 'doctor_recommendation' in parts else None
+            delivery_id = self._update(assessment_id, analysis, doctor_rec, 'refined')
+            if analysis is not None:
+                remember(vitals, diagnosis, analysis, doctor_rec)
+            refinements.inc('refined')
+            audit_logger.log(
+                patient_id=patient_id,
+                action="ASSESSMENT_REFINED",
+                description=f"Provisional assessment {assessment_id} refined"
+                            + (f" - Level: {analysis['level']}" if analysis else ""),
+                user="System"
+            )
+            if delivery_id:
+                outbox_worker.wake()
+                audit_logger.log(
+                    patient_id=patient_id,
+                    action="CRITICAL_ALERT_SENT",
+                    description=f"Critical alert queued for doctor (delivery {delivery_id}) - provisional "
+                                f"assessment {assessment_id} refined to CRITICAL",
+                    user="System"
+                )
+        except Exception as e:
+            refinements.inc('failed')
+            logger.error(f"Refinement of assessment {assessment_id} failed: {e}")
+            try:
+                self._update(assessment_id, None, None, 'failed')
+            except Exception:
+                pass
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    @staticmethod
+    def _update(assessment_id: int, analysis: Optional[dict], doctor_rec: Optional[dict],
+                status: str) -> Optional[str]:
+        """
+        Store the refined parts; an upgrade to CRITICAL queues the doctor alert in the same transaction
+        Returns:
+            delivery id of the queued alert, if any
+        """
+        db = SessionLocal()
+        try:
+            assessment = db.query(Assessment).filter(Assessment.id == assessment_id).first()
+            if assessment is None:
+                return None
+            data = dict(assessment.assessment_data or {})
+            upgraded = (analysis is not None and analysis['level'] == 'CRITICAL'
+                        and assessment.emergency_level != 'CRITICAL')
+            if analysis is not None:
+                assessment.emergency_level = analysis['level']
+                assessment.reasoning = analysis['reason']
+                assessment.recommended_action = analysis['action']
+                data['analysis'] = analysis
+            if doctor_rec is not None:
+                assessment.recommended_specialist = doctor_rec['specialist']
+                assessment.specialist_reason = doctor_rec['reason']
+                data['doctor_recommendation'] = doctor_rec
+            data['provisional'] = {**(data.get('provisional') or {}), 'refinement': status,
+                                   'refined_at': datetime.utcnow().isoformat()}
+            assessment.assessment_data = data
+
+            delivery_id = None
+            if upgraded:
+                delivery_id = Refiner._alert(db, assessment)
+            db.commit()
+            return delivery_id
+        finally:
+            db.close()
+
+    @staticmethod
+    def _alert(db, assessment: Assessment) -> Optional[str]:
+        """The critical alert a synchronous CRITICAL answer would have led to, to the on-call doctor"""
+        phone, email = settings.CRITICAL_ALERT_PHONE or None, settings.CRITICAL_ALERT_EMAIL or None
+        if not (phone or email):
+            logger.warning(f"Assessment {assessment.id} refined to CRITICAL but no CRITICAL_ALERT_PHONE/EMAIL "
+                           f"is configured")
+            return None
+        patient = db.query(Patient).filter(Patient.patient_id == assessment.patient_id).first()
+        if patient is None:
+            return None
+        return enqueue_critical_alert(db, patient, assessment, phone, email).delivery_id
+
+    def stats(self) -> dict:
+        return {
+            'enabled': settings.VITALS_REFINE_ENABLED,
+            'pending': self.pending,
+            'refined': int(refinements.value('refined')),
+            'failed': int(refinements.value('failed'))
+        }
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Global instance
+refiner = Refiner()
@@ -0,0 +1,326 @@
+"""
+Reminder Schedules - Per-patient reminder times
+Each schedule row carries its next due time (UTC, indexed); the scheduler
+tick pulls only the due rows in batches, queues them and advances them
+"""
+
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from sqlalchemy import exists, insert, select, update
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from models import Patient, ReminderSchedule
+from outbox import enqueue_notifications, outbox_worker
+
+logger = logging.getLogger(__name__)
+
+REMINDER_KINDS = ('medication', 'vitals', 'diet', 'exercise')
+
+DEFAULT_MEDICATION_MESSAGE = "Your prescribed medication"
+
+# Delivery channel -> emergency_contact key; schedules default to SMS only (as the original reminders)
+REMINDER_CHANNELS = {'sms': 'phone', 'email': 'email'}
+DEFAULT_CHANNELS = 'sms'
+
+
+def parse_channels(value: str) -> str:
+    """Validate and normalize a comma-separated channel list"""
+    channels = sorted({c.strip().lower() for c in (value or '').split(',') if c.strip()})
+    if not channels or any(c not in REMINDER_CHANNELS for c in channels):
+        raise ValueError(f"Invalid reminder channels: {value} (use {', '.join(REMINDER_CHANNELS)})")
+    return ','.join(channels)
+
+
+def parse_time_of_day(value: str) -> str:
+    """Validate and normalize an HH:MM time"""
+    try:
+        parsed = datetime.strptime(value.strip(), '%H:%M')
+    except (AttributeError, ValueError):
+        raise ValueError(f"Invalid time of day (expected HH:MM): {value}")
+    return parsed.strftime('%H:%M')
+
+
+def get_timezone(name: str) -> ZoneInfo:
+    """Look up an IANA timezone"""
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown timezone: {name}")
+
+
+def next_due(time_of_day: Optional[str], interval_minutes: Optional[int], timezone: str,
+             after: datetime, previous: Optional[datetime] = None) -> datetime:
+    """
+    Next occurrence strictly after `after`
+    Args:
+        time_of_day: HH:MM local time (daily schedule)
+        interval_minutes: fixed interval (used when time_of_day is None)
+        timezone: IANA timezone of time_of_day
+        after: naive UTC reference time
+        previous: last due time of an interval schedule (keeps its phase)
+    Returns:
+        naive UTC datetime
+    """
+    if time_of_day:
+        tz = get_timezone(timezone)
+        hour, minute = map(int, parse_time_of_day(time_of_day).split(':'))
+        local_after = after.replace(tzinfo=ZoneInfo('UTC')).astimezone(tz)
+        candidate = local_after.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if candidate <= local_after:
+            candidate = (local_after + timedelta(days=1)).replace(
+                hour=hour, minute=minute, second=0, microsecond=0)
+        return candidate.astimezone(ZoneInfo('UTC')).replace(tzinfo=None)
+
+    if not interval_minutes or interval_minutes <= 0:
+        raise ValueError("Schedule needs a time_of_day or a positive interval_minutes")
+
+    interval = timedelta(minutes=interval_minutes)
+    base = previous or after
+    if base + interval > after:
+        return base + interval
+    # Missed occurrences (downtime) are skipped, not replayed
+    return base + interval * ((after - base) // interval + 1)
+
+
+def add_schedule(db: Session, patient_id: str, kind: str, time_of_day: Optional[str] = None,
+                 interval_minutes: Optional[int] = None, timezone: Optional[str] = None,
+                 message: Optional[str] = None, channels: Optional[str] = None) -> ReminderSchedule:
+    """
+    Create a reminder schedule (caller commits)
+    Args:
+        channels: comma-separated delivery channels (default DEFAULT_CHANNELS)
+    Raises:
+        ValueError: invalid kind, time, interval, timezone or channels
+    """
+    if kind not in REMINDER_KINDS:
+        raise ValueError(f"Invalid reminder type. Use: {', '.join(REMINDER_KINDS)}")
+    if bool(time_of_day) == bool(interval_minutes):
+        raise ValueError("Set exactly one of time_of_day or interval_minutes")
+
+    timezone = timezone or settings.REMINDER_DEFAULT_TIMEZONE
+    channels = parse_channels(channels or DEFAULT_CHANNELS)
+    if time_of_day:
+        time_of_day = parse_time_of_day(time_of_day)
+
+    schedule = ReminderSchedule(
+        patient_id=patient_id,
+        kind=kind,
+        message=message,
+        time_of_day=time_of_day,
+        interval_minutes=interval_minutes,
+        timezone=timezone,
+        channels=channels,
+        next_due_at=next_due(time_of_day, interval_minutes, timezone, datetime.utcnow()),
+        active=True
+    )
+    db.add(schedule)
+    return schedule
+
+
+def default_times() -> List[str]:
+    """Configured default medication times"""
+    return [parse_time_of_day(t) for t in settings.REMINDER_DEFAULT_TIMES.split(',') if t.strip()]
+
+
+def add_default_schedules(db: Session, patient_id: str) -> List[ReminderSchedule]:
+    """Default medication reminders for a newly registered patient (caller commits)"""
+    return [
+        add_schedule(db, patient_id, 'medication', time_of_day=time_of_day,
+                     message=DEFAULT_MEDICATION_MESSAGE)
+        for time_of_day in default_times()
+    ]
+
+
+def iter_patient_contacts(db: Session, channel: str = 'phone', *criteria,
+                          batch_size: Optional[int] = None) -> Iterator[List]:
+    """
+    Stream patients that have a contact for `channel`, in chunks
+    Only the columns reminders need are selected, and patients without the
+    contact are filtered out in SQL. Rows come from a server-side cursor
+    (yield_per), so memory stays flat however large the census is.
+    Args:
+        db: open session
+        channel: emergency_contact key ('phone' or 'email')
+        criteria: extra WHERE clauses
+        batch_size: rows per chunk (default: SCHEDULER_BATCH_SIZE)
+    Yields:
+        lists of rows with patient_id, first_name, last_name, contact
+    """
+    batch_size = batch_size or settings.SCHEDULER_BATCH_SIZE
+    contact = Patient.emergency_contact[channel].as_string()
+
+    query = select(
+        Patient.patient_id,
+        Patient.first_name,
+        Patient.last_name,
+        contact.label('contact')
+    ).where(
+        contact.isnot(None),
+        contact != '',
+        *criteria
+    ).order_by(Patient.id).execution_options(stream_results=True, yield_per=batch_size)
+
+    for chunk in db.execute(query).partitions():
+        yield chunk
+
+
+def seed_default_schedules() -> int:
+    """
+    Give every patient with a phone and no schedules at all the default
+    medication times (what the old fixed cron slots sent). Patients whose
+    schedules were deactivated keep their rows and are not re-seeded.
+    Returns:
+        number of schedules created
+    """
+    times = default_times()
+    if not times:
+        return 0
+
+    timezone = settings.REMINDER_DEFAULT_TIMEZONE
+    now = datetime.utcnow()
+    due = {t: next_due(t, None, timezone, now) for t in times}
+    has_schedule = exists().where(ReminderSchedule.patient_id == Patient.patient_id)
+
+    db = SessionLocal()
+    try:
+        created = 0
+        for chunk in iter_patient_contacts(db, 'phone', ~has_schedule):
+            rows = [
+                {
+                    'patient_id': patient.patient_id,
+                    'kind': 'medication',
+                    'message': DEFAULT_MEDICATION_MESSAGE,
+                    'time_of_day': t,
+                    'timezone': timezone,
+                    'channels': DEFAULT_CHANNELS,
+                    'next_due_at': due[t],
+                    'active': True,
+                    'created_at': now
+                }
+                for patient in chunk for t in times
+            ]
+            db.execute(insert(ReminderSchedule), rows)
+            created += len(rows)
+        db.commit()
+        return created
+    finally:
+        db.close()
+
+
+def process_due(now: Optional[datetime] = None, batch_size: Optional[int] = None,
+                fence: Optional[Callable[[Session], bool]] = None) -> dict:
+    """
+    Queue every due reminder and advance its schedule
+    Work is proportional to the number of due rows: they are read through
+    the (active, next_due_at) index in batches of batch_size.
+    Args:
+        fence: checked in each batch's transaction before it commits (the
+               scheduler's leader lease); when it fails the batch is rolled back
+               and the tick stops
+    Returns:
+        dict with due, queued, skipped (no contact on the schedule's channels;
+        advanced without last_sent_at), disabled counts and fenced
+    """
+    now = now or datetime.utcnow()
+    batch_size = batch_size or settings.SCHEDULER_BATCH_SIZE
+    report = {'due': 0, 'queued': 0, 'skipped': 0, 'disabled': 0, 'fenced': False}
+
+    db = SessionLocal()
+    try:
+        while True:
+            rows = db.execute(
+                select(
+                    ReminderSchedule.id,
+                    ReminderSchedule.patient_id,
+                    ReminderSchedule.kind,
+                    ReminderSchedule.message,
+                    ReminderSchedule.time_of_day,
+                    ReminderSchedule.interval_minutes,
+                    ReminderSchedule.timezone,
+                    ReminderSchedule.channels,
+                    ReminderSchedule.next_due_at,
+                    Patient.first_name,
+                    Patient.last_name,
+                    Patient.emergency_contact
+                ).join(
+                    Patient, Patient.patient_id == ReminderSchedule.patient_id
+                ).where(
+                    ReminderSchedule.active.is_(True),
+                    ReminderSchedule.next_due_at <= now
+                ).order_by(ReminderSchedule.next_due_at).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+
+            advance = {}  # (next due time, sent) -> schedule ids
+            disabled = []
+            entries = {}  # kind -> outbox entries
+            for row in rows:
+                try:
+                    following = next_due(row.time_of_day, row.interval_minutes, row.timezone,
+                                         now, row.next_due_at)
+                except ValueError as e:
+                    logger.error(f"Reminder schedule {row.id} disabled: {e}")
+                    disabled.append(row.id)
+                    continue
+                contact = row.emergency_contact or {}
+                keys = [REMINDER_CHANNELS[c] for c in (row.channels or DEFAULT_CHANNELS).split(',')
+                        if c in REMINDER_CHANNELS]
+                channels = {key: contact[key] for key in keys if contact.get(key)}
+                advance.setdefault((following, bool(channels)), []).append(row.id)
+                if not channels:
+                    report['skipped'] += 1
+                    continue
+
+                entries.setdefault(row.kind, []).append({
+                    'patient_id': row.patient_id,
+                    # One delivery per schedule occurrence, however often the tick re-runs
+                    'idempotency_key': f"reminder:{row.id}:{row.next_due_at:%Y%m%d%H%M}",
+                    'payload': {
+                        'patient_name': f"{row.first_name} {row.last_name}",
+                        'message': row.message,
+                        **channels
+                    }
+                })
+
+            # Schedules sharing a time of day advance to the same instant: one UPDATE each
+            for (following, sent), ids in advance.items():
+                values = {'next_due_at': following}
+                if sent:
+                    values['last_sent_at'] = now
+                db.execute(update(ReminderSchedule).where(ReminderSchedule.id.in_(ids)).values(**values))
+            if disabled:
+                db.execute(
+                    update(ReminderSchedule).where(ReminderSchedule.id.in_(disabled)).values(active=False)
+                )
+
+            queued = sum(enqueue_notifications(db, kind, batch) for kind, batch in entries.items())
+            if fence is not None and not fence(db):
+                db.rollback()
+                report['fenced'] = True
+                logger.warning("Reminder tick stopped: this process no longer holds the scheduler lease")
+                break
+            db.commit()
+
+            report['queued'] += queued
+
+            report['due'] += len(rows)
+            report['disabled'] += len(disabled)
+            if len(rows) < batch_size:
+                break
+
+        if report['queued']:
+            outbox_worker.wake()
+        return report
+
+    except Exception:
+        db.rollback()
+        raise
+
+    finally:
+        db.close()
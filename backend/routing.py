@@ -0,0 +1,138 @@
+"""
+Model Routing - Pick a Gemini model per capability, with fallback
+Capabilities map to a tier (fast: guidance and plans, strong: triage);
+each tier is an ordered list of models. A model that was rate limited is
+cooled down and one whose recent latency exceeds the tier's budget is
+demoted, so calls go to the next model in the list until it recovers.
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
+
+EWMA_ALPHA = 0.3
+
+
+def _models(value: str) -> List[str]:
+    return [model.strip() for model in value.split(',') if model.strip()]
+
+
+class ModelHealth:
+    """Recent behaviour of one model"""
+
+    __slots__ = ('ewma_seconds', 'last_observed', 'cooldown_until', 'calls', 'rate_limited', 'errors')
+
+    def __init__(self):
+        self.ewma_seconds: Optional[float] = None
+        self.last_observed = 0.0
+        self.cooldown_until = 0.0
+        self.calls = 0
+        self.rate_limited = 0
+        self.errors = 0
+
+
+class ModelRouter:
+    """Capability -> tier -> ordered models, reordered by health"""
+
+    def __init__(self):
+        """Initialize router from settings"""
+        self.tiers: Dict[str, List[str]] = {
+            'fast': _models(settings.LLM_FAST_MODELS),
+            'strong': _models(settings.LLM_STRONG_MODELS),
+        }
+        self.budgets = {
+            'fast': settings.LLM_FAST_LATENCY_BUDGET_SECONDS,
+            'strong': settings.LLM_STRONG_LATENCY_BUDGET_SECONDS,
+        }
+        self.strong_capabilities = set(_models(settings.LLM_STRONG_CAPABILITIES))
+        self._lock = threading.Lock()
+        self._health: Dict[str, ModelHealth] = {}
+
+    def tier(self, capability: str) -> str:
+        return 'strong' if capability in self.strong_capabilities else 'fast'
+
+    def primary(self, capability: str) -> str:
+        """First model of the capability's tier (ignoring health)"""
+        return self.tiers[self.tier(capability)][0]
+
+    def _state(self, model: str, tier: str, now: float) -> str:
+        """ok, cooling (rate limited recently) or slow (recent latency over the tier budget)"""
+        health = self._health.get(model)
+        if health is None:
+            return 'ok'
+        if now < health.cooldown_until:
+            return 'cooling'
+        # Slowness is forgotten after a cooldown without calls, so a demoted model gets probed again
+        if (health.ewma_seconds is not None and health.ewma_seconds > self.budgets[tier]
+                and now - health.last_observed < settings.LLM_MODEL_COOLDOWN_SECONDS):
+            return 'slow'
+        return 'ok'
+
+    def route(self, capability: str) -> Tuple[List[str], str]:
+        """
+        Models to try for one call, best first
+        Returns:
+            (models, route) - route is 'primary', or why the primary was skipped
+        """
+        tier = self.tier(capability)
+        now = time.monotonic()
+        with self._lock:
+            states = {model: self._state(model, tier, now) for model in self.tiers[tier]}
+        ordered = sorted(self.tiers[tier], key=lambda m: ('ok', 'slow', 'cooling').index(states[m]))
+
+        primary = self.tiers[tier][0]
+        if ordered[0] == primary:
+            return ordered, 'primary'
+        reason = 'rate_limited' if states[primary] == 'cooling' else 'slow'
+        return ordered, f'{reason}_skipped'
+
+    def expected_seconds(self, model: str) -> Optional[float]:
+        """Recent latency of a model (None before its first successful call)"""
+        health = self._health.get(model)
+        return health.ewma_seconds if health else None
+
+    def observe(self, model: str, seconds: float, outcome: str):
+        """
+        Record one call
+        Args:
+            outcome: success, rate_limited or error
+        """
+        now = time.monotonic()
+        with self._lock:
+            health = self._health.setdefault(model, ModelHealth())
+            health.calls += 1
+            health.last_observed = now
+            if outcome == 'rate_limited':
+                health.rate_limited += 1
+                health.cooldown_until = now + settings.LLM_MODEL_COOLDOWN_SECONDS
+            elif outcome == 'error':
+                health.errors += 1
+            else:
+                health.ewma_seconds = seconds if health.ewma_seconds is None else (
+                    EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * health.ewma_seconds)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            models = {
+                model: {
+                    'calls': health.calls,
+                    'ewma_ms': round(health.ewma_seconds * 1000, 1) if health.ewma_seconds is not None else None,
+                    'rate_limited': health.rate_limited,
+                    'errors': health.errors,
+                    'cooldown_seconds': round(max(0.0, health.cooldown_until - now), 1)
+                }
+                for model, health in self._health.items()
+            }
+        return {
+            'tiers': self.tiers,
+            'latency_budget_seconds': self.budgets,
+            'strong_capabilities': sorted(self.strong_capabilities),
+            'models': models
+        }
+
+
+# Global instance
+model_router = ModelRouter()
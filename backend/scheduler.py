@@ -3,76 +3,207 @@ Scheduler Service - Automated Reminders
 Background task scheduler for patient reminders
 """
 
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
-from datetime import datetime
-from sqlalchemy.orm import Session
-from database import SessionLocal
-from models import Patient
-from notifications import notification_service
+from config import settings
+from reminders import process_due, seed_default_schedules
+from audit_partitions import audit_partitions
+import guidance
+from leader import LeaderElector
+from metrics import job_latency
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+
 class ReminderScheduler:
     """Automated reminder scheduler"""
     
     def __init__(self):
-        """Initialize scheduler"""
-        self.scheduler = BackgroundScheduler()
-        self.scheduler.start()
-        print("✅ Reminder scheduler started")
-    
-    def schedule_medication_reminders(self):
-        """Schedule medication reminders"""
-        medication_times = ["08:00", "14:00", "20:00"]
-        
-        for time_str in medication_times:
-            hour, minute = map(int, time_str.split(':'))
-            self.scheduler.add_job(
-                self.send_medication_reminders,
-                CronTrigger(hour=hour, minute=minute),
-                id=f'medication_{time_str}',
-                replace_existing=True
-            )
+        """Initialize scheduler (jobs only run while this process holds the leader lease)"""
+        self._scheduler = None
+        self.mode = settings.SCHEDULER_MODE
+        self.elector = LeaderElector(
+            'reminder_scheduler',
+            settings.SCHEDULER_LEASE_SECONDS,
+            on_elected=self._on_elected,
+            on_demoted=self._on_demoted
+        )
+    
+    @property
+    def scheduler(self):
+        """APScheduler instance, created on first use (imported lazily)"""
+        if self._scheduler is None:
+            from apscheduler.schedulers.background import BackgroundScheduler
+            # Jobs due during a leader failover run late on the new leader instead of being dropped
+            self._scheduler = BackgroundScheduler(job_defaults={
+                'misfire_grace_time': settings.SCHEDULER_MISFIRE_GRACE_SECONDS,
+                'coalesce': True
+            })
+        return self._scheduler
+    
+    def _on_elected(self):
+        """Leader: run jobs"""
+        try:
+            seeded = seed_default_schedules()
+            if seeded:
+                print(f"📅 Seeded {seeded} default reminder schedules")
+        except Exception as e:
+            logger.error(f"Reminder seeding error: {e}")
+        from apscheduler.schedulers import SchedulerNotRunningError
+        try:
+            self.scheduler.resume()
+        except SchedulerNotRunningError:
+            return  # shutting down
+        print("✅ Reminder scheduler running (leader)")
+    
+    def _on_demoted(self):
+        """
+        Follower: keep jobs registered but don't run them. A job already running
+        finishes on its own thread; its writes are fenced by the lease (see
+        leader.holds_lease), so it stops rather than race the new leader.
+        """
+        from apscheduler.schedulers import SchedulerNotRunningError
+        try:
+            self.scheduler.pause()
+        except SchedulerNotRunningError:
+            return  # shutting down
+        print("⏸️ Reminder scheduler paused (not leader)")
+    
+    @property
+    def active(self) -> bool:
+        """Jobs are firing in this process"""
+        from apscheduler.schedulers.base import STATE_RUNNING
+        return self._scheduler is not None and self._scheduler.state == STATE_RUNNING
+    
+    def schedule_reminder_tick(self):
+        """Poll reminder schedules for due rows"""
+        from apscheduler.triggers.interval import IntervalTrigger
+        self.scheduler.add_job(
+            self.run_reminder_tick,
+            IntervalTrigger(seconds=settings.REMINDER_TICK_SECONDS),
+            id='reminder_tick',
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True
+        )
         
-        print(f"📅 Medication reminders scheduled: {', '.join(medication_times)}")
+        print(f"📅 Reminder schedules polled every {settings.REMINDER_TICK_SECONDS}s")
     
-    def send_medication_reminders(self):
-        """Send medication reminders to all patients"""
-        db = SessionLocal()
+    def run_reminder_tick(self):
+        """Queue due reminders (delivered by the outbox worker)"""
+        started = time.perf_counter()
         try:
-            patients = db.query(Patient).all()
-            
-            for patient in patients:
-                contact = patient.emergency_contact or {}
-                phone = contact.get('phone')
-                
-                if phone:
-                    notification_service.send_medication_reminder(
-                        patient_name=f"{patient.first_name} {patient.last_name}",
-                        medication="Your prescribed medication",
-                        phone=phone
-                    )
-            
-            logger.info(f"Sent medication reminders to {len(patients)} patients")
+            report = process_due(fence=self.elector.holds_lease)
+            job_latency.observe(time.perf_counter() - started, 'reminder_tick', 'ok')
+            if report['due']:
+                logger.info(f"Reminder tick: {report}")
+            return report
+        except Exception as e:
+            job_latency.observe(time.perf_counter() - started, 'reminder_tick', 'error')
+            logger.error(f"Reminder tick error: {e}")
+    
+    def schedule_audit_maintenance(self):
+        """Schedule daily audit partition maintenance (off-peak)"""
+        from apscheduler.triggers.cron import CronTrigger
+        self.scheduler.add_job(
+            self.run_audit_maintenance,
+            CronTrigger(hour=2, minute=30),
+            id='audit_maintenance',
+            replace_existing=True
+        )
         
+        print("📅 Audit partition maintenance scheduled: 02:30")
+    
+    def run_audit_maintenance(self):
+        """Pre-create partitions, compact legacy rows and apply retention"""
+        started = time.perf_counter()
+        try:
+            audit_partitions.maintain(fence=self.elector.holds_lease)
+            job_latency.observe(time.perf_counter() - started, 'audit_maintenance', 'ok')
         except Exception as e:
-            logger.error(f"Error: {e}")
+            job_latency.observe(time.perf_counter() - started, 'audit_maintenance', 'error')
+            logger.error(f"Audit maintenance error: {e}")
+    
+    def schedule_guidance_precompute(self):
+        """Schedule daily guidance precompute (off-peak, within the quota budget)"""
+        if not settings.GUIDANCE_PRECOMPUTE_ENABLED:
+            return
+        from apscheduler.triggers.cron import CronTrigger
+        self.scheduler.add_job(
+            self.run_guidance_precompute,
+            CronTrigger(hour=settings.GUIDANCE_PRECOMPUTE_HOUR, minute=15),
+            id='guidance_precompute',
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True
+        )
         
-        finally:
-            db.close()
+        print(f"📅 Guidance precompute scheduled: {settings.GUIDANCE_PRECOMPUTE_HOUR:02d}:15")
+    
+    def run_guidance_precompute(self):
+        """Generate missing IV / diet / exercise answers for the current prompts"""
+        started = time.perf_counter()
+        try:
+            report = guidance.precompute(fence=self.elector.holds_lease)
+            job_latency.observe(time.perf_counter() - started, 'guidance_precompute', 'ok')
+            return report
+        except Exception as e:
+            job_latency.observe(time.perf_counter() - started, 'guidance_precompute', 'error')
+            logger.error(f"Guidance precompute error: {e}")
     
     def start_all_schedules(self):
-        """Start all scheduled reminders"""
-        self.schedule_medication_reminders()
-        print("✅ All reminder schedules activated")
+        """Register all jobs and start competing for leadership"""
+        self.schedule_reminder_tick()
+        self.schedule_audit_maintenance()
+        self.schedule_guidance_precompute()
+        
+        # Paused until elected, so N processes never fire the same job N times
+        self.scheduler.start(paused=True)
+        if self.mode == 'off':
+            print("ℹ️ Scheduler disabled in this process (SCHEDULER_MODE=off)")
+            return
+        self.elector.start()
+        print("✅ All reminder schedules registered (waiting for leadership)")
+    
+    def status(self) -> dict:
+        """Leadership and job state for this process"""
+        return {
+            'mode': self.mode,
+            'active': self.active,
+            'jobs': len(self.scheduler.get_jobs()),
+            'leader': self.elector.stats() if self.mode != 'off' else None
+        }
     
     def stop(self):
-        """Stop scheduler"""
-        self.scheduler.shutdown()
+        """Stop scheduler and hand leadership to another process"""
+        from apscheduler.schedulers.base import STATE_STOPPED
+        if self.mode != 'off':
+            self.elector.stop()
+        if self._scheduler is not None and self._scheduler.state != STATE_STOPPED:
+            self._scheduler.shutdown()
         print("👋 Scheduler stopped")
 
 
 # Global instance
-reminder_scheduler = ReminderScheduler()
\ No newline at end of file
+reminder_scheduler = ReminderScheduler()
+
+
+if __name__ == '__main__':
+    # Dedicated scheduler process: run with SCHEDULER_MODE=off on the web
+    # workers and start one (or more, for failover) of these
+    import signal
+    import threading
+    from database import init_db
+    
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+    
+    if reminder_scheduler.mode == 'off':
+        reminder_scheduler.mode = 'leader'
+    reminder_scheduler.start_all_schedules()
+    stopping.wait()
+    reminder_scheduler.stop()
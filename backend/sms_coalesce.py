@@ -0,0 +1,83 @@
+"""
+SMS Coalescing - Merge messages bound for the same phone
+Reminders that reach one phone within the coalescing window (families
+sharing an emergency contact, several reminder types at once) are packed
+into as few SMS as the segment limit allows
+"""
+
+from typing import List, Tuple
+
+# GSM 03.38 basic character set (+ extension table, which costs 2 septets)
+GSM_BASIC = set(
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+GSM_EXTENDED = set("^{}\\[~]|€")
+
+# Characters per SMS: (single message, per segment of a concatenated message)
+GSM_LIMITS = (160, 153)
+UCS2_LIMITS = (70, 67)
+
+SEPARATOR = "\n"
+
+
+def _is_gsm(text: str) -> bool:
+    return all(ch in GSM_BASIC or ch in GSM_EXTENDED for ch in text)
+
+
+def sms_length(text: str) -> Tuple[int, bool]:
+    """
+    Length in encoding units
+    Returns:
+        (units, is_gsm): septets for GSM-7, UTF-16 code units for UCS-2
+    """
+    if _is_gsm(text):
+        return sum(2 if ch in GSM_EXTENDED else 1 for ch in text), True
+    return len(text.encode('utf-16-le')) // 2, False
+
+
+def segment_count(text: str) -> int:
+    """Number of SMS segments the provider will bill for"""
+    units, gsm = sms_length(text)
+    single, per_segment = GSM_LIMITS if gsm else UCS2_LIMITS
+    if units <= single:
+        return 1
+    return -(-units // per_segment)
+
+
+def fits(text: str, max_segments: int) -> bool:
+    return segment_count(text) <= max_segments
+
+
+def merge_messages(texts: List[str], max_segments: int) -> List[Tuple[str, List[int]]]:
+    """
+    Pack messages into as few SMS as possible, in order
+    Identical texts are sent once. A text that alone exceeds the limit is
+    sent on its own, unchanged.
+    Args:
+        texts: message bodies
+        max_segments: segment budget per merged SMS
+    Returns:
+        list of (merged body, indexes of the texts it carries)
+    """
+    merged: List[Tuple[str, List[int]]] = []
+    seen = {}
+    body, members = None, []
+
+    for i, text in enumerate(texts):
+        if text in seen:
+            seen[text].append(i)
+            continue
+
+        candidate = text if body is None else body + SEPARATOR + text
+        if body is not None and not fits(candidate, max_segments):
+            merged.append((body, members))
+            candidate, members = text, []
+
+        body = candidate
+        members.append(i)
+        seen[text] = members
+
+    if body is not None:
+        merged.append((body, members))
+    return merged
@@ -0,0 +1,254 @@
+"""
+SMTP Connection Pool
+Keeps a few authenticated SMTP sessions alive and reuses them across
+messages instead of paying connect + STARTTLS + login per email
+"""
+
+import smtplib
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from email.message import Message
+from typing import List, Optional
+
+
+def is_disconnect(error: Exception) -> bool:
+    """
+    True if the session is gone and a fresh connection should be tried.
+    SMTPException subclasses OSError, so protocol errors (rejected
+    recipient, auth failure...) have to be told apart explicitly. A 421
+    reply (service closing the channel) counts as a disconnect: smtplib
+    closes the session on it and the message was not accepted.
+    """
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    if getattr(error, 'smtp_code', None) == 421:
+        return True
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return any(code == 421 for code, _ in error.recipients.values())
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+class _PooledConnection:
+    """An SMTP session plus bookkeeping"""
+
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.last_used = time.monotonic()
+        self.messages_sent = 0
+
+
+class SMTPConnectionPool:
+    """Thread-safe pool of authenticated SMTP sessions"""
+
+    def __init__(self, host: str, port: int, username: str = '', password: str = '',
+                 use_tls: bool = True, max_connections: int = 3,
+                 max_idle_seconds: float = 60, max_messages_per_connection: int = 100,
+                 timeout: float = 30):
+        """
+        Args:
+            host/port: SMTP server
+            username/password: login credentials (login skipped if empty)
+            use_tls: run STARTTLS after connecting
+            max_connections: max concurrent sessions
+            max_idle_seconds: idle time after which a session is probed with NOOP
+            max_messages_per_connection: recycle a session after this many messages
+            timeout: socket timeout in seconds
+        """
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.max_connections = max_connections
+        self.max_idle_seconds = max_idle_seconds
+        self.max_messages_per_connection = max_messages_per_connection
+        self.timeout = timeout
+
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+        # Metrics
+        self.opened = 0
+        self.reused = 0
+        self.reconnects = 0
+        self.sent = 0
+
+    # ----------------------------------------
+    # Connections
+    # ----------------------------------------
+
+    def _connect(self) -> _PooledConnection:
+        """Open, secure and authenticate a new session"""
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            smtp.ehlo()
+            if self.use_tls:
+                smtp.starttls()
+                smtp.ehlo()
+            if self.username:
+                smtp.login(self.username, self.password)
+        except Exception:
+            self._close(smtp)
+            raise
+
+        self.opened += 1
+        return _PooledConnection(smtp)
+
+    @staticmethod
+    def _close(smtp: smtplib.SMTP):
+        """Close a session, ignoring errors from an already dead socket"""
+        try:
+            smtp.quit()
+        except Exception:
+            try:
+                smtp.close()
+            except Exception:
+                pass
+
+    def _is_alive(self, conn: _PooledConnection) -> bool:
+        """Probe a long-idle session (servers drop idle clients)"""
+        if time.monotonic() - conn.last_used < self.max_idle_seconds:
+            return True
+        try:
+            return conn.smtp.noop()[0] == 250
+        except Exception:
+            return False
+
+    def _checkout(self) -> _PooledConnection:
+        """Reuse an idle session if one is healthy, else open a new one"""
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                return self._connect()
+            if self._is_alive(conn):
+                self.reused += 1
+                return conn
+            self._close(conn.smtp)
+
+    def _checkin(self, conn: _PooledConnection):
+        """Return a session to the pool (or retire it)"""
+        conn.last_used = time.monotonic()
+        if conn.messages_sent >= self.max_messages_per_connection:
+            self._close(conn.smtp)
+            return
+        with self._lock:
+            self._idle.append(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a session for one or more sends
+        Usage:
+            with pool.connection() as conn:
+                conn.smtp.send_message(msg)
+        """
+        self._slots.acquire()
+        try:
+            conn = self._checkout()
+            try:
+                yield conn
+            except Exception as e:
+                if is_disconnect(e):
+                    self._close(conn.smtp)
+                else:
+                    # Protocol-level error (e.g. rejected recipient): session is still usable
+                    self._reset(conn)
+                raise
+            else:
+                self._checkin(conn)
+        finally:
+            self._slots.release()
+
+    def _reset(self, conn: _PooledConnection):
+        """RSET a session after a failed transaction, retire it if that fails"""
+        try:
+            conn.smtp.rset()
+            self._checkin(conn)
+        except Exception:
+            self._close(conn.smtp)
+
+    # ----------------------------------------
+    # Sending
+    # ----------------------------------------
+
+    def send_message(self, msg: Message, retries: int = 1):
+        """
+        Send one message over a pooled session
+        Args:
+            msg: email message
+            retries: reconnect attempts after a server-side disconnect
+        """
+        for attempt in range(retries + 1):
+            try:
+                with self.connection() as conn:
+                    conn.smtp.send_message(msg)
+                    conn.messages_sent += 1
+                self.sent += 1
+                return
+            except Exception as e:
+                if not is_disconnect(e) or attempt >= retries:
+                    raise
+                self.reconnects += 1
+
+    def send_many(self, messages: List[Message]) -> List[Optional[Exception]]:
+        """
+        Send a batch back-to-back over one session
+        Args:
+            messages: email messages
+        Returns:
+            list with None (sent) or the exception per message
+        """
+        errors: List[Optional[Exception]] = []
+
+        while len(errors) < len(messages):
+            try:
+                with self.connection() as conn:
+                    for msg in messages[len(errors):]:
+                        try:
+                            conn.smtp.send_message(msg)
+                        except Exception as e:
+                            if is_disconnect(e):
+                                raise
+                            conn.smtp.rset()
+                            errors.append(e)
+                        else:
+                            conn.messages_sent += 1
+                            self.sent += 1
+                            errors.append(None)
+            except Exception as e:
+                if not is_disconnect(e):
+                    # Could not even open a session - fail the rest of the batch
+                    errors.extend([e] * (len(messages) - len(errors)))
+                    break
+                # Session dropped mid-batch: retry that message once, then carry on
+                self.reconnects += 1
+                try:
+                    self.send_message(messages[len(errors)], retries=0)
+                    errors.append(None)
+                except Exception as e:
+                    errors.append(e)
+
+        return errors
+
+    def close(self):
+        """Close all idle sessions"""
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn in idle:
+            self._close(conn.smtp)
+
+    def stats(self) -> dict:
+        """Pool usage counters"""
+        return {
+            'idle_connections': len(self._idle),
+            'max_connections': self.max_connections,
+            'opened': self.opened,
+            'reused': self.reused,
+            'reconnects': self.reconnects,
+            'sent': self.sent
+        }
@@ -0,0 +1,348 @@
+"""
+Notification Templates - Compile once, render in batches
+Message templates are parsed once at import; fields shared by a whole
+batch (time, medication, CSS...) are baked in before rendering the
+per-recipient fields
+"""
+
+import time
+from datetime import datetime
+from string import Formatter
+from typing import Callable, Dict, Iterable, List, Optional
+
+from metrics import cache_lookup
+
+
+def _escape(text: str) -> str:
+    """Escape literal braces for str.format"""
+    return text.replace('{', '{{').replace('}', '}}')
+
+
+class MessageTemplate:
+    """A str.format template that can be partially applied"""
+
+    def __init__(self, source: str):
+        """
+        Args:
+            source: template text with {field} placeholders ({{ }} for literal braces)
+        """
+        self.source = source
+        # Parse once: validates the template and lists its fields
+        self._parts = list(Formatter().parse(source))
+        self.fields = tuple(sorted({field for _, field, _, _ in self._parts if field}))
+        self._render = self._compile()
+        self._static = source.format_map({}) if not self.fields else None
+        self._bound = {}
+
+    def _compile(self) -> Callable[[dict], str]:
+        """
+        Turn the parsed template into one f-string function, so rendering
+        doesn't re-parse the format string for every message
+        """
+        if not all(field is None or field.isidentifier() for _, field, _, _ in self._parts):
+            # Attribute/index lookups ({a.b}, {a[0]}): keep str.format semantics
+            return self.source.format_map
+
+        namespace = {}
+        pieces = []
+        for i, (literal, field, spec, conversion) in enumerate(self._parts):
+            if literal:
+                namespace[f'_l{i}'] = literal
+                pieces.append(f'{{_l{i}}}')
+            if field is None:
+                continue
+            if spec and '{' in spec:
+                return self.source.format_map
+            namespace[f'_s{i}'] = spec or ''
+            pieces.append(f'{{v[{field!r}]' + (f'!{conversion}' if conversion else '') + f':{{_s{i}}}}}')
+
+        code = 'lambda v: f' + repr(''.join(pieces))
+        return eval(code, namespace)
+
+    def render(self, values: dict) -> str:
+        """Render with all remaining fields"""
+        if self._static is not None:
+            return self._static
+        return self._render(values)
+
+    def bind(self, shared: dict) -> 'MessageTemplate':
+        """
+        Bake shared field values into a new template
+        Args:
+            shared: values identical for every recipient
+        Returns:
+            template with only the remaining fields left
+        """
+        names = [name for name in self.fields if name in shared]
+        if not names:
+            return self
+
+        key = tuple((name, str(shared[name])) for name in names)
+        bound = self._bound.get(key)
+        cache_lookup('template_bind', bound is not None)
+        if bound is None:
+            # Rebuild the source: baked-in values and literals are brace-escaped,
+            # remaining placeholders are kept as they were
+            pieces = []
+            for literal, field, spec, conversion in self._parts:
+                pieces.append(_escape(literal))
+                if field is None:
+                    continue
+                if field in shared:
+                    pieces.append(_escape(format(shared[field], spec or '')))
+                else:
+                    pieces.append('{' + field + ('!' + conversion if conversion else '')
+                                  + (':' + spec if spec else '') + '}')
+            bound = MessageTemplate(''.join(pieces))
+            if len(self._bound) >= 256:
+                self._bound.clear()
+            self._bound[key] = bound
+        return bound
+
+    def render_batch(self, rows: Iterable[dict], shared: Optional[dict] = None) -> List[str]:
+        """Render one message per row in a single pass"""
+        template = self.bind(shared) if shared else self
+        if template._static is not None:
+            return [template._static for _ in rows]
+        render = template._render
+        return [render(row) for row in rows]
+
+
+_clock_cache = {}
+
+
+def current_time(fmt: str) -> str:
+    """datetime.now().strftime(fmt), computed at most once per second per format"""
+    second = int(time.time())
+    cached = _clock_cache.get(fmt)
+    if cached is None or cached[0] != second:
+        cached = (second, datetime.now().strftime(fmt))
+        _clock_cache[fmt] = cached
+    return cached[1]
+
+
+# ============================================
+# Shared fragments
+# ============================================
+
+SIGNATURE = """Best regards,
+Nurse Triage System"""
+
+MEDICATION_STYLE = """        body { font-family: Arial, sans-serif; }
+        .container { max-width: 600px; margin: 20px auto; padding: 20px; border: 1px solid #ddd; border-radius: 8px; }
+        .header { background-color: #0d6efd; color: white; padding: 15px; border-radius: 5px; }
+        .content { padding: 20px; }
+        .medication { background-color: #f8f9fa; padding: 15px; margin: 15px 0; border-left: 4px solid #28a745; }
+        .footer { color: #666; font-size: 12px; margin-top: 20px; }
+"""
+
+CRITICAL_STYLE = """        body { font-family: Arial, sans-serif; }
+        .container { max-width: 600px; margin: 20px auto; padding: 20px; border: 3px solid #d9534f; border-radius: 8px; }
+        .header { background-color: #d9534f; color: white; padding: 15px; border-radius: 5px; }
+        .alert { background-color: #f2dede; padding: 15px; margin: 15px 0; border-left: 4px solid #d9534f; }
+        .info { padding: 10px; background-color: #f8f9fa; margin: 10px 0; }
+"""
+
+FRAGMENTS = {
+    'signature': SIGNATURE,
+}
+
+
+def _compile(source: str, **fragments) -> MessageTemplate:
+    """Compile a template with shared fragments baked in"""
+    return MessageTemplate(source).bind({**FRAGMENTS, **fragments})
+
+
+# ============================================
+# Message templates
+# ============================================
+
+TEMPLATES: Dict[str, Dict[str, MessageTemplate]] = {
+    'medication': {
+        'sms': _compile("🏥 Reminder: {patient_name}, it's time for your medication: {medication}. Time: {time}"),
+        'subject': _compile("Medication Reminder - {medication}"),
+        'text': _compile("""
+Dear {patient_name},
+
+This is a reminder to take your medication:
+
+Medication: {medication}
+Time: {time}
+
+Please take your medication as prescribed by your doctor.
+
+{signature}
+"""),
+        'html': _compile("""
+<!DOCTYPE html>
+<html>
+<head>
+    <style>
+{style}    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h2>🏥 Medication Reminder</h2>
+        </div>
+        <div class="content">
+            <p>Dear {patient_name},</p>
+            <p>This is a reminder to take your medication:</p>
+            <div class="medication">
+                <strong>Medication:</strong> {medication}<br>
+                <strong>Time:</strong> {time}
+            </div>
+            <p>Please take your medication as prescribed by your doctor.</p>
+        </div>
+        <div class="footer">
+            <p>Best regards,<br>Nurse Triage System</p>
+        </div>
+    </div>
+</body>
+</html>
+""", style=MEDICATION_STYLE),
+    },
+    'vitals': {
+        'sms': _compile("🏥 Reminder: {patient_name}, please check your vitals (BP, HR, Temperature). Report to nurse station."),
+        'subject': _compile("Vitals Check Reminder"),
+        'text': _compile("""
+Dear {patient_name},
+
+This is a reminder to check your vital signs:
+
+• Blood Pressure
+• Heart Rate
+• Temperature
+
+Please report to the nurse station for vitals monitoring.
+
+{signature}
+"""),
+    },
+    'critical_alert': {
+        'sms': _compile("🚨 CRITICAL ALERT: Patient {patient_id} ({patient_name}) - {emergency_level}. {reasoning_short}... Check dashboard immediately."),
+        'subject': _compile("🚨 CRITICAL ALERT - Patient {patient_id}"),
+        'text': _compile("""
+CRITICAL PATIENT ALERT
+
+Patient ID: {patient_id}
+Patient Name: {patient_name}
+Emergency Level: {emergency_level}
+
+Reasoning: {reasoning}
+
+ACTION REQUIRED: Please check the patient immediately and review the triage dashboard.
+
+Time: {timestamp}
+
+{signature}
+"""),
+        'html': _compile("""
+<!DOCTYPE html>
+<html>
+<head>
+    <style>
+{style}    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h2>🚨 CRITICAL PATIENT ALERT</h2>
+        </div>
+        <div class="alert">
+            <p><strong>Patient ID:</strong> {patient_id}</p>
+            <p><strong>Patient Name:</strong> {patient_name}</p>
+            <p><strong>Emergency Level:</strong> {emergency_level}</p>
+        </div>
+        <div class="info">
+            <p><strong>Reasoning:</strong></p>
+            <p>{reasoning}</p>
+        </div>
+        <p style="color: #d9534f;"><strong>ACTION REQUIRED:</strong> Please check the patient immediately.</p>
+        <p style="color: #666; font-size: 12px;">Time: {timestamp}</p>
+    </div>
+</body>
+</html>
+""", style=CRITICAL_STYLE),
+    },
+    'diet': {
+        'sms': _compile("🍽️ Diet Reminder: {patient_name}, time for your meal: {diet_item}. Follow your prescribed diet plan."),
+        'subject': _compile("Diet Reminder"),
+        'text': _compile("""
+Dear {patient_name},
+
+Diet Reminder: {diet_item}
+
+Please follow your prescribed diet plan as recommended by your doctor.
+
+{signature}
+"""),
+    },
+    'exercise': {
+        'sms': _compile("🏃 Exercise Reminder: {patient_name}, it's time for: {exercise}. Follow your physiotherapy schedule."),
+        'subject': _compile("Exercise/Physiotherapy Reminder"),
+        'text': _compile("""
+Dear {patient_name},
+
+Exercise Reminder: {exercise}
+
+Please follow your prescribed physiotherapy schedule.
+
+{signature}
+"""),
+    },
+}
+
+
+def clock_values() -> dict:
+    """Time fields used by the templates (shared by a whole batch)"""
+    return {
+        'time': current_time("%I:%M %p"),
+        'timestamp': current_time("%Y-%m-%d %H:%M:%S")
+    }
+
+
+def _prepare(kind: str, values: dict) -> dict:
+    """Derived fields"""
+    if kind == 'critical_alert' and 'reasoning_short' not in values:
+        values = {**values, 'reasoning_short': (values.get('reasoning') or '')[:100]}
+    return values
+
+
+def render(kind: str, values: dict) -> Dict[str, str]:
+    """
+    Render every part of one message
+    Args:
+        kind: medication, vitals, critical_alert, diet or exercise
+        values: template fields
+    Returns:
+        dict with sms, subject, text and (optionally) html
+    """
+    values = _prepare(kind, {**clock_values(), **values})
+    return {part: template.render(values) for part, template in TEMPLATES[kind].items()}
+
+
+def render_batch(kind: str, rows: List[dict], shared: Optional[dict] = None) -> List[Dict[str, str]]:
+    """
+    Render personalized messages for a batch of recipients in one pass
+    Args:
+        kind: medication, vitals, critical_alert, diet or exercise
+        rows: per-recipient fields (e.g. patient_name)
+        shared: fields identical for the whole batch (e.g. medication)
+    Returns:
+        one dict (sms, subject, text, html) per row
+    """
+    shared = {**clock_values(), **(shared or {})}
+    if 'reasoning' in shared:
+        shared = _prepare(kind, shared)
+    else:
+        rows = [_prepare(kind, row) for row in rows]
+
+    rendered = {
+        part: template.render_batch(rows, shared)
+        for part, template in TEMPLATES[kind].items()
+    }
+    return [
+        {part: messages[i] for part, messages in rendered.items()}
+        for i in range(len(rows))
+    ]
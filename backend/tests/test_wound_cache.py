@@ -0,0 +1,38 @@
+import time
+
+from wound_cache import WoundCache, decisive_terms, minhash, normalize
+
+
+def _cache(*descriptions):
+    """WoundCache indexed in memory only (refresh() skipped)"""
+    cache = WoundCache()
+    cache.threshold = 0.7
+    cache._refreshed = time.monotonic()
+    for entry_id, description in enumerate(descriptions, start=1):
+        tokens = normalize(description)
+        cache._index(entry_id, tokens, minhash(tokens), {'description': description})
+    return cache
+
+
+def test_negation_is_bound_to_its_finding():
+    pus = normalize("Cut on forearm with pus, no bleeding")
+    bleeding = normalize("Cut on forearm with bleeding, no pus")
+    assert pus != bleeding
+    assert {'pus', 'no_bleeding'} <= pus
+    assert {'bleeding', 'no_pus'} <= bleeding
+    assert decisive_terms(pus) != decisive_terms(bleeding)
+
+
+def test_swapped_negation_is_not_a_hit():
+    cache = _cache("Cut on forearm with pus, no bleeding")
+    assert cache.lookup("Cut on forearm with bleeding, no pus") is None
+    assert cache.lookup("cut on the forearm with pus, no bleeding")['entry_id'] == 1
+
+
+def test_sizes_must_match():
+    small = normalize("2 cm cut on forearm, bleeding controlled")
+    large = normalize("9 cm cut on forearm, bleeding controlled")
+    assert 'size_2to5cm' in small and 'size_gt5cm' in large
+    cache = _cache("2 cm cut on forearm, bleeding controlled")
+    assert cache.lookup("9 cm cut on forearm, bleeding controlled") is None
+    assert cache.lookup("20 mm cut on forearm, bleeding controlled")['entry_id'] == 1
@@ -0,0 +1,336 @@
+"""
+Tracing - Per-request spans with a propagated request id
+Each HTTP request opens a trace (request id from X-Request-ID, or a new
+one); spans opened below it - endpoint steps, agent calls, SQL statements,
+notification sends - nest under it through a context variable. Finished
+traces are written by a background thread as OTLP/JSON lines (one
+ExportTraceServiceRequest per line, the OpenTelemetry file exporter format).
+"""
+
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = 'nurse-triage-api'
+
+# OTLP span kinds
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+
+class Trace:
+    """Spans of one request"""
+
+    def __init__(self, request_id: str, sampled: bool):
+        self.trace_id = uuid.uuid4().hex
+        self.request_id = request_id
+        self.sampled = sampled
+        self.spans: List['Span'] = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def add(self, span: 'Span'):
+        with self._lock:
+            if len(self.spans) < settings.TRACE_MAX_SPANS:
+                self.spans.append(span)
+            else:
+                self.dropped += 1
+
+    def breakdown(self) -> dict:
+        """Finished span time by name (ms), for storing alongside results"""
+        totals: Dict[str, float] = {}
+        with self._lock:
+            spans = [s for s in self.spans if s.duration is not None and s.parent_id is not None]
+        for span in spans:
+            totals[span.name] = totals.get(span.name, 0.0) + span.duration * 1000
+        return {
+            'request_id': self.request_id,
+            'trace_id': self.trace_id,
+            'spans_ms': {name: round(ms, 2) for name, ms in totals.items()}
+        }
+
+
+class Span:
+    """One timed operation"""
+
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'kind', 'attributes', 'status',
+                 'start_ns', '_started', 'duration')
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str], kind: int, attributes: dict):
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.status = None
+        self.start_ns = time.time_ns()
+        self._started = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def fail(self, error: BaseException):
+        self.status = 'error'
+        self.attributes['error.type'] = type(error).__name__
+        self.attributes['error.message'] = str(error)[:200]
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._started
+        self.trace.add(self)
+
+    def to_otlp(self) -> dict:
+        span = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.start_ns + int((self.duration or 0) * 1e9)),
+            'attributes': _otlp_attributes(self.attributes),
+            'status': {'code': 2} if self.status == 'error' else {'code': 1}
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+def _otlp_attributes(attributes: dict) -> list:
+    encoded = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            typed = {'boolValue': value}
+        elif isinstance(value, int):
+            typed = {'intValue': str(value)}
+        elif isinstance(value, float):
+            typed = {'doubleValue': value}
+        else:
+            typed = {'stringValue': str(value)}
+        encoded.append({'key': key, 'value': typed})
+    return encoded
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    span = _current_span.get()
+    return span.trace if span else None
+
+
+def request_id() -> Optional[str]:
+    """Request id of the trace in progress (None outside a request)"""
+    span = _current_span.get()
+    return span.trace.request_id if span else None
+
+
+@contextmanager
+def span(name: str, kind: int = KIND_INTERNAL, **attributes):
+    """
+    Time a block as a child of the current span
+    Outside a trace (background threads, tracing off) this is a no-op
+    and yields None.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    current = Span(parent.trace, name, parent.span_id, kind, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.fail(e)
+        raise
+    finally:
+        current.finish()
+        _current_span.reset(token)
+
+
+def start_span(name: str, kind: int = KIND_CLIENT, **attributes) -> Optional[Span]:
+    """
+    Child span that is not made current (finish() it yourself); for
+    callback pairs such as SQLAlchemy before/after cursor events
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    return Span(parent.trace, name, parent.span_id, kind, attributes)
+
+
+@contextmanager
+def start_trace(name: str, request_id: Optional[str] = None, kind: int = KIND_SERVER, **attributes):
+    """Open a trace with a root span; the finished trace is exported if sampled"""
+    trace = Trace(request_id or uuid.uuid4().hex, random.random() < settings.TRACE_SAMPLE_RATE)
+    root = Span(trace, name, None, kind, {'request.id': trace.request_id, **attributes})
+    token = _current_span.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.fail(e)
+        raise
+    finally:
+        root.finish()
+        _current_span.reset(token)
+        if trace.sampled:
+            exporter.submit(trace)
+
+
+# ============================================
+# Export
+# ============================================
+
+class TraceExporter:
+    """Background JSONL writer; drops traces rather than slowing requests when behind"""
+
+    def __init__(self, path: str, max_queue: int = 1000, max_file_bytes: int = 100 * 1024 * 1024):
+        self.path = path
+        self.max_file_bytes = max_file_bytes
+        self._queue: 'queue.Queue[Optional[Trace]]' = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self.exported = 0
+        self.dropped = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    def submit(self, trace: Trace):
+        if self._thread is None:
+            return
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            trace = self._queue.get()
+            if trace is None:
+                return
+            batch = [trace]
+            # Write whatever else is queued in the same pass
+            while True:
+                try:
+                    trace = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if trace is None:
+                    self._write(batch)
+                    return
+                batch.append(trace)
+            self._write(batch)
+
+    def _write(self, traces: List[Trace]):
+        try:
+            self._rotate()
+            with open(self.path, 'a', encoding='utf-8') as f:
+                for trace in traces:
+                    f.write(json.dumps(self.encode(trace), separators=(',', ':')) + '\n')
+            self.exported += len(traces)
+        except Exception as e:
+            self.dropped += len(traces)
+            logger.error(f"Trace export failed: {e}")
+
+    def _rotate(self):
+        try:
+            if os.path.getsize(self.path) >= self.max_file_bytes:
+                os.replace(self.path, self.path + '.1')
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def encode(trace: Trace) -> dict:
+        """One OTLP/JSON ExportTraceServiceRequest"""
+        return {
+            'resourceSpans': [{
+                'resource': {'attributes': _otlp_attributes({'service.name': SERVICE_NAME})},
+                'scopeSpans': [{
+                    'scope': {'name': 'nurse-triage'},
+                    'spans': [span.to_otlp() for span in trace.spans]
+                }]
+            }]
+        }
+
+    def stats(self) -> dict:
+        return {
+            'path': self.path,
+            'sample_rate': settings.TRACE_SAMPLE_RATE,
+            'queued': self._queue.qsize(),
+            'exported': self.exported,
+            'dropped': self.dropped
+        }
+
+
+# ============================================
+# HTTP middleware
+# ============================================
+
+class TracingMiddleware:
+    """
+    ASGI middleware: one trace per HTTP request, named after the route
+    template; the request id is echoed back in X-Request-ID
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not settings.TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        incoming = None
+        for key, value in scope.get('headers', ()):
+            if key == b'x-request-id':
+                incoming = value.decode('latin-1')[:64]
+                break
+
+        with start_trace(f"{scope['method']} {scope['path']}", incoming,
+                         **{'http.method': scope['method'], 'http.target': scope['path']}) as root:
+            header = (b'x-request-id', root.trace.request_id.encode('latin-1'))
+
+            async def send_wrapper(message):
+                if message['type'] == 'http.response.start':
+                    root.set(**{'http.status_code': message['status']})
+                    if message['status'] >= 500:
+                        root.status = 'error'
+                    message = {**message, 'headers': [*message.get('headers', []), header]}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = getattr(scope.get('route'), 'path', None)
+                if route:
+                    root.name = f"{scope['method']} {route}"
+                    root.set(**{'http.route': route})
+
+
+# Global instance (started by the app lifespan)
+exporter = TraceExporter(settings.TRACE_EXPORT_PATH, max_file_bytes=int(settings.TRACE_MAX_FILE_MB * 1024 * 1024))
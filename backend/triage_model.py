@@ -0,0 +1,450 @@
+"""
+Local Triage Classifier - Emergency level from vitals without a model call
+Multinomial logistic regression (NumPy) trained offline on stored
+assessments: the vitals a nurse recorded -> the emergency level Gemini
+gave. analyze_vitals answers with it when it is at least
+TRIAGE_MODEL_MIN_CONFIDENCE sure and the vital sign rules don't call for a
+higher level; everything else still goes to Gemini.
+
+Models are versioned files in TRIAGE_MODEL_DIR; ACTIVE names the one in use:
+    python triage_model.py train [--activate]
+    python triage_model.py evaluate [VERSION] [--all]
+    python triage_model.py list
+    python triage_model.py activate VERSION
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from config import settings
+from database import SessionLocal
+from metrics import registry
+from models import Assessment
+from provisional import ACTIONS, parse_blood_pressure, rule_based_analysis
+
+logger = logging.getLogger(__name__)
+
+# Index = severity, so "higher level" comparisons are index comparisons
+LEVELS = ('STABLE', 'MODERATE', 'CRITICAL')
+FEATURES = ('heart_rate', 'systolic', 'diastolic', 'temperature',
+            'heart_rate_dev2', 'systolic_dev2', 'diastolic_dev2', 'temperature_dev2')
+# Squared distance from these lets a linear model flag values that are too low as well as too high
+NORMAL = (75.0, 120.0, 80.0, 98.6)
+ACTIVE_FILE = 'ACTIVE'
+HOLDOUT_SHARE = 0.2
+SOURCE = 'local_model'
+
+triage_decisions = registry.counter('triage_model_decisions_total', "analyze_vitals calls checked against the "
+                                    "local triage classifier", ('outcome',))
+
+
+def feature_row(heart_rate: float, systolic: float, diastolic: float, temperature: float) -> List[float]:
+    values = (float(heart_rate), float(systolic), float(diastolic), float(temperature))
+    return list(values) + [(value - normal) ** 2 for value, normal in zip(values, NORMAL)]
+
+
+def normalize_level(text: Optional[str]) -> Optional[str]:
+    """CRITICAL / MODERATE / STABLE from a model's level text (None if missing or ambiguous)"""
+    found = [level for level in LEVELS if level in str(text or '').upper()]
+    return found[0] if len(found) == 1 else None
+
+
+def _training_row(emergency_level: Optional[str], data: Optional[dict]) -> Optional[Tuple[List[float], int]]:
+    """(features, label) for one assessment, or None if it can't be used"""
+    data = data or {}
+    analysis = data.get('analysis') or {}
+    provisional = data.get('provisional') or {}
+    # Only Gemini's answers: not our own, and not rule-based ones that were never refined
+    if analysis.get('source') == SOURCE:
+        return None
+    if 'analysis' in provisional.get('parts', {}) and provisional.get('refinement') != 'refined':
+        return None
+    level = normalize_level(emergency_level)
+    vitals = data.get('vitals') or {}
+    systolic, diastolic = parse_blood_pressure(vitals.get('blood_pressure', ''))
+    if level is None or systolic is None or vitals.get('heart_rate') is None or vitals.get('temperature') is None:
+        return None
+    return feature_row(vitals['heart_rate'], systolic, diastolic, vitals['temperature']), LEVELS.index(level)
+
+
+def load_examples(after_id: int = 0, batch_size: Optional[int] = None) -> Tuple[List[List[float]], List[int], int]:
+    """
+    Labelled vitals from stored assessments, oldest first
+    Returns:
+        (features, labels, last assessment id read)
+    """
+    batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+    features, labels = [], []
+    last_id = after_id
+    db = SessionLocal()
+    try:
+        while True:
+            rows = db.execute(
+                select(Assessment.id, Assessment.emergency_level, Assessment.assessment_data).where(
+                    Assessment.id > last_id
+                ).order_by(Assessment.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            for row in rows:
+                example = _training_row(row.emergency_level, row.assessment_data)
+                if example:
+                    features.append(example[0])
+                    labels.append(example[1])
+    finally:
+        db.close()
+    return features, labels, last_id
+
+
+class TriageModel:
+    """One trained version: standardization + softmax weights"""
+
+    def __init__(self, version: str, mean, std, weights, meta: dict):
+        self.version = version
+        self.mean = mean
+        self.std = std
+        self.weights = weights  # (len(FEATURES) + 1) x len(LEVELS), bias last
+        self.meta = meta
+
+    @classmethod
+    def fit(cls, features: List[List[float]], labels: List[int], version: str,
+            epochs: int = 2000, learning_rate: float = 0.5, l2: float = 1e-3) -> 'TriageModel':
+        """Full-batch gradient descent; classes weighted so rare CRITICAL cases count as much as STABLE ones"""
+        import numpy as np
+
+        x = np.asarray(features, dtype=float)
+        y = np.asarray(labels, dtype=int)
+        mean = x.mean(axis=0)
+        std = x.std(axis=0)
+        std[std == 0] = 1.0
+        x = np.hstack([(x - mean) / std, np.ones((len(x), 1))])
+        targets = np.eye(len(LEVELS))[y]
+        counts = np.bincount(y, minlength=len(LEVELS)).astype(float)
+        sample_weight = (len(y) / (len(LEVELS) * np.maximum(counts, 1)))[y][:, None]
+
+        weights = np.zeros((x.shape[1], len(LEVELS)))
+        for _ in range(epochs):
+            gradient = x.T @ ((_softmax(x @ weights) - targets) * sample_weight) / len(x)
+            gradient[:-1] += l2 * weights[:-1]
+            weights -= learning_rate * gradient
+        return cls(version, mean, std, weights, {'version': version, 'features': list(FEATURES)})
+
+    def probabilities(self, features: List[List[float]]):
+        import numpy as np
+
+        x = (np.asarray(features, dtype=float) - self.mean) / self.std
+        return _softmax(x @ self.weights[:-1] + self.weights[-1])
+
+    def predict(self, heart_rate: float, systolic: float, diastolic: float, temperature: float) -> Tuple[str, float]:
+        """(level, confidence) for one set of vitals"""
+        probabilities = self.probabilities([feature_row(heart_rate, systolic, diastolic, temperature)])[0]
+        best = int(probabilities.argmax())
+        return LEVELS[best], float(probabilities[best])
+
+    def save(self, directory: str) -> str:
+        import numpy as np
+
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"triage-{self.version}.npz")
+        np.savez(path, mean=self.mean, std=self.std, weights=self.weights, meta=np.array(json.dumps(self.meta)))
+        return path
+
+    @classmethod
+    def load(cls, directory: str, version: str) -> 'TriageModel':
+        import numpy as np
+
+        with np.load(os.path.join(directory, f"triage-{version}.npz"), allow_pickle=False) as stored:
+            meta = json.loads(str(stored['meta']))
+            return cls(version, stored['mean'], stored['std'], stored['weights'], meta)
+
+
+def _softmax(logits):
+    import numpy as np
+
+    exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def evaluate(model: TriageModel, features: List[List[float]], labels: List[int],
+             min_confidence: Optional[float] = None) -> dict:
+    """
+    Accuracy overall and on the answers confident enough to be served
+    Returns:
+        dict with samples, accuracy, confident (answers served locally),
+        coverage (their share), confident_accuracy, under_triage (confident
+        answers below the labelled level), per-level recall and the
+        confusion matrix
+    """
+    import numpy as np
+
+    if min_confidence is None:
+        min_confidence = settings.TRIAGE_MODEL_MIN_CONFIDENCE
+    if not labels:
+        return {'samples': 0}
+    probabilities = model.probabilities(features)
+    predicted = probabilities.argmax(axis=1)
+    confident = probabilities.max(axis=1) >= min_confidence
+    y = np.asarray(labels, dtype=int)
+    correct = predicted == y
+
+    confusion = np.zeros((len(LEVELS), len(LEVELS)), dtype=int)
+    np.add.at(confusion, (y, predicted), 1)
+    return {
+        'samples': int(len(y)),
+        'accuracy': round(float(correct.mean()), 4),
+        'min_confidence': min_confidence,
+        'confident': int(confident.sum()),
+        'coverage': round(float(confident.mean()), 4),
+        'confident_accuracy': round(float(correct[confident].mean()), 4) if confident.any() else None,
+        'under_triage': int((confident & (predicted < y)).sum()),
+        'recall': {level: round(float(correct[y == index].mean()), 4)
+                   for index, level in enumerate(LEVELS) if (y == index).any()},
+        'confusion': {level: dict(zip(LEVELS, map(int, confusion[index]))) for index, level in enumerate(LEVELS)}
+    }
+
+
+# ============================================
+# Versions
+# ============================================
+
+def model_dir() -> str:
+    return settings.TRIAGE_MODEL_DIR
+
+
+def list_versions() -> List[dict]:
+    """Saved versions, oldest first, with their training metadata"""
+    directory = model_dir()
+    if not os.path.isdir(directory):
+        return []
+    active = active_version()
+    found = []
+    for name in sorted(os.listdir(directory)):
+        if name.startswith('triage-') and name.endswith('.npz'):
+            version = name[len('triage-'):-len('.npz')]
+            try:
+                meta = TriageModel.load(directory, version).meta
+            except Exception as e:
+                meta = {'version': version, 'error': str(e)}
+            found.append({**meta, 'active': version == active})
+    return found
+
+
+def active_version() -> Optional[str]:
+    try:
+        with open(os.path.join(model_dir(), ACTIVE_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def activate(version: str):
+    """Make a saved version the one analyze_vitals uses (servers pick it up within TRIAGE_MODEL_REFRESH_SECONDS)"""
+    directory = model_dir()
+    if not os.path.exists(os.path.join(directory, f"triage-{version}.npz")):
+        raise ValueError(f"No triage model version {version} in {directory}")
+    temporary = os.path.join(directory, ACTIVE_FILE + '.tmp')
+    with open(temporary, 'w') as f:
+        f.write(version)
+    os.replace(temporary, os.path.join(directory, ACTIVE_FILE))
+
+
+def activation_blockers(holdout: dict) -> List[str]:
+    """Why a version's holdout results don't qualify it to serve (empty if they do)"""
+    blockers = []
+    confident = holdout.get('confident') or 0
+    if confident < settings.TRIAGE_MODEL_MIN_CONFIDENT:
+        blockers.append(f"{confident} confident holdout answers < TRIAGE_MODEL_MIN_CONFIDENT "
+                        f"{settings.TRIAGE_MODEL_MIN_CONFIDENT}")
+    coverage = holdout.get('coverage') or 0.0
+    if coverage < settings.TRIAGE_MODEL_MIN_COVERAGE:
+        blockers.append(f"coverage {coverage} < TRIAGE_MODEL_MIN_COVERAGE {settings.TRIAGE_MODEL_MIN_COVERAGE}")
+    accuracy = holdout.get('confident_accuracy')
+    if accuracy is None or accuracy < settings.TRIAGE_MODEL_MIN_ACCURACY:
+        blockers.append(f"confident accuracy {accuracy} < TRIAGE_MODEL_MIN_ACCURACY "
+                        f"{settings.TRIAGE_MODEL_MIN_ACCURACY}")
+    under_triage = holdout.get('under_triage', 0)
+    if under_triage > settings.TRIAGE_MODEL_MAX_UNDER_TRIAGE:
+        blockers.append(f"{under_triage} under-triaged holdout answers > TRIAGE_MODEL_MAX_UNDER_TRIAGE "
+                        f"{settings.TRIAGE_MODEL_MAX_UNDER_TRIAGE}")
+    return blockers
+
+
+def train(activate_if_good: bool = False) -> dict:
+    """
+    Train a new version on all usable assessments (the newest HOLDOUT_SHARE held out for evaluation)
+    Args:
+        activate_if_good: activate it if the holdout results pass activation_blockers()
+    Returns:
+        the version's metadata (with 'activated' and 'blockers')
+    """
+    features, labels, last_id = load_examples()
+    if len(labels) < settings.TRIAGE_MODEL_MIN_SAMPLES:
+        raise ValueError(f"Only {len(labels)} usable assessments; "
+                         f"TRIAGE_MODEL_MIN_SAMPLES is {settings.TRIAGE_MODEL_MIN_SAMPLES}")
+
+    split = int(len(labels) * (1 - HOLDOUT_SHARE))
+    version = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    model = TriageModel.fit(features[:split], labels[:split], version)
+    holdout = evaluate(model, features[split:], labels[split:])
+    model.meta.update({
+        'trained_at': datetime.utcnow().isoformat(),
+        'trained_through_id': last_id,
+        'samples': len(labels),
+        'class_counts': {level: labels.count(index) for index, level in enumerate(LEVELS)},
+        'holdout': holdout
+    })
+    model.save(model_dir())
+
+    blockers = activation_blockers(holdout)
+    activated = activate_if_good and not blockers
+    if activated:
+        activate(version)
+    return {**model.meta, 'activated': activated, 'blockers': blockers}
+
+
+# ============================================
+# Serving
+# ============================================
+
+class TriageClassifier:
+    """The active version, reloaded when ACTIVE changes"""
+
+    def __init__(self):
+        """Initialize classifier (the model is loaded on first use or by load())"""
+        self._lock = threading.Lock()
+        self._model: Optional[TriageModel] = None
+        self._checked = 0.0
+        self._error: Optional[str] = None
+
+    @property
+    def enabled(self) -> bool:
+        return settings.TRIAGE_MODEL_ENABLED
+
+    def load(self) -> Optional[str]:
+        """Load the active version if it changed; returns the version in use"""
+        self._checked = time.monotonic()
+        version = active_version()
+        current = self._model.version if self._model else None
+        if version == current:
+            return current
+        try:
+            model = TriageModel.load(model_dir(), version) if version else None
+            self._error = None
+        except ImportError as e:
+            self._error = f"numpy not installed ({e})"
+            logger.warning(f"Local triage classifier unavailable: {self._error}")
+            return current
+        except Exception as e:
+            self._error = str(e)
+            logger.error(f"Loading triage model {version} failed: {e}")
+            return current
+        with self._lock:
+            self._model = model
+        return version
+
+    def answer(self, vitals: dict) -> Optional[dict]:
+        """
+        Local analysis for confident cases
+        Args:
+            vitals: dict with hr, bp, temp
+        Returns:
+            analyze_vitals-style dict (plus source, model_version, confidence), or
+            None to defer to Gemini
+        """
+        if not self.enabled:
+            return None
+        if time.monotonic() - self._checked > settings.TRIAGE_MODEL_REFRESH_SECONDS:
+            self.load()
+        model = self._model
+        if model is None:
+            return None
+        systolic, diastolic = parse_blood_pressure(vitals['bp'])
+        if systolic is None:
+            return None
+
+        level, confidence = model.predict(vitals['hr'], systolic, diastolic, vitals['temp'])
+        if confidence < settings.TRIAGE_MODEL_MIN_CONFIDENCE:
+            triage_decisions.inc('low_confidence')
+            return None
+        # Never under-call what the fixed thresholds already flag
+        if LEVELS.index(rule_based_analysis(vitals)['level']) > LEVELS.index(level):
+            triage_decisions.inc('rules_higher')
+            return None
+        triage_decisions.inc('answered')
+        return {
+            'level': level,
+            'reason': f"Local triage model ({confidence:.0%} confidence) from heart rate, blood pressure "
+                      f"and temperature.",
+            'action': ACTIONS[level],
+            'source': SOURCE,
+            'model_version': model.version,
+            'confidence': round(confidence, 3)
+        }
+
+    def stats(self) -> dict:
+        model = self._model
+        return {
+            'enabled': self.enabled,
+            'version': model.version if model else None,
+            'error': self._error,
+            'min_confidence': settings.TRIAGE_MODEL_MIN_CONFIDENCE,
+            'holdout': model.meta.get('holdout') if model else None,
+            'decisions': {outcome: int(triage_decisions.value(outcome))
+                          for outcome in ('answered', 'low_confidence', 'rules_higher')}
+        }
+
+
+# Global instance
+triage_classifier = TriageClassifier()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from database import init_db
+
+    parser = argparse.ArgumentParser(description="Train, evaluate and version the local triage classifier")
+    commands = parser.add_subparsers(dest='command', required=True)
+    train_parser = commands.add_parser('train', help="train a new version on stored assessments")
+    train_parser.add_argument('--activate', action='store_true',
+                              help="activate it if it passes the TRIAGE_MODEL_* activation thresholds on the holdout")
+    evaluate_parser = commands.add_parser('evaluate', help="score a version on assessments added since it was trained")
+    evaluate_parser.add_argument('version', nargs='?', help="defaults to the active version")
+    evaluate_parser.add_argument('--all', action='store_true', help="score on every assessment, not just newer ones")
+    commands.add_parser('list', help="saved versions")
+    activate_parser = commands.add_parser('activate', help="use this version in analyze_vitals")
+    activate_parser.add_argument('version')
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        init_db()
+        result = train(activate_if_good=args.activate)
+        print(f"🧮 Trained triage model {result['version']} on {result['samples']} assessments"
+              f"{' (activated)' if result['activated'] else ''}")
+        if args.activate and result['blockers']:
+            print("⚠️ Not activated: " + '; '.join(result['blockers']))
+        print(json.dumps(result['holdout'], indent=2))
+    elif args.command == 'evaluate':
+        init_db()
+        version = args.version or active_version()
+        if not version:
+            parser.error("no active version; pass one")
+        model = TriageModel.load(model_dir(), version)
+        features, labels, _ = load_examples(0 if args.all else model.meta.get('trained_through_id', 0))
+        print(json.dumps({'version': version, **evaluate(model, features, labels)}, indent=2))
+    elif args.command == 'list':
+        for meta in list_versions():
+            holdout = meta.get('holdout') or {}
+            print(f"{'*' if meta['active'] else ' '} {meta['version']}  samples={meta.get('samples')}  "
+                  f"coverage={holdout.get('coverage')}  confident_accuracy={holdout.get('confident_accuracy')}")
+    else:
+        activate(args.version)
+        print(f"✅ Triage model {args.version} active")
@@ -0,0 +1,279 @@
+"""
+Wound Assessment Cache - Near-duplicate lookup for assess_wound
+Descriptions are normalized to token sets and indexed with MinHash/LSH;
+a new description reuses a stored assessment when its Jaccard similarity
+to one reaches WOUND_CACHE_THRESHOLD and the clinically decisive terms
+(bleeding, depth, infection signs, size...) are the same. A negation is
+bound to the words it governs in its clause ("no pus" -> no_pus), and
+sizes become buckets (size_2to5cm), so both have to match.
+"""
+
+import logging
+import re
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+from config import settings
+from database import SessionLocal
+from metrics import cache_lookup
+from models import WoundAssessmentCache
+
+logger = logging.getLogger(__name__)
+
+STOPWORDS = {
+    'a', 'an', 'the', 'on', 'in', 'of', 'at', 'to', 'with', 'and', 'or', 'is', 'are', 'was', 'has',
+    'have', 'had', 'it', 'its', 'his', 'her', 'their', 'patient', 'pt', 'about', 'approx',
+    'approximately', 'around', 'there', 'this', 'that', 'from', 'after', 'some', 'very', 'also',
+}
+
+# Same meaning, different words
+SYNONYMS = {
+    'laceration': 'cut', 'lac': 'cut', 'gash': 'cut', 'slice': 'cut',
+    'abrasion': 'scrape', 'graze': 'scrape',
+    'bleed': 'bleeding', 'bleeds': 'bleeding', 'bled': 'bleeding', 'oozing': 'bleeding',
+    'centimeter': 'cm', 'centimeters': 'cm', 'centimetre': 'cm', 'centimetres': 'cm',
+    'millimeter': 'mm', 'millimeters': 'mm',
+    'puss': 'pus', 'purulent': 'pus',
+    'infected': 'infection',
+    'reddened': 'red', 'redness': 'red', 'erythema': 'red',
+    'swelling': 'swollen', 'edema': 'swollen',
+}
+
+# Terms that change the assessment: a cached answer is only reused when these match exactly
+RED_FLAGS = {
+    'deep', 'gaping', 'bleeding', 'bone', 'tendon', 'pus', 'infection', 'necrotic', 'black',
+    'burn', 'blister', 'bite', 'puncture', 'foreign', 'glass', 'rusty', 'fever', 'spreading',
+    'numb', 'numbness', 'arterial', 'spurting', 'face', 'eye', 'hand', 'genital', 'diabetic',
+    'large', 'small', 'superficial', 'severe', 'mild',
+}
+# Negation cues: PRE negates up to NEGATION_WINDOW words after it in the clause ("no pus or
+# swelling"), POST the word right before it ("bleeding stopped"); both emit no_<word>
+PRE_NEGATIONS = {'no', 'not', 'without', 'none', 'denies', 'stopped', 'controlled'}
+POST_NEGATIONS = {'stopped', 'controlled', 'resolved', 'absent'}
+NEGATION_WINDOW = 4
+CLAUSE_BREAK = re.compile(r'[,.;:\n]|\b(?:but|however|although)\b')
+
+# Wound size -> bucket token (largest dimension, in cm); the bucket must match for a hit
+SIZE_RE = re.compile(r'(\d+(?:\.\d+)?)(?:\s*(?:x|by)\s*(\d+(?:\.\d+)?))?\s*'
+                     r'(cm|mm|centimet(?:er|re)s?|millimet(?:er|re)s?|in|inch(?:es)?)\b')
+SIZE_BUCKETS = [(1, 'size_lt1cm'), (2, 'size_1to2cm'), (5, 'size_2to5cm'), (float('inf'), 'size_gt5cm')]
+
+# MinHash: NUM_PERM hash functions split into BANDS bands of NUM_PERM // BANDS rows
+NUM_PERM = 64
+BANDS = 16
+_PRIME = (1 << 61) - 1
+_MASK = (1 << 32) - 1
+_PERMUTATIONS = [
+    (1 + (zlib.crc32(f"a{i}".encode()) * 2654435761) % (_PRIME - 1),
+     zlib.crc32(f"b{i}".encode()) * 40503 % _PRIME)
+    for i in range(NUM_PERM)
+]
+
+_TOKEN_RE = re.compile(r"[a-z]+(?:_[a-z0-9]+)*|\d+(?:\.\d+)?")
+
+
+def _size_bucket(match: re.Match) -> str:
+    size = max(float(match.group(1)), float(match.group(2) or 0))
+    unit = match.group(3)
+    if unit.startswith('m'):
+        size /= 10
+    elif unit.startswith('in'):
+        size *= 2.54
+    return next(token for limit, token in SIZE_BUCKETS if size < limit)
+
+
+def _words(clause: str) -> List[str]:
+    """Lowercase words and numbers of one clause, synonyms mapped, stopwords dropped"""
+    words = []
+    for token in _TOKEN_RE.findall(clause):
+        token = SYNONYMS.get(token, token)
+        if token in STOPWORDS:
+            continue
+        if len(token) > 4 and token.endswith('s') and not token.endswith('ss'):
+            token = SYNONYMS.get(token[:-1], token[:-1])  # plural
+        words.append(token)
+    return words
+
+
+def normalize(description: str) -> Set[str]:
+    """Token set: words, size buckets and negated words (no_<word>), clause by clause"""
+    text = SIZE_RE.sub(lambda match: f' {_size_bucket(match)} ', description.lower())
+    tokens = set()
+    for clause in CLAUSE_BREAK.split(text):
+        words = _words(clause)
+        negated = set()
+        for index, word in enumerate(words):
+            if word in PRE_NEGATIONS:
+                negated.update(range(index + 1, index + 1 + NEGATION_WINDOW))
+            if word in POST_NEGATIONS and index > 0 and words[index - 1] not in PRE_NEGATIONS | POST_NEGATIONS:
+                negated.add(index - 1)
+        for index, word in enumerate(words):
+            if word in PRE_NEGATIONS or word in POST_NEGATIONS:
+                continue
+            tokens.add(f'no_{word}' if index in negated else word)
+    return tokens
+
+
+def decisive_terms(tokens: Set[str]) -> frozenset:
+    """Red flags, negated words and size buckets: all must match for a cached answer to be reused"""
+    return frozenset(token for token in tokens
+                     if token in RED_FLAGS or token.startswith('no_') or token.startswith('size_'))
+
+
+def minhash(tokens: Set[str]) -> List[int]:
+    """MinHash signature (stable across processes: crc32-based)"""
+    hashes = [zlib.crc32(token.encode()) for token in tokens] or [0]
+    return [min(((a * h + b) % _PRIME) & _MASK for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def band_keys(signature: List[int]) -> List[Tuple]:
+    rows = NUM_PERM // BANDS
+    return [(band,) + tuple(signature[band * rows:(band + 1) * rows]) for band in range(BANDS)]
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class WoundCache:
+    """In-memory LSH index over the wound_assessment_cache table"""
+
+    def __init__(self):
+        """Initialize cache (rows are loaded on first lookup)"""
+        self.threshold = settings.WOUND_CACHE_THRESHOLD
+        self._lock = threading.Lock()
+        self._entries: Dict[int, Tuple[Set[str], frozenset, dict]] = {}  # id -> (tokens, decisive, result)
+        self._buckets: Dict[Tuple, Set[int]] = {}
+        self._exact: Dict[frozenset, int] = {}
+        # Highest id loaded by refresh(); rows stored by this process don't move it, so
+        # lower ids other workers commit meanwhile are still picked up
+        self._last_id = 0
+        self._refreshed = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.WOUND_CACHE_ENABLED
+
+    def _index(self, entry_id: int, tokens: Set[str], signature: List[int], result: dict):
+        """Add one entry (caller holds _lock)"""
+        self._entries[entry_id] = (tokens, decisive_terms(tokens), result)
+        self._exact.setdefault(frozenset(tokens), entry_id)
+        for key in band_keys(signature):
+            self._buckets.setdefault(key, set()).add(entry_id)
+
+    def refresh(self, force: bool = False):
+        """Load rows added since the last refresh (also by other workers)"""
+        now = time.monotonic()
+        if not force and now - self._refreshed < settings.WOUND_CACHE_REFRESH_SECONDS:
+            return
+        self._refreshed = now
+
+        db = SessionLocal()
+        try:
+            rows = db.execute(
+                select(WoundAssessmentCache.id, WoundAssessmentCache.description, WoundAssessmentCache.result)
+                .where(WoundAssessmentCache.id > self._last_id)
+                .order_by(WoundAssessmentCache.id)
+            ).all()
+        except Exception as e:
+            logger.error(f"Wound cache refresh failed: {e}")
+            return
+        finally:
+            db.close()
+
+        # Tokens are recomputed from the description: rows stored under older normalize() rules
+        # (e.g. before negations were bound to their words) must not match on stale tokens
+        with self._lock:
+            for row in rows:
+                if row.id not in self._entries:
+                    tokens = normalize(row.description)
+                    self._index(row.id, tokens, minhash(tokens), row.result)
+                self._last_id = max(self._last_id, row.id)
+
+    def lookup(self, description: str) -> Optional[dict]:
+        """
+        Closest stored assessment at or above the threshold
+        Returns:
+            {'result', 'score', 'entry_id'} or None
+        """
+        self.refresh()
+        tokens = normalize(description)
+        decisive = decisive_terms(tokens)
+
+        with self._lock:
+            best_id, best_score = self._exact.get(frozenset(tokens)), 1.0
+            if best_id is None or self._entries[best_id][1] != decisive:
+                best_id, best_score = None, 0.0
+                candidates = set()
+                for key in band_keys(minhash(tokens)):
+                    candidates |= self._buckets.get(key, set())
+                for entry_id in candidates:
+                    entry_tokens, entry_decisive, _ = self._entries[entry_id]
+                    if entry_decisive != decisive:
+                        continue
+                    score = jaccard(tokens, entry_tokens)
+                    if score > best_score:
+                        best_id, best_score = entry_id, score
+
+            hit = best_id is not None and best_score >= self.threshold
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        cache_lookup('wound', hit)
+
+        if not hit:
+            return None
+        return {'result': self._entries[best_id][2], 'score': round(best_score, 3), 'entry_id': best_id}
+
+    def store(self, description: str, result: dict, model: Optional[str] = None) -> Optional[int]:
+        """Persist a fresh assessment and index it"""
+        tokens = normalize(description)
+        signature = minhash(tokens)
+        db = SessionLocal()
+        try:
+            row = WoundAssessmentCache(
+                description=description[:2000],
+                tokens=sorted(tokens),
+                signature=signature,
+                result=result,
+                model=model,
+                created_at=datetime.utcnow()
+            )
+            db.add(row)
+            db.commit()
+            entry_id = row.id
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Wound cache store failed: {e}")
+            return None
+        finally:
+            db.close()
+
+        with self._lock:
+            self._index(entry_id, tokens, signature, result)
+        return entry_id
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'threshold': self.threshold,
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+
+# Global instance
+wound_cache = WoundCache()
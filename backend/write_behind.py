@@ -0,0 +1,414 @@
+"""
+Write-Behind Log - Batched, durable appends
+Buffers rows in memory and bulk inserts them in the background,
+with an on-disk segment file so nothing is lost on a crash
+"""
+
+import glob
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from sqlalchemy.exc import ArgumentError, CompileError, DataError, IntegrityError
+
+logger = logging.getLogger(__name__)
+
+# Errors caused by the rows themselves: the batch is bisected and the bad rows
+# quarantined. Anything else (database down, lock timeout) is retried later.
+BAD_RECORD_ERRORS = (DataError, IntegrityError, CompileError, ArgumentError, TypeError, ValueError, KeyError)
+
+
+def _chunks(records: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    iterator = iter(records)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class WriteBehindLog:
+    """
+    Bounded in-memory queue flushed in batches on a size/time trigger.
+
+    Every appended record is also written to the active segment file
+    before it is queued. A flush seals the active segment, bulk inserts
+    the queued records and deletes the sealed segments only once the
+    insert has committed. Segments left behind by a crash are replayed
+    by recover() on the next start.
+
+    Memory stays bounded: once max_queue records are queued, appends go
+    to a spill segment only, and a batch whose insert fails is dropped
+    from memory and retried from its segments (the backlog). Rows that
+    make an insert fail on their own are bisected out of the batch and
+    written to {name}-quarantine.jsonl instead of blocking later flushes.
+    append() never flushes on the caller's thread; an explicit flush()
+    (read-your-writes endpoints) blocks on the insert, so call it off the
+    event loop (plain def endpoints run in FastAPI's threadpool).
+    """
+
+    def __init__(self, name: str, flush_fn: Callable[[List[dict]], None],
+                 segment_dir: str, batch_size: int = 200,
+                 flush_interval: float = 1.0, max_queue: int = 5000,
+                 fsync: bool = False, datetime_fields: tuple = ()):
+        """
+        Args:
+            name: log name (used for segment file names and messages)
+            flush_fn: bulk insert callable, receives a list of record dicts
+            segment_dir: directory for durable segment files
+            batch_size: queue depth that triggers a background flush
+            flush_interval: max seconds a record waits before being flushed
+            max_queue: queue depth past which append() spills to disk only
+            fsync: fsync the segment after every append (survives power loss)
+            datetime_fields: record fields restored to datetime on replay
+        """
+        self.name = name
+        self.flush_fn = flush_fn
+        self.segment_dir = segment_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.fsync = fsync
+        self.datetime_fields = datetime_fields
+
+        self._lock = threading.Lock()        # guards queue + active segment
+        self._flush_lock = threading.Lock()  # one flusher at a time
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+        self._queue: List[dict] = []
+        self._segment = None
+        self._segment_path = None
+        self._sealed: List[str] = []  # segments whose records are queued or in flight
+        self._spill = None
+        self._spill_path = None
+        self._backlog: List[str] = []  # segments whose records are only on disk, oldest first
+
+        # Metrics
+        self._enqueued = 0
+        self._written = 0
+        self._flushes = 0
+        self._failed_flushes = 0
+        self._spilled = 0
+        self._quarantined = 0
+        self._max_depth = 0
+        self._last_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    # ----------------------------------------
+    # Lifecycle
+    # ----------------------------------------
+
+    def start(self):
+        """Replay leftover segments and start the background flusher"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        os.makedirs(self.segment_dir, exist_ok=True)
+        self.recover()
+
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name=f"{self.name}-writer", daemon=True)
+        self._thread.start()
+        print(f"✅ {self.name} write-behind log started")
+
+    def stop(self):
+        """Stop the background flusher and flush everything still queued"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=max(self.flush_interval * 5, 5))
+            self._thread = None
+
+        # Anything that still fails here stays in its segment for recover()
+        self.flush()
+        print(f"👋 {self.name} write-behind log stopped")
+
+    def _run(self):
+        """Background loop: flush on size trigger or every flush_interval"""
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._queue or self._backlog or self._spill is not None:
+                self.flush()
+
+    # ----------------------------------------
+    # Append / Flush
+    # ----------------------------------------
+
+    def append(self, **record):
+        """
+        Queue a record for insertion
+        Args:
+            **record: column values for one row
+        """
+        with self._lock:
+            self._enqueued += 1
+            if len(self._queue) >= self.max_queue:
+                # Writer can't keep up: disk only, the flusher replays it later
+                self._spill_record(record)
+                self._spilled += 1
+                depth = len(self._queue)
+            else:
+                self._write_segment(record)
+                self._queue.append(record)
+                depth = len(self._queue)
+                if depth > self._max_depth:
+                    self._max_depth = depth
+
+        if depth >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """
+        Bulk insert everything queued so far, then the on-disk backlog
+        Returns:
+            number of records written
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch = self._queue
+                self._queue = []
+                self._close_segment()
+                sealed = self._sealed
+                self._sealed = []
+
+            written = self._written
+            if batch:
+                started = time.perf_counter()
+                left = self._insert(batch)
+                if left:
+                    # Retried from disk, so a database outage can't grow the queue
+                    self._failed_flushes += 1
+                    if len(left) == len(batch):
+                        self._backlog.extend(sealed)
+                    else:
+                        self._backlog.append(self._write_backlog(left))
+                        self._remove_segments(sealed)
+                    return self._written - written
+
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                self._flushes += 1
+                self._last_flush_ms = elapsed_ms
+                self._total_flush_ms += elapsed_ms
+            self._remove_segments(sealed)
+
+            self._drain_backlog()
+            return self._written - written
+
+    def _insert(self, records: List[dict]) -> List[dict]:
+        """
+        Insert records, bisecting around rows that fail on their own
+        Returns:
+            records left unwritten by a transient failure (retry later)
+        """
+        try:
+            self.flush_fn(records)
+        except BAD_RECORD_ERRORS as e:
+            if len(records) == 1:
+                self._quarantine(records[0], e)
+                return []
+            middle = len(records) // 2
+            left = self._insert(records[:middle])
+            if left:
+                return left + records[middle:]
+            return self._insert(records[middle:])
+        except Exception as e:
+            logger.error(f"{self.name} insert of {len(records)} records failed: {e}")
+            return records
+        self._written += len(records)
+        return []
+
+    def _drain_backlog(self):
+        """Replay backlog segments (spilled or failed batches) in batch_size chunks (caller holds _flush_lock)"""
+        with self._lock:
+            self._close_spill()
+        while self._backlog:
+            path = self._backlog[0]
+            records = self._read_segment(path)
+            for chunk in _chunks(records, self.batch_size):
+                left = self._insert(chunk)
+                if left:
+                    # Keep only what's unwritten, so a retry doesn't insert rows twice
+                    self._backlog[0] = self._write_backlog(itertools.chain(left, records))
+                    self._remove_segments([path])
+                    self._failed_flushes += 1
+                    return
+            self._remove_segments([path])
+            self._backlog.pop(0)
+
+    def recover(self) -> int:
+        """
+        Replay segment files left behind by a previous process
+        Returns:
+            number of records recovered
+        """
+        pattern = os.path.join(self.segment_dir, f"{self.name}-*.seg")
+        with self._flush_lock:
+            written = self._written
+            mine = set(self._backlog) | set(self._sealed) | {self._segment_path, self._spill_path}
+            for path in sorted(glob.glob(pattern)):
+                if path in mine or self._owner_alive(path):
+                    # Ours, or another worker sharing the directory is still writing it
+                    continue
+                # Renaming claims the file: only one starting worker replays it
+                claimed = self._new_segment_path('recovered')
+                try:
+                    os.rename(path, claimed)
+                except FileNotFoundError:
+                    continue
+                self._backlog.append(claimed)
+            self._drain_backlog()
+            recovered = self._written - written
+
+        if recovered:
+            print(f"♻️ Recovered {recovered} {self.name} records from segment files")
+        return recovered
+
+    # ----------------------------------------
+    # Segment files
+    # ----------------------------------------
+
+    def _new_segment_path(self, kind: str = '') -> str:
+        """Segment file name: {name}-{pid}-{timestamp}-{random}[-kind].seg"""
+        os.makedirs(self.segment_dir, exist_ok=True)
+        stamp = datetime.utcnow().strftime('%Y%m%d%H%M%S%f')
+        suffix = f"-{kind}" if kind else ''
+        return os.path.join(
+            self.segment_dir, f"{self.name}-{os.getpid()}-{stamp}-{uuid.uuid4().hex[:8]}{suffix}.seg"
+        )
+
+    def _write_line(self, f, record: dict):
+        f.write(json.dumps(record, default=self._encode) + '\n')
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+    def _write_segment(self, record: dict):
+        """Append one record to the active segment (caller holds _lock)"""
+        if self._segment is None:
+            self._segment_path = self._new_segment_path()
+            self._segment = open(self._segment_path, 'a', encoding='utf-8')
+        self._write_line(self._segment, record)
+
+    def _spill_record(self, record: dict):
+        """Append one record that isn't queued in memory (caller holds _lock)"""
+        if self._spill is None:
+            self._spill_path = self._new_segment_path('spill')
+            self._spill = open(self._spill_path, 'a', encoding='utf-8')
+        self._write_line(self._spill, record)
+
+    def _close_spill(self):
+        """Seal the spill segment into the backlog (caller holds _lock)"""
+        if self._spill is not None:
+            self._spill.close()
+            self._backlog.append(self._spill_path)
+            self._spill = None
+            self._spill_path = None
+
+    def _write_backlog(self, records: Iterable[dict]) -> str:
+        """Write records to a new backlog segment; returns its path"""
+        path = self._new_segment_path('retry')
+        with open(path, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, default=self._encode) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        return path
+
+    def _read_segment(self, path: str) -> Iterator[dict]:
+        """Records of a segment file, read lazily"""
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield self._decode(json.loads(line))
+                except ValueError:
+                    # Torn write at crash time - only the last line can be partial
+                    logger.warning(f"Skipping corrupt line in {path}")
+
+    def _quarantine(self, record: dict, error: Exception):
+        """Set aside a record the database rejects, so it stops blocking the log"""
+        self._quarantined += 1
+        logger.error(f"{self.name} record quarantined: {error}")
+        os.makedirs(self.segment_dir, exist_ok=True)
+        path = os.path.join(self.segment_dir, f"{self.name}-quarantine.jsonl")
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'error': str(error), 'record': record}, default=self._encode) + '\n')
+
+    def _close_segment(self):
+        """Seal the active segment (caller holds _lock)"""
+        if self._segment is not None:
+            self._segment.close()
+            self._sealed.append(self._segment_path)
+            self._segment = None
+            self._segment_path = None
+
+    def _owner_alive(self, path: str) -> bool:
+        """Check whether the process that wrote a segment is still running"""
+        try:
+            pid = int(os.path.basename(path)[len(self.name) + 1:].split('-', 1)[0])
+        except ValueError:
+            return False
+        if pid == os.getpid():
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def _remove_segments(self, paths: List[str]):
+        """Delete sealed segments whose records are committed"""
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _encode(value):
+        """JSON fallback for segment records"""
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return str(value)
+
+    def _decode(self, record: dict) -> dict:
+        """Restore datetime fields of a replayed record"""
+        for field in self.datetime_fields:
+            if isinstance(record.get(field), str):
+                record[field] = datetime.fromisoformat(record[field])
+        return record
+
+    # ----------------------------------------
+    # Metrics
+    # ----------------------------------------
+
+    def stats(self) -> dict:
+        """Queue depth and flush latency metrics"""
+        return {
+            'running': bool(self._thread and self._thread.is_alive()),
+            'queue_depth': len(self._queue),
+            'max_queue_depth': self._max_depth,
+            'enqueued': self._enqueued,
+            'written': self._written,
+            'flushes': self._flushes,
+            'failed_flushes': self._failed_flushes,
+            'spilled': self._spilled,
+            'quarantined': self._quarantined,
+            'last_flush_ms': round(self._last_flush_ms, 2),
+            'avg_flush_ms': round(self._total_flush_ms / self._flushes, 2) if self._flushes else 0.0,
+            'pending_segments': len(self._sealed) + (1 if self._segment else 0),
+            'backlog_segments': len(self._backlog) + (1 if self._spill else 0)
+        }